@@ -2,11 +2,11 @@ import streamlit as st
 import os
 import sys
 from qdrant_client import QdrantClient
-from langchain_openai import OpenAIEmbeddings
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
-from pipeline.config import QDRANT_URL
-from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME
+from pipeline.config import QDRANT_URL, SOURCES
+from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME, LEGISLATION_PROFILE, payload_filter
+from pipeline.vector.embeddings import get_embedding_service
 
 st.set_page_config(page_title="Search - Housing Monitor", page_icon="🔍", layout="wide")
 
@@ -14,19 +14,32 @@ st.title("🔍 Semantic Search")
 
 query = st.text_input("Search legislation (e.g., 'rent caps in LA')")
 
+col1, col2 = st.columns(2)
+with col1:
+    county = st.selectbox("County", ["All"] + sorted({s["county"] for s in SOURCES}))
+with col2:
+    source_type = st.selectbox("Source type", ["All"] + sorted({s["source_type"] for s in SOURCES}))
+
 if query:
     try:
         client = QdrantClient(url=QDRANT_URL)
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        embeddings = get_embedding_service()
         vector = embeddings.embed_query(query)
         
-        # client.search is deprecated/missing in newer versions, use query_points
-        results = client.query_points(
+        # Points are document chunks: return the best chunk of each of the top 5 items
+        results = client.query_points_groups(
             collection_name=LEGISLATION_COLLECTION_NAME,
             query=vector,
+            query_filter=payload_filter(
+                county=None if county == "All" else county,
+                source_type=None if source_type == "All" else source_type
+            ),
+            search_params=LEGISLATION_PROFILE.search_params(),
+            group_by="item_id",
+            group_size=1,
             limit=5
         )
-        hits = results.points
+        hits = [group.hits[0] for group in results.groups]
         
         st.subheader(f"Top {len(hits)} Results")
         
@@ -36,6 +49,8 @@ if query:
                 st.markdown(f"**Score:** {hit.score:.2f}")
                 st.markdown(f"**Title:** {payload.get('title')}")
                 st.markdown(f"**County:** {payload.get('county')}")
+                if payload.get('heading'):
+                    st.markdown(f"**Section:** {payload.get('heading')}")
                 st.markdown(f"[Link]({payload.get('url')})")
                 
     except Exception as e:
@@ -7,6 +7,7 @@ import altair as alt
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
 from pipeline.config import SQLITE_PATH
+from pipeline.db.crud import TRENDS_SQL
 
 st.set_page_config(page_title="Trends - Housing Monitor", page_icon="📈", layout="wide")
 
@@ -15,12 +16,7 @@ st.title("📈 Trends Analysis")
 def load_data():
     conn = sqlite3.connect(SQLITE_PATH)
     try:
-        query = """
-            SELECT r.county, i.processed_at, i.is_relevant 
-            FROM items i
-            JOIN raw_documents r ON i.raw_document_id = r.id
-        """
-        df = pd.read_sql_query(query, conn)
+        df = pd.read_sql_query(TRENDS_SQL, conn)
         df['processed_at'] = pd.to_datetime(df['processed_at'])
         return df
     finally:
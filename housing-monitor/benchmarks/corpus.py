@@ -0,0 +1,207 @@
+"""
+Synthetic agenda- and news-like corpus for the offline benchmarks.
+
+Documents are generated lazily and deterministically from (seed, index), so a 100k-document
+corpus costs nothing until a page is "scraped" and every run sees the same text.
+Each document has a kind:
+  housing     - rent/eviction/tenant ordinance items (relevant)
+  borderline  - housing programs without a regulatory change (the cascade escalates them)
+  other       - parks, roads, budgets (the prefilter rejects them)
+and is either an original, an exact duplicate of an earlier original (same text, other URL)
+or a near-duplicate (a few words and the date changed).
+"""
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+CITIES = [
+    "Alameda", "Albany", "Alhambra", "Anaheim", "Bakersfield", "Berkeley", "Burbank", "Carlsbad",
+    "Chico", "Concord", "Daly City", "Davis", "Downey", "El Cajon", "Escondido", "Fremont", "Fresno",
+    "Fullerton", "Glendale", "Hayward", "Inglewood", "Irvine", "Long Beach", "Modesto", "Oakland",
+    "Ontario", "Oxnard", "Pasadena", "Pomona", "Redding", "Richmond", "Riverside", "Sacramento",
+    "Salinas", "San Jose", "San Mateo", "Santa Ana", "Santa Rosa", "Stockton", "Torrance", "Vallejo",
+]
+
+HOUSING_TOPICS = [
+    ("Rent Stabilization Ordinance Amendment",
+     "amend the rent stabilization ordinance to cap annual rent increases at {pct}% for covered rental units"),
+    ("Just Cause Eviction Protections",
+     "adopt just cause eviction protections requiring landlords to state a lawful reason before terminating a tenancy"),
+    ("Tenant Relocation Assistance",
+     "require landlords to pay tenant relocation assistance of {months} months of rent after a no-fault eviction"),
+    ("Security Deposit Limits",
+     "limit the security deposits landlords may collect to {months} month of rent and require itemized deductions within 21 days"),
+    ("Rental Registry Program",
+     "create a rental registry requiring landlords to register units and report rent increases annually"),
+    ("Tenant Anti-Harassment Ordinance",
+     "prohibit landlord harassment of tenants and authorize civil penalties for violations of tenant protections"),
+    ("Source of Income Discrimination",
+     "extend fair housing protections to prohibit source of income discrimination against voucher holders"),
+]
+
+BORDERLINE_TOPICS = [
+    ("Affordable Housing Fund Allocation",
+     "allocate ${amount} million from the affordable housing fund to a nonprofit developer"),
+    ("Homeless Services Contract",
+     "approve a contract for homeless outreach services and shelter beds at the navigation center"),
+    ("Housing Element Progress Report",
+     "receive the annual housing element progress report on permits issued for new homes"),
+]
+
+OTHER_TOPICS = [
+    ("Park Improvement Project", "award a construction contract for playground and trail improvements at {place} Park"),
+    ("Street Resurfacing Program", "approve the pavement resurfacing program for {count} arterial streets"),
+    ("Library Hours Extension", "extend weekend hours at the {place} branch library"),
+    ("Fiscal Year Budget Amendment", "amend the fiscal year budget to reflect ${amount} million in sales tax revenue"),
+    ("Water Main Replacement", "replace {count} miles of aging water mains in the {place} district"),
+    ("Police Equipment Purchase", "authorize the purchase of {count} patrol vehicles"),
+    ("Recreation Center Fees", "update the fee schedule for recreation center rentals and youth sports leagues"),
+]
+
+FILLER = [
+    "Staff recommends that the Council {verb} the item as presented.",
+    "The item was continued from the meeting of {date} to allow additional public comment.",
+    "Members of the public may submit written comments before {time} on the day of the meeting.",
+    "The fiscal impact is estimated at ${amount} million over {count} years.",
+    "The {place} Commission reviewed the proposal and voted {votes} to forward it to the Council.",
+    "Staff held {count} community meetings and received feedback from residents and business owners.",
+    "Adoption of this item is exempt from CEQA under the common sense exemption.",
+    "The report includes background, analysis, alternatives and a recommended course of action.",
+    "Councilmember {name} requested that staff return with an implementation timeline.",
+    "The {place} neighborhood association submitted a letter in support of the recommendation.",
+]
+
+PLACES = ["Riverside", "Oak Grove", "Central", "Lakeview", "Mission", "Harbor", "Sunset", "Hillcrest",
+          "Civic Center", "Northgate", "Westside", "Eastmont"]
+NAMES = ["Garcia", "Nguyen", "Smith", "Patel", "Kim", "Lopez", "Chen", "Johnson", "Rivera", "Singh"]
+VERBS = ["approve", "adopt", "receive and file", "introduce", "authorize", "direct staff on"]
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    size: int
+    seed: int = 42
+    housing_rate: float = 0.3
+    borderline_rate: float = 0.1
+    duplicate_rate: float = 0.05
+    near_duplicate_rate: float = 0.05
+    # Share of multi-item agendas (longer, chunked documents) vs. single-topic news posts
+    agenda_rate: float = 0.5
+
+class Corpus:
+    """
+    Deterministic synthetic corpus: `sources()` for the collector, `page(url)` for the scraper
+    and `truth()` for comparing dedupe results with the planted duplicates.
+    """
+    def __init__(self, spec: CorpusSpec):
+        self.spec = spec
+
+    def _rng(self, index: int, salt: str = "") -> random.Random:
+        return random.Random(f"{self.spec.seed}:{index}:{salt}")
+
+    def url(self, index: int) -> str:
+        city = self.city(index)
+        return f"https://{city.lower().replace(' ', '')}.example.gov/{'agendas' if self.is_agenda(index) else 'news'}/{index}"
+
+    def city(self, index: int) -> str:
+        # Copies are reposts by the same city
+        return CITIES[self._rng(self.original(index), "city").randrange(len(CITIES))]
+
+    def is_agenda(self, index: int) -> bool:
+        return self._rng(self.original(index), "layout").random() < self.spec.agenda_rate
+
+    def copy_kind(self, index: int) -> str:
+        """'original', 'duplicate' or 'near_duplicate'."""
+        if index == 0:
+            return "original"
+        roll = self._rng(index, "copy").random()
+        if roll < self.spec.duplicate_rate:
+            return "duplicate"
+        if roll < self.spec.duplicate_rate + self.spec.near_duplicate_rate:
+            return "near_duplicate"
+        return "original"
+
+    def original(self, index: int) -> int:
+        """Index of the original a copy was made from (the document itself for originals)."""
+        while self.copy_kind(index) != "original":
+            index = self._rng(index, "source").randrange(index)
+        return index
+
+    def kind(self, index: int) -> str:
+        roll = self._rng(self.original(index), "kind").random()
+        if roll < self.spec.housing_rate:
+            return "housing"
+        if roll < self.spec.housing_rate + self.spec.borderline_rate:
+            return "borderline"
+        return "other"
+
+    def _fill(self, template: str, rng: random.Random) -> str:
+        return template.format(
+            pct=rng.choice([3, 4, 5, 7]), months=rng.choice([1, 2, 3]), amount=rng.randint(1, 40),
+            count=rng.randint(2, 30), place=rng.choice(PLACES), name=rng.choice(NAMES),
+            verb=rng.choice(VERBS), votes=f"{rng.randint(4, 7)}-{rng.randint(0, 2)}",
+            date=f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            time=f"{rng.randint(1, 5)}:00 p.m.",
+        )
+
+    def _section(self, rng: random.Random, title: str, action: str, number: int) -> str:
+        sentences = [f"Recommendation to {self._fill(action, rng)}."]
+        sentences += [self._fill(rng.choice(FILLER), rng) for _ in range(rng.randint(3, 8))]
+        return f"## Item {number}: {title}\n\n" + " ".join(sentences)
+
+    def _topics(self, rng: random.Random, kind: str) -> List[tuple]:
+        pool = {"housing": HOUSING_TOPICS, "borderline": BORDERLINE_TOPICS, "other": OTHER_TOPICS}[kind]
+        return [rng.choice(pool)]
+
+    def _original_page(self, index: int) -> Dict[str, str]:
+        rng = self._rng(index, "text")
+        kind = self.kind(index)
+        city = self.city(index)
+        date = f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        main = self._topics(rng, kind)
+        if self.is_agenda(index):
+            # The item that decides relevance sits among unrelated business
+            items = [rng.choice(OTHER_TOPICS) for _ in range(rng.randint(2, 7))]
+            items.insert(rng.randrange(len(items) + 1), main[0])
+            title = f"{city} City Council Regular Meeting Agenda - {date}"
+            body = "\n\n".join(self._section(rng, t, a, n + 1) for n, (t, a) in enumerate(items))
+            markdown = f"# {title}\n\nMeeting date: {date}\n\n{body}"
+        else:
+            topic_title, action = main[0]
+            title = f"{city} Council to Consider {topic_title}"
+            paragraphs = [f"The {city} City Council will consider a proposal to {self._fill(action, rng)}."]
+            paragraphs += [" ".join(self._fill(rng.choice(FILLER), rng) for _ in range(rng.randint(2, 4)))
+                           for _ in range(rng.randint(1, 3))]
+            markdown = f"# {title}\n\nPosted {date}\n\n" + "\n\n".join(paragraphs)
+        return {"title": title, "markdown": markdown}
+
+    def page(self, index: int) -> Dict[str, str]:
+        source = self.original(index)
+        page = self._original_page(source)
+        if self.copy_kind(index) == "near_duplicate":
+            # Reposted with a new date and a handful of edited words: same SimHash neighbourhood
+            rng = self._rng(index, "edit")
+            words = page["markdown"].split(" ")
+            for _ in range(max(1, len(words) // 60)):
+                position = rng.randrange(len(words))
+                words[position] = rng.choice(PLACES)
+            page = {"title": page["title"],
+                    "markdown": " ".join(words) + f"\n\nUpdated 2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}."}
+        return page
+
+    def sources(self) -> List[Dict[str, str]]:
+        return [{"county": self.city(i), "source_type": "agenda" if self.is_agenda(i) else "news",
+                 "url": self.url(i)} for i in range(self.spec.size)]
+
+    def index_of(self, url: str) -> Optional[int]:
+        try:
+            return int(url.rstrip("/").rsplit("/", 1)[1])
+        except (IndexError, ValueError):
+            return None
+
+    def truth(self) -> Dict[str, int]:
+        """Planted counts: documents per kind and per copy kind."""
+        counts: Dict[str, int] = {}
+        for i in range(self.spec.size):
+            for key in (self.kind(i), self.copy_kind(i)):
+                counts[key] = counts.get(key, 0) + 1
+        return counts
@@ -0,0 +1,270 @@
+"""
+Offline pipeline benchmark: runs run_pipeline over a synthetic corpus with stubbed LLM,
+embedding, Firecrawl and Qdrant backends and reports docs/sec, per-stage latency
+(stage_metrics) and peak RSS per corpus size. Each size runs in a fresh process with its
+own temporary databases. Results are written as JSON; --compare checks them against an
+earlier file and exits non-zero on a throughput regression.
+
+    python benchmarks/run.py --sizes 1000 10000 100000
+    python benchmarks/run.py --sizes 1000 --compare benchmarks/results/<earlier>.json
+
+Stub latencies dominate: at the defaults a run handles roughly 25-30 docs/s with 4 workers,
+so 100k documents take about an hour; lower --llm-latency-ms to measure pipeline overhead.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(PROJECT_DIR)
+from benchmarks.corpus import Corpus, CorpusSpec
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+def _bench_env(tmp_dir: str, args: argparse.Namespace) -> Dict[str, str]:
+    """
+    Environment of a benchmark process: throwaway databases, no rate limits or politeness
+    delays (the stubs simulate latency instead) and no exports or tracing services.
+    """
+    return {
+        "SQLITE_PATH": os.path.join(tmp_dir, "app.db"),
+        "EMBEDDING_CACHE_PATH": os.path.join(tmp_dir, "embedding_cache.db"),
+        "LLM_CACHE_PATH": os.path.join(tmp_dir, "llm_cache.db"),
+        "BATCH_API_DIR": os.path.join(tmp_dir, "batch_jobs"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "sk-benchmark",
+        "OPENAI_RPM": "0", "OPENAI_TPM": "0", "OPENAI_EMBEDDING_RPM": "0", "OPENAI_EMBEDDING_TPM": "0",
+        "COLLECT_HOST_DELAY": "0",
+        "COLLECT_MAX_WORKERS": str(args.collect_workers),
+        "PIPELINE_WORKERS": str(args.workers),
+        "EMBEDDING_DIM": str(args.dim),
+        "METRICS_EXPORT_PATH": "",
+        "LANGSMITH_TRACING": "false",
+    }
+
+def _load_kb(client, embeddings, kb_dir: str) -> int:
+    """KB collection from the kb/*.md paragraphs, embedded with the stub."""
+    from qdrant_client.http.models import PointStruct
+    from pipeline.vector.collections import KB_COLLECTION_NAME
+    paragraphs = []
+    for name in sorted(os.listdir(kb_dir)):
+        if name.endswith(".md"):
+            with open(os.path.join(kb_dir, name)) as f:
+                paragraphs += [(name, p.strip()) for p in f.read().split("\n\n") if len(p.strip()) > 40]
+    vectors = embeddings.embed_documents([text for _, text in paragraphs])
+    client.upsert(collection_name=KB_COLLECTION_NAME, points=[
+        PointStruct(id=i, vector=vector, payload={"page_content": text, "metadata": {"source": source}})
+        for i, ((source, text), vector) in enumerate(zip(paragraphs, vectors))
+    ])
+    return len(paragraphs)
+
+def install_stubs(corpus: Corpus, args: argparse.Namespace):
+    """
+    Points the pipeline's module-level clients at the stubs. Must run in the benchmark process
+    after the environment is set, before run_pipeline.
+    """
+    from benchmarks.stubs import StubChatModel, StubEmbeddings, CorpusFirecrawl, LockedQdrant
+    from pipeline.config import RELEVANCE_SMALL_MODEL, RELEVANCE_LARGE_MODEL, KB_DIR
+    from pipeline.vector.collections import (KB_COLLECTION_NAME, LEGISLATION_COLLECTION_NAME, KB_PROFILE,
+                                             LEGISLATION_PROFILE, LEGISLATION_PAYLOAD_INDEXES)
+    from pipeline.vector.embeddings import get_embedding_service
+    import pipeline.collector.collect as collect
+    import pipeline.graph as graph
+
+    collect.SOURCES = corpus.sources()
+    collect.FirecrawlClient = lambda mock=False: CorpusFirecrawl(corpus, args.scrape_latency_ms)
+
+    graph.relevance_agent.llm_small = StubChatModel(model_name=RELEVANCE_SMALL_MODEL, latency_ms=args.llm_latency_ms)
+    graph.relevance_agent.llm = StubChatModel(model_name=RELEVANCE_LARGE_MODEL, latency_ms=args.llm_latency_ms,
+                                              large=True)
+    graph.summarize_agent.llm = StubChatModel(model_name=graph.summarize_agent.llm.model_name,
+                                              latency_ms=args.llm_latency_ms, large=True)
+    embeddings = StubEmbeddings(args.dim, args.embed_latency_ms)
+    # Behind the real EmbeddingService, so its caches are part of the measurement
+    get_embedding_service().client = embeddings
+
+    qdrant = LockedQdrant()
+    qdrant.create_collection(collection_name=KB_COLLECTION_NAME, **KB_PROFILE.create_kwargs(args.dim))
+    qdrant.create_collection(collection_name=LEGISLATION_COLLECTION_NAME,
+                             **LEGISLATION_PROFILE.create_kwargs(args.dim))
+    for field_name, field_schema in LEGISLATION_PAYLOAD_INDEXES.items():
+        qdrant.create_payload_index(collection_name=LEGISLATION_COLLECTION_NAME, field_name=field_name,
+                                    field_schema=field_schema)
+    _load_kb(qdrant, embeddings, KB_DIR)
+    retriever = graph.relevance_agent.retriever
+    graph.dedupe_agent.client = qdrant
+    graph.persist_buffer.client = qdrant
+    retriever.client = qdrant
+    if retriever.index is not None:
+        retriever.index.client = qdrant
+
+def _rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def measure(size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Runs the pipeline once over `size` documents in this process and returns its figures."""
+    corpus = Corpus(CorpusSpec(size=size, seed=args.seed, duplicate_rate=args.duplicate_rate,
+                               near_duplicate_rate=args.near_duplicate_rate))
+    install_stubs(corpus, args)
+    from pipeline.run_daily import run_pipeline
+    import pipeline.db.crud as crud
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    run_pipeline(mock=True, workers=args.workers, use_async=args.use_async)
+    elapsed = time.perf_counter() - start
+
+    run_id = crud.get_latest_run_id()
+    run = dict(crud.get_connection().execute(crud.SELECT_RUN_SQL, (run_id,)).fetchone())
+    dedupe = {row[0]: row[1] for row in crud.get_connection().execute(
+        "SELECT COALESCE(substr(dedup_reason, 1, instr(dedup_reason || ' ', ' ') - 1), 'new'), COUNT(*) "
+        "FROM items WHERE is_relevant = 1 GROUP BY 1")}
+    llm = crud.get_run_llm_summary(run_id)
+    return {
+        "docs": size,
+        "elapsed_s": round(elapsed, 2),
+        "docs_per_sec": round(size / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": _rss_mb(),
+        "rss_before_run_mb": rss_before,
+        "items": {key: run.get(key) for key in ("items_processed", "items_relevant", "items_new")},
+        "planted": corpus.truth(),
+        "dedupe_reasons": dedupe,
+        "llm_calls": {stage: totals["calls"] for stage, totals in llm.items()},
+        "stages": crud.get_run_stage_summary(run_id),
+    }
+
+def run_child(args: argparse.Namespace):
+    # Runs in the per-size process: configure, measure, hand the figures back as JSON
+    tmp_dir = tempfile.mkdtemp(prefix="housing-bench-")
+    try:
+        os.environ.update(_bench_env(tmp_dir, args))
+        result = measure(args.child_size, args)
+        with open(args.child_output, "w") as f:
+            json.dump(result, f)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def _child_command(size: int, output: str, args: argparse.Namespace) -> List[str]:
+    command = [sys.executable, os.path.abspath(__file__), "--child-size", str(size), "--child-output", output,
+               "--seed", str(args.seed), "--workers", str(args.workers),
+               "--collect-workers", str(args.collect_workers), "--dim", str(args.dim),
+               "--llm-latency-ms", str(args.llm_latency_ms), "--embed-latency-ms", str(args.embed_latency_ms),
+               "--scrape-latency-ms", str(args.scrape_latency_ms),
+               "--duplicate-rate", str(args.duplicate_rate), "--near-duplicate-rate", str(args.near_duplicate_rate)]
+    if args.use_async:
+        command.append("--async")
+    return command
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_result(result: Dict[str, Any]):
+    print(f"{result['docs']:>7} docs: {result['elapsed_s']:>8.1f}s, {result['docs_per_sec']:>8.1f} docs/s, "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB, items {result['items']}")
+    for stage, stats in sorted(result["stages"].items()):
+        wall = stats["wall_ms"]
+        print(f"          {stage:<14} n={stats['count']:<7} wall p50/p95/max "
+              f"{wall['p50']}/{wall['p95']}/{wall['max']} ms, queue wait p95 {stats['queue_wait_ms']['p95']} ms")
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> bool:
+    """
+    Prints docs/sec, peak RSS and stage p95 changes per size; True if any size lost more
+    than `threshold` of its throughput.
+    """
+    regressed = False
+    for size, result in current["results"].items():
+        before = baseline.get("results", {}).get(size)
+        if before is None:
+            print(f"{size} docs: not in baseline")
+            continue
+        change = result["docs_per_sec"] / before["docs_per_sec"] - 1 if before["docs_per_sec"] else 0.0
+        flag = "REGRESSION" if change < -threshold else "ok"
+        regressed = regressed or change < -threshold
+        print(f"{size} docs: {before['docs_per_sec']} -> {result['docs_per_sec']} docs/s ({change:+.1%}) {flag}, "
+              f"peak RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        for stage, stats in sorted(result["stages"].items()):
+            old = before.get("stages", {}).get(stage)
+            if old:
+                print(f"    {stage:<14} wall p95 {old['wall_ms']['p95']} -> {stats['wall_ms']['p95']} ms")
+    return regressed
+
+def main(args: argparse.Namespace) -> int:
+    config = {key: getattr(args, key) for key in ("seed", "workers", "collect_workers", "dim", "llm_latency_ms",
+                                                  "embed_latency_ms", "scrape_latency_ms", "duplicate_rate",
+                                                  "near_duplicate_rate", "use_async")}
+    report = {"created_at": datetime.now(timezone.utc).isoformat(), "git_commit": _git_commit(),
+              "python": platform.python_version(), "platform": platform.platform(), "config": config,
+              "results": {}}
+    for size in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            output = f.name
+        try:
+            # Fresh process per size: clean module state, databases and peak RSS
+            completed = subprocess.run(_child_command(size, output, args), cwd=PROJECT_DIR,
+                                       stdout=None if args.verbose else subprocess.DEVNULL,
+                                       stderr=None if args.verbose else subprocess.DEVNULL)
+            if completed.returncode != 0:
+                print(f"{size} docs: benchmark process failed (exit {completed.returncode}); rerun with --verbose")
+                return 2
+            with open(output) as f:
+                result = json.load(f)
+        finally:
+            os.remove(output)
+        report["results"][str(size)] = result
+        print_result(result)
+
+    path = args.output or os.path.join(
+        RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%dT%H%M%S')}-{report['git_commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark of run_pipeline with stubbed services")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Corpus sizes to run")
+    parser.add_argument("--seed", type=int, default=42, help="Corpus seed (same seed, same documents)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent graph workers (PIPELINE_WORKERS)")
+    parser.add_argument("--collect-workers", type=int, default=8, help="Concurrent scrapes (COLLECT_MAX_WORKERS)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the graph with abatch")
+    parser.add_argument("--dim", type=int, default=256, help="Stub embedding dimension")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Mean simulated chat completion latency")
+    parser.add_argument("--embed-latency-ms", type=float, default=10.0, help="Mean simulated embedding request latency")
+    parser.add_argument("--scrape-latency-ms", type=float, default=0.0, help="Mean simulated scrape latency")
+    parser.add_argument("--duplicate-rate", type=float, default=0.05, help="Share of exact duplicates (other URL)")
+    parser.add_argument("--near-duplicate-rate", type=float, default=0.05, help="Share of lightly edited reposts")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/bench-<time>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare docs/sec and stage p95 against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Throughput drop (fraction) that counts as a regression with --compare")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline logs of each run")
+    parser.add_argument("--child-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_size is not None:
+        run_child(args)
+    else:
+        sys.exit(main(args))
@@ -0,0 +1,149 @@
+"""
+Deterministic offline stand-ins for the pipeline's external services: chat models, the
+embeddings API, Firecrawl and the Qdrant server. Every answer depends only on the request,
+and latency is simulated with a sleep so throughput numbers stay comparable across runs.
+"""
+import re
+import json
+import math
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from qdrant_client import QdrantClient
+
+# Terms that make the stub classifier call a document relevant (two or more) or borderline (housing only)
+STRONG_TERMS = ("rent stabilization", "rent increase", "just cause", "eviction", "tenant", "landlord",
+                "tenancy", "security deposit", "rental registry", "fair housing", "source of income")
+
+_WORD = re.compile(r"[a-z0-9]+")
+_BATCH_DOCUMENT = re.compile(r"^=== DOCUMENT id=(\S+) ===$", re.M)
+
+def _unit(text: str) -> float:
+    """Stable pseudo-random number in [0, 1) for a text."""
+    return int(hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest(), 16) / 2 ** 64
+
+def simulate_latency(mean_ms: float, key: str):
+    # Uniform between 0.5x and 1.5x the mean, fixed per request
+    if mean_ms > 0:
+        time.sleep(mean_ms * (0.5 + _unit(key)) / 1000)
+
+def judge(text: str, large: bool) -> Dict[str, Any]:
+    """
+    Relevance answer for a document text: clear housing items are relevant with high
+    confidence, housing programs are uncertain on the small model (so the cascade escalates
+    them) and not relevant on the large one, everything else is clearly not relevant.
+    """
+    lowered = text.lower()
+    hits = sum(lowered.count(term) for term in STRONG_TERMS)
+    if hits >= 2:
+        return {"is_relevant": True, "relevance_score": 0.9, "confidence": 0.9,
+                "topics": ["rent_control"], "rationale": "Changes landlord and tenant obligations."}
+    if "housing" in lowered or "homeless" in lowered:
+        if large:
+            return {"is_relevant": False, "relevance_score": 0.3, "confidence": 0.8,
+                    "topics": ["other"], "rationale": "Housing program without a regulatory change."}
+        return {"is_relevant": True, "relevance_score": 0.65, "confidence": 0.5,
+                "topics": ["other"], "rationale": "Possibly relevant housing program."}
+    return {"is_relevant": False, "relevance_score": 0.05, "confidence": 0.95,
+            "topics": [], "rationale": "Not about housing legislation."}
+
+class StubChatModel(SimpleChatModel):
+    """
+    Answers the relevance (single and batched) and summarize prompts with valid JSON
+    derived from the document text, after `latency_ms` (mean) of simulated latency.
+    """
+    model_name: str = "gpt-4o-mini"
+    temperature: float = 0.0
+    latency_ms: float = 0.0
+    # Answers like the escalation model of the relevance cascade
+    large: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-stub"
+
+    def _call(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        system, user = messages[0].content, messages[-1].content
+        simulate_latency(self.latency_ms, f"{self.model_name}:{user}")
+        large = self.large
+        if system.startswith("You classify whether each of several documents"):
+            parts = _BATCH_DOCUMENT.split(user)
+            results = [{"id": doc_id, **judge(text, large)} for doc_id, text in zip(parts[1::2], parts[2::2])]
+            return json.dumps({"results": results})
+        if system.startswith("You classify"):
+            return json.dumps(judge(user, large))
+        title = re.search(r"^title: (.*)$", user, re.M)
+        url = re.search(r"^url: (.*)$", user, re.M)
+        return json.dumps({
+            "heading": title.group(1) if title else "Untitled",
+            "summary": "The council will consider changes to local housing rules. "
+                       "The proposal affects landlords and tenants. A hearing is scheduled.",
+            "key_points": ["Changes landlord obligations", "Adds tenant protections", "Public hearing scheduled"],
+            "impacted_parties": ["tenants", "landlords"],
+            "important_dates": [],
+            "source_link": url.group(1) if url else "",
+            "date_posted": "unknown",
+            "ai_confidence": 0.8,
+        })
+
+class StubEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words vectors (unit length): identical texts get identical vectors and
+    texts sharing most words get close ones, so the semantic dedupe tier behaves realistically.
+    """
+    def __init__(self, dimensions: int, latency_ms: float = 0.0):
+        self.dimensions = dimensions
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # One request per call, like the batched OpenAI endpoint
+        simulate_latency(self.latency_ms, str(len(texts)))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class CorpusFirecrawl:
+    """FirecrawlClient stand-in that serves pages of a benchmarks.corpus.Corpus."""
+    def __init__(self, corpus, latency_ms: float = 0.0):
+        self.corpus = corpus
+        self.latency_ms = latency_ms
+
+    def scrape_url(self, url: str):
+        index = self.corpus.index_of(url)
+        if index is None:
+            return None
+        simulate_latency(self.latency_ms, url)
+        page = self.corpus.page(index)
+        return {"markdown": page["markdown"], "metadata": {"title": page["title"], "sourceURL": url}}
+
+class LockedQdrant:
+    """
+    In-process Qdrant (QdrantClient(":memory:")) shared by the graph workers. Local mode is
+    not thread-safe, so calls are serialized, roughly like a single-node server under load.
+    """
+    def __init__(self):
+        self._client = QdrantClient(":memory:")
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return call
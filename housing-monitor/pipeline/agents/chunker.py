@@ -0,0 +1,137 @@
+import re
+import logging
+from typing import Dict, List
+from pipeline.config import CHUNK_MAX_CHARS
+from pipeline.agents.prefilter import LexicalPrefilter
+
+logger = logging.getLogger(__name__)
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.M)
+
+def _sections(text: str) -> List[Dict]:
+    """
+    Splits markdown at headings. Each section carries its heading path
+    ("Agenda > Item 12 > Rent Stabilization") so a chunk keeps its context.
+    """
+    sections = []
+    path: List[tuple] = []
+    matches = list(_HEADING.finditer(text))
+    if not matches or matches[0].start() > 0:
+        end = matches[0].start() if matches else len(text)
+        sections.append({"heading": "", "text": text[:end]})
+    for i, match in enumerate(matches):
+        level, title = len(match.group(1)), match.group(2)
+        path = [(l, t) for l, t in path if l < level] + [(level, title)]
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections.append({"heading": " > ".join(t for _, t in path), "text": text[match.start():end]})
+    return [s for s in sections if s["text"].strip()]
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    # Paragraphs first, then lines, then a hard cut for a single oversized line
+    parts, current = [], ""
+    for paragraph in re.split(r"(\n\s*\n)", text):
+        if len(current) + len(paragraph) <= max_chars:
+            current += paragraph
+            continue
+        if current.strip():
+            parts.append(current)
+        current = ""
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            parts.append(paragraph[:cut])
+            paragraph = paragraph[cut:]
+        current = paragraph
+    if current.strip():
+        parts.append(current)
+    return parts
+
+def split_sections(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[Dict]:
+    """
+    Section-aware chunks of at most max_chars: short sections are merged with the next ones,
+    oversized ones split at paragraph boundaries.
+    Returns [{"index", "heading", "text"}] in document order.
+    """
+    chunks: List[Dict] = []
+    for section in _sections(text or ""):
+        pieces = _split_long(section["text"], max_chars) if len(section["text"]) > max_chars else [section["text"]]
+        for piece in pieces:
+            last = chunks[-1] if chunks else None
+            # Only short chunks absorb the next section, so a section keeps its own heading
+            if last and len(last["text"]) < max_chars // 2 and len(last["text"]) + len(piece) <= max_chars:
+                # A merged chunk is labeled by its first headed section; the text keeps every heading line
+                last["text"] += piece
+                last["heading"] = last["heading"] or section["heading"]
+            else:
+                chunks.append({"heading": section["heading"], "text": piece})
+    for index, chunk in enumerate(chunks):
+        chunk["index"] = index
+        chunk["text"] = chunk["text"].strip()
+    return chunks
+
+class DocumentChunker:
+    """
+    Graph stage: splits content_text into section chunks and scores each with the
+    lexical prefilter, so the classifier can look at the most promising sections first.
+    """
+    def __init__(self, prefilter: LexicalPrefilter, max_chars: int = CHUNK_MAX_CHARS):
+        self.prefilter = prefilter
+        self.max_chars = max_chars
+
+    def process(self, doc: dict) -> dict:
+        chunks = split_sections(doc.get('content_text') or '', self.max_chars)
+        for chunk in chunks:
+            chunk['prefilter_score'] = round(self.prefilter.score(f"{chunk['heading']}\n{chunk['text']}")[0], 3)
+        doc['chunks'] = chunks
+        if len(chunks) > 1:
+            logger.info(f"Split doc {doc.get('id')} into {len(chunks)} chunks")
+        return doc
+
+    def restore(self, doc: dict) -> dict:
+        """
+        Puts the texts back into chunks restored from a checkpoint (stored without them) by
+        splitting content_text again. Re-chunks from scratch if the split no longer lines up.
+        """
+        chunks = doc.get('chunks')
+        if not chunks or all('text' in chunk for chunk in chunks):
+            return doc
+        split = split_sections(doc.get('content_text') or '', self.max_chars)
+        if [c['heading'] for c in split] != [c.get('heading') for c in chunks]:
+            logger.warning(f"Chunks of doc {doc.get('id')} changed since its checkpoint; chunking again")
+            return self.process(doc)
+        for chunk, fresh in zip(chunks, split):
+            chunk['text'] = fresh['text']
+        return doc
+
+def chunk_texts(doc: dict, indices: List[int]) -> str:
+    """
+    The given chunks in document order, each prefixed with its heading path.
+    """
+    chunks = {c['index']: c for c in doc.get('chunks') or []}
+    parts = []
+    for index in sorted(indices):
+        chunk = chunks.get(index)
+        if chunk:
+            parts.append(f"[{chunk['heading']}]\n{chunk['text']}" if chunk['heading'] else chunk['text'])
+    return "\n\n".join(parts)
+
+def primary_text(doc: dict, max_chars: int) -> str:
+    """
+    Text that represents the document for embedding: its deciding chunk when it was
+    classified in chunks, otherwise the start of the content.
+    """
+    chunks = doc.get('chunks') or []
+    if len(chunks) > 1 and doc.get('primary_chunk') is not None:
+        return chunk_texts(doc, [doc['primary_chunk']])[:max_chars]
+    return (doc.get('content_text') or '')[:max_chars]
+
+def indexed_chunks(doc: dict, max_chars: int) -> List[Dict]:
+    """
+    The chunks to store as vectors: every relevant chunk of a chunked document,
+    otherwise the document itself as chunk 0. Returns [{"index", "heading", "text"}].
+    """
+    chunks = {c['index']: c for c in doc.get('chunks') or []}
+    if len(chunks) > 1 and doc.get('relevant_chunks'):
+        return [{"index": i, "heading": chunks[i]['heading'], "text": chunk_texts(doc, [i])[:max_chars]}
+                for i in doc['relevant_chunks'] if i in chunks]
+    return [{"index": 0, "heading": "", "text": (doc.get('content_text') or '')[:max_chars]}]
@@ -1,50 +1,140 @@
-import sqlite3
-from langchain_openai import OpenAIEmbeddings
+import math
 from qdrant_client import QdrantClient
-from pipeline.config import QDRANT_URL, DEDUPE_SIM_THRESHOLD, SQLITE_PATH
-from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME
+from pipeline.config import QDRANT_URL, DEDUPE_SIM_THRESHOLD, DEDUPE_SAME_COUNTY_ONLY, NEAR_DUPE_ENABLED, NEAR_DUPE_MAX_DISTANCE
+import pipeline.db.crud as crud
+from pipeline.collector.normalize import compute_simhash, simhash_bands, hamming_distance
+from pipeline.agents.chunker import primary_text
+from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME, LEGISLATION_PROFILE, payload_filter
+from pipeline.vector.embeddings import get_embedding_service
+from pipeline.tracing import external
+
+# Items produced before the page last changed describe old content, so they don't count;
+# neither do items whose LLM calls failed (the page is being processed again)
+URL_MATCH_SQL = '''
+    SELECT i.id, i.title, i.summary
+    FROM items i
+    JOIN raw_documents r ON i.raw_document_id = r.id
+    WHERE r.url_normalized = ?
+      AND (r.last_changed_at IS NULL OR i.processed_at >= r.last_changed_at)
+      AND i.error IS NULL
+'''
+
+# Skip the document's own row: its older items now join to the updated hash
+HASH_MATCH_SQL = '''
+    SELECT i.id, i.title, i.summary
+    FROM items i
+    JOIN raw_documents r ON i.raw_document_id = r.id
+    WHERE r.content_hash = ? AND r.id IS NOT ? AND i.error IS NULL
+'''
+
+# Items of other documents sharing at least one SimHash band; the exact distance is checked in Python
+NEAR_DUPE_CANDIDATES_SQL = '''
+    SELECT item_id, simhash FROM simhash_index
+    WHERE (band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?) AND raw_document_id IS NOT ?
+'''
+
+# Below this the semantic and near-duplicate tiers are not meaningful
+MIN_CONTENT_CHARS = 100
+
+# Characters of the deciding chunk embedded for the semantic tier
+SEMANTIC_QUERY_CHARS = 2000
+
+def cosine_similarity(a, b) -> float:
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
 
 class DedupeAgent:
-    def __init__(self):
+    def __init__(self, buffer=None):
         self.client = QdrantClient(url=QDRANT_URL)
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        print(f"DEBUG: DedupeAgent connecting to SQLite at: {SQLITE_PATH}")
-        self.conn = sqlite3.connect(SQLITE_PATH) 
-        # Note: In a real app, use a connection pool or persistent connection managed properly
-        self.conn.row_factory = sqlite3.Row
+        self.embeddings = get_embedding_service()
+        # PersistBuffer holding this run's items until their batch is written
+        self.buffer = buffer
 
     def get_existing_by_url(self, url_normalized: str):
-        c = self.conn.cursor()
-        c.execute('''
-            SELECT i.id, i.title, i.summary 
-            FROM items i 
-            JOIN raw_documents r ON i.raw_document_id = r.id
-            WHERE r.url_normalized = ?
-        ''', (url_normalized,))
-        return c.fetchone()
-
-    def get_existing_by_hash(self, content_hash: str):
-        c = self.conn.cursor()
-        c.execute('''
-            SELECT i.id, i.title, i.summary 
-            FROM items i 
-            JOIN raw_documents r ON i.raw_document_id = r.id
-            WHERE r.content_hash = ?
-        ''', (content_hash,))
-        return c.fetchone()
-
-    def check_semantic_duplicate(self, text: str, county: str):
+        # Uses the calling worker thread's own connection
+        return crud.get_connection().execute(URL_MATCH_SQL, (url_normalized,)).fetchone()
+
+    def get_existing_by_hash(self, content_hash: str, raw_document_id=None):
+        return crud.get_connection().execute(HASH_MATCH_SQL, (content_hash, raw_document_id)).fetchone()
+
+    def check_near_duplicate(self, simhash: int, raw_document_id=None):
+        """
+        Returns (item_id, distance) of the closest indexed item of another document within
+        NEAR_DUPE_MAX_DISTANCE bits, or None. Local only: no API call.
+        """
+        rows = crud.get_connection().execute(NEAR_DUPE_CANDIDATES_SQL,
+                                             (*simhash_bands(simhash), raw_document_id)).fetchall()
+        # Closest first; on ties the oldest item is the original
+        matches = sorted((hamming_distance(simhash, crud.from_signed64(row['simhash'])), row['item_id'])
+                         for row in rows)
+        if matches and matches[0][0] <= NEAR_DUPE_MAX_DISTANCE:
+            distance, item_id = matches[0]
+            return item_id, distance
+        return None
+
+    def _simhash(self, doc: dict):
+        # Signature of the near-duplicate tier, None when that tier doesn't apply
+        if 'simhash' not in doc:
+            content = doc.get('content_text') or ''
+            if not NEAR_DUPE_ENABLED or len(content) <= MIN_CONTENT_CHARS:
+                return None
+            doc['simhash'] = compute_simhash(content)
+        return doc['simhash']
+
+    def matches_buffered(self, doc: dict) -> bool:
+        """
+        True when an item of this run still waiting in the persist buffer could match doc in
+        the URL, hash or near-duplicate tier. Local only: compares in memory.
+        """
+        buffered = [other for other in self.buffer.buffered_docs()
+                    if other.get('raw_document_id') != doc.get('id') and not crud.item_error(other)]
+        if not buffered:
+            return False
+        url, content_hash = doc.get('url_normalized'), doc.get('content_hash')
+        for other in buffered:
+            if url and other.get('url_normalized') == url:
+                return True
+            if content_hash and other.get('content_hash') == content_hash:
+                return True
+        simhash = self._simhash(doc)
+        return simhash is not None and any(
+            other.get('simhash') and hamming_distance(simhash, other['simhash']) <= NEAR_DUPE_MAX_DISTANCE
+            for other in buffered)
+
+    def matches_buffered_vector(self, vector, county: str, raw_document_id=None) -> bool:
+        """
+        True when a relevant, new item of this run still waiting in the persist buffer (so not
+        in Qdrant yet) is within DEDUPE_SIM_THRESHOLD of vector. Compares the semantic-tier
+        embeddings of those items, which the embedding cache already holds.
+        """
+        candidates = [other for other in self.buffer.buffered_docs()
+                      if other.get('is_relevant') and other.get('is_new') and not crud.item_error(other)
+                      and len(other.get('content_text') or '') > MIN_CONTENT_CHARS
+                      and other.get('raw_document_id') != raw_document_id
+                      and (not DEDUPE_SAME_COUNTY_ONLY or other.get('county') == county)]
+        if not candidates:
+            return False
+        vectors = self.embeddings.embed_documents([primary_text(other, SEMANTIC_QUERY_CHARS) for other in candidates])
+        return any(cosine_similarity(vector, other) >= DEDUPE_SIM_THRESHOLD for other in vectors)
+
+    def check_semantic_duplicate(self, text: str, county: str, raw_document_id=None):
         # Embed current text
         vector = self.embeddings.embed_query(text)
-        
-        # Search in Qdrant, filtering by county if we stored payload properly
-        # For simplicity, we search global or add filter logic
-        hits = self.client.query_points(
-            collection_name=LEGISLATION_COLLECTION_NAME,
-            query=vector,
-            limit=1,
-            score_threshold=DEDUPE_SIM_THRESHOLD
-        ).points
+
+        # Items of this run whose batch isn't written yet have no points in Qdrant
+        if self.buffer is not None and self.matches_buffered_vector(vector, county, raw_document_id):
+            self.buffer.flush()
+
+        # Search in Qdrant within the same county (uses the county payload index)
+        with external():
+            hits = self.client.query_points(
+                collection_name=LEGISLATION_COLLECTION_NAME,
+                query=vector,
+                query_filter=payload_filter(county=county) if DEDUPE_SAME_COUNTY_ONLY else None,
+                search_params=LEGISLATION_PROFILE.search_params(),
+                limit=1,
+                score_threshold=DEDUPE_SIM_THRESHOLD
+            ).points
         
         if hits:
             return hits[0]
@@ -59,6 +149,11 @@ class DedupeAgent:
         doc['dedup_reason'] = None
         doc['matched_item_id'] = None
 
+        # Items of this run wait in the persist buffer: commit them first if one could match,
+        # so the tiers below find it (and its item id)
+        if self.buffer is not None and self.matches_buffered(doc):
+            self.buffer.flush()
+
         # 1. URL Check
         existing_url = self.get_existing_by_url(doc.get('url_normalized', ''))
         if existing_url:
@@ -68,28 +163,41 @@ class DedupeAgent:
             return doc
 
         # 2. Hash Check
-        existing_hash = self.get_existing_by_hash(doc.get('content_hash', ''))
+        existing_hash = self.get_existing_by_hash(doc.get('content_hash', ''), doc.get('id'))
         if existing_hash:
             doc['is_new'] = False
             doc['dedup_reason'] = 'hash'
             doc['matched_item_id'] = existing_hash['id']
             return doc
             
-        # 3. Semantic Check (Only if text is substantial)
-        content = doc.get('content_text', '')
-        if len(content) > 100:
-            hit = self.check_semantic_duplicate(content[:2000], doc.get('county'))
-            if hit:
+        # Remaining tiers only if text is substantial
+        content = doc.get('content_text') or ''
+        if len(content) <= MIN_CONTENT_CHARS:
+            return doc
+
+        # 3. Near-duplicate Check (local SimHash; the signature is stored with the item on persist)
+        if NEAR_DUPE_ENABLED:
+            near = self.check_near_duplicate(self._simhash(doc), doc.get('id'))
+            if near:
                 doc['is_new'] = False
-                doc['dedup_reason'] = f'semantic (score {hit.score:.2f})'
-                # Assuming payload has item_id
-                doc['matched_item_id'] = hit.payload.get('item_id')
+                doc['dedup_reason'] = f'simhash (distance {near[1]})'
+                doc['matched_item_id'] = near[0]
                 return doc
 
+        # 4. Semantic Check
+        # Compared with the chunk vectors in the collection, so embed the deciding chunk
+        hit = self.check_semantic_duplicate(primary_text(doc, SEMANTIC_QUERY_CHARS), doc.get('county'), doc.get('id'))
+        if hit:
+            doc['is_new'] = False
+            doc['dedup_reason'] = f'semantic (score {hit.score:.2f})'
+            # Assuming payload has item_id
+            doc['matched_item_id'] = hit.payload.get('item_id')
+            return doc
+
         return doc
         
     def close(self):
-        self.conn.close()
+        crud.close_connection()
 
 if __name__ == "__main__":
     d = DedupeAgent()
@@ -0,0 +1,164 @@
+import os
+import re
+import logging
+from collections import Counter
+from typing import Dict, List, Tuple
+from pipeline.config import KB_DIR, PREFILTER_MODE, PREFILTER_MIN_SCORE
+
+logger = logging.getLogger(__name__)
+
+# Term weights: KB glossary/topic phrases and bill numbers are strong signals, body keywords weak ones
+PHRASE_WEIGHT = 3.0
+BILL_WEIGHT = 3.0
+KEYWORD_WEIGHT = 1.0
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+AVG_DOC_TOKENS = 800
+
+# Marker used in relevance_rationale for documents decided by the prefilter
+PREFILTER_RATIONALE = "Lexical prefilter"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_BOLD = re.compile(r"\*\*([^*]+)\*\*")
+_BILL = re.compile(r"\b(?:ab|sb)\s?\d{2,4}\b")
+
+# Function words only: domain terms in the KB ("race", "familial", "just cause", ...) are signals
+_STOPWORDS = {
+    "that", "this", "these", "they", "their", "them", "there", "then", "than", "with", "from",
+    "into", "onto", "upon", "which", "where", "when", "what", "while", "whom", "whose", "have",
+    "has", "been", "being", "were", "also", "each", "must", "such", "only", "under", "unless",
+    "within", "without", "will", "would", "should", "could", "shall", "other", "more", "most",
+    "much", "many", "some", "very", "about", "over", "both", "either", "neither", "does",
+}
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+def _section(markdown: str, heading: str) -> str:
+    """
+    Returns the body of the '## heading' section (up to the next '## ').
+    """
+    match = re.search(rf"^## {re.escape(heading)}\s*$(.*?)(?=^## |\Z)", markdown, re.M | re.S)
+    return match.group(1) if match else ""
+
+def _label_phrases(label: str) -> List[str]:
+    # "Rent Control (Rent Stabilization)" -> ["rent control", "rent stabilization"]
+    phrases = []
+    for part in re.split(r"[()/,&]", label):
+        words = _tokenize(part)
+        if words and len(words) <= 4 and not all(w in _STOPWORDS for w in words):
+            phrases.append(" ".join(words))
+    return phrases
+
+def load_kb_terms(kb_dir: str = KB_DIR) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    Builds (phrase weights, keyword weights) from the glossary and the 'Relevant Topics'
+    section of the relevance policy.
+    """
+    texts = []
+    glossary_path = os.path.join(kb_dir, 'housing_glossary.md')
+    policy_path = os.path.join(kb_dir, 'relevance_policy.md')
+    if os.path.exists(glossary_path):
+        with open(glossary_path, 'r') as f:
+            texts.append(f.read())
+    if os.path.exists(policy_path):
+        with open(policy_path, 'r') as f:
+            texts.append(_section(f.read(), "Relevant Topics"))
+
+    phrases: Dict[str, float] = {}
+    keywords: Dict[str, float] = {}
+    for text in texts:
+        for label in _BOLD.findall(text):
+            for phrase in _label_phrases(label):
+                if " " in phrase or len(phrase) <= 4:
+                    phrases[phrase] = PHRASE_WEIGHT
+        for token in _tokenize(_BOLD.sub(" ", text)):
+            if len(token) >= 4 and token not in _STOPWORDS and not token.isdigit():
+                keywords[token] = KEYWORD_WEIGHT
+
+    # Single-word labels ("adu", "rhna") are matched as keywords with the phrase weight
+    for phrase in [p for p in phrases if " " not in p]:
+        keywords[phrase] = phrases.pop(phrase)
+    return phrases, keywords
+
+class LexicalPrefilter:
+    """
+    Local BM25-style scorer over KB terms. Runs before the LLM classifier so that
+    pages with no housing-policy vocabulary (city homepages, parks calendars, ...)
+    never cost an API call.
+    """
+    def __init__(self, mode: str = PREFILTER_MODE, min_score: float = PREFILTER_MIN_SCORE,
+                 kb_dir: str = KB_DIR):
+        self.mode = mode
+        self.min_score = min_score
+        self.phrases, self.keywords = load_kb_terms(kb_dir)
+        self._phrase_patterns = {p: re.compile(rf"\b{re.escape(p)}\b") for p in self.phrases}
+        logger.info(f"Prefilter loaded {len(self.phrases)} phrases, {len(self.keywords)} keywords (mode={mode})")
+
+    @property
+    def enforcing(self) -> bool:
+        return self.mode == "enforce"
+
+    def _saturate(self, tf: int, doc_len: int) -> float:
+        norm = 1 - BM25_B + BM25_B * doc_len / AVG_DOC_TOKENS
+        return tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+    def score(self, text: str) -> Tuple[float, List[str]]:
+        """
+        Returns (score, matched terms ordered by contribution).
+        """
+        tokens = _tokenize(text)
+        doc_len = max(len(tokens), 1)
+        normalized = " ".join(tokens)
+        counts = Counter(tokens)
+
+        contributions: Dict[str, float] = {}
+        for phrase, pattern in self._phrase_patterns.items():
+            tf = len(pattern.findall(normalized))
+            if tf:
+                contributions[phrase] = self.phrases[phrase] * self._saturate(tf, doc_len)
+        for keyword, weight in self.keywords.items():
+            tf = counts.get(keyword, 0)
+            if tf:
+                contributions[keyword] = weight * self._saturate(tf, doc_len)
+        for bill, tf in Counter(_BILL.findall(normalized)).items():
+            contributions[bill] = BILL_WEIGHT * self._saturate(tf, doc_len)
+
+        matched = sorted(contributions, key=contributions.get, reverse=True)
+        return sum(contributions.values()), matched
+
+    def process(self, doc: dict) -> dict:
+        """
+        Scores the document and records prefilter_score / prefilter_passed.
+        In enforce mode a failing document also gets the not-relevant fields the
+        classifier would have set, so it can go straight to persist.
+        """
+        if self.mode == "off":
+            return doc
+
+        score, matched = self.score(f"{doc.get('title') or ''}\n{doc.get('content_text') or ''}")
+        doc['prefilter_score'] = round(score, 3)
+        doc['prefilter_passed'] = score >= self.min_score
+
+        if not doc['prefilter_passed'] and self.enforcing:
+            terms = ", ".join(matched[:5]) or "none"
+            doc['is_relevant'] = False
+            doc['relevance_score'] = 0.0
+            doc['topics'] = []
+            doc['relevance_rationale'] = (
+                f"{PREFILTER_RATIONALE}: score {score:.2f} < {self.min_score:.2f} (terms: {terms})"
+            )
+            doc['ai_confidence'] = 0.0
+        return doc
+
+    def should_skip(self, doc: dict) -> bool:
+        return self.enforcing and doc.get('prefilter_passed') is False
+
+if __name__ == "__main__":
+    p = LexicalPrefilter()
+    print(sorted(p.phrases))
+    print(sorted(p.keywords))
+    print(p.score("The council will consider a just cause eviction ordinance and AB 1482 rent caps."))
+    print(p.score("Welcome to the City of Albany. Parks and recreation events this weekend."))
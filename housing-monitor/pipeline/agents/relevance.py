@@ -1,28 +1,20 @@
-import json
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from pipeline.rag.retrieve import RAGRetriever
-from pipeline.config import RELEVANCE_THRESHOLD
+from pipeline.rag.retrieve import RAGRetriever, merge_contexts
+from pipeline.config import (
+    RELEVANCE_THRESHOLD, RELEVANCE_CASCADE_ENABLED, RELEVANCE_SMALL_MODEL, RELEVANCE_LARGE_MODEL,
+    RELEVANCE_UNCERTAINTY_BAND, RELEVANCE_MIN_CONFIDENCE, RELEVANCE_MAX_CHUNKS, RELEVANCE_CHUNK_WORKERS,
+    RELEVANCE_PROMPT_TOKENS, RELEVANCE_BATCH_SIZE, RELEVANCE_BATCH_WAIT_MS, RELEVANCE_BATCH_DOC_TOKENS,
+    RELEVANCE_BATCH_PROMPT_TOKENS, RELEVANCE_MAX_TOKENS, RELEVANCE_BATCH_MAX_TOKENS
+)
+from pipeline.llm.client import LLMClient, DeferredCall, count_tokens
 
-class RelevanceAgent:
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        self.retriever = RAGRetriever()
-        
-    def classify(self, doc: dict) -> dict:
-        """
-        Classifies a document for relevance using RAG.
-        Returns the updated doc dict with relevance fields.
-        """
-        # Construct query from title + start of content
-        query = f"{doc.get('title', '')} {doc.get('content_text', '')[:500]}"
-        
-        # 1. Retrieve Context
-        kb_context = self.retriever.retrieve(query)
-        
-        # 2. Prompt LLM
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You classify whether a document is relevant to California housing legislation (rent control, tenant protections, fair housing, eviction/just cause, landlord obligations, fees/deposits, enforcement, registration, housing policy affecting landlords/tenants). You must follow the relevance policy and use retrieved KB context.
+RELEVANCE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You classify whether a document is relevant to California housing legislation (rent control, tenant protections, fair housing, eviction/just cause, landlord obligations, fees/deposits, enforcement, registration, housing policy affecting landlords/tenants). You must follow the relevance policy and use retrieved KB context.
 
 GLOSSARY / EXAMPLES (KB):
 {kb_chunks}
@@ -39,7 +31,7 @@ Return STRICT JSON ONLY with this schema:
 Rules:
 - If the doc is about general housing programs with no regulatory/legislative change, set is_relevant=false unless it changes landlord/tenant obligations.
 - If unclear, set is_relevant=false with a low score and explain uncertainty."""),
-            ("user", """DOCUMENT METADATA:
+    ("user", """DOCUMENT METADATA:
 county: {county}
 source_type: {source_type}
 title: {title}
@@ -47,45 +39,371 @@ url: {url}
 
 DOCUMENT TEXT (partial):
 {document_text}""")
-        ])
-        
-        chain = prompt | self.llm
-        
+])
+
+RELEVANCE_BATCH_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You classify whether each of several documents is relevant to California housing legislation (rent control, tenant protections, fair housing, eviction/just cause, landlord obligations, fees/deposits, enforcement, registration, housing policy affecting landlords/tenants). You must follow the relevance policy and use retrieved KB context. Judge every document on its own.
+
+GLOSSARY / EXAMPLES (KB):
+{kb_chunks}
+
+Return a JSON object with one result per document, using the document's id:
+{{
+  "results": [
+    {{
+      "id": string,               // the id from the document header
+      "is_relevant": boolean,
+      "relevance_score": number,  // 0.0 to 1.0
+      "topics": ["rent_control"|"fair_housing"|"eviction"|"fees_deposits"|"registration"|"enforcement"|"zoning_supply"|"voucher_soi"|"other"],
+      "rationale": string,        // <= 40 words
+      "confidence": number        // 0.0 to 1.0
+    }}
+  ]
+}}
+
+Rules:
+- If the doc is about general housing programs with no regulatory/legislative change, set is_relevant=false unless it changes landlord/tenant obligations.
+- If unclear, set is_relevant=false with a low score and explain uncertainty."""),
+    ("user", """DOCUMENTS:
+
+{documents}""")
+])
+
+def _format_batch_document(doc_id: str, doc: dict) -> str:
+    return (f"=== DOCUMENT id={doc_id} ===\n"
+            f"county: {doc.get('county')}\n"
+            f"source_type: {doc.get('source_type')}\n"
+            f"title: {doc.get('title')}\n"
+            f"url: {doc.get('url')}\n\n"
+            f"{doc.get('content_text') or ''}")
+
+class RelevanceAgent:
+    # Bump whenever RELEVANCE_PROMPT / RELEVANCE_BATCH_PROMPT change so cached responses are not reused
+    PROMPT_VERSION = "relevance-v1"
+    BATCH_PROMPT_VERSION = "relevance-batch-v1"
+
+    def __init__(self):
+        # Retries are done (and counted) by LLMClient
+        self.llm = ChatOpenAI(model=RELEVANCE_LARGE_MODEL, temperature=0, max_retries=0)
+        self.llm_small = ChatOpenAI(model=RELEVANCE_SMALL_MODEL, temperature=0, max_retries=0)
+        self.cascade = RELEVANCE_CASCADE_ENABLED
+        self.retriever = RAGRetriever()
+        self.client = LLMClient("relevance", RELEVANCE_PROMPT, self.PROMPT_VERSION, RELEVANCE_PROMPT_TOKENS,
+                                RELEVANCE_MAX_TOKENS)
+        self.batch_client = LLMClient("relevance_batch", RELEVANCE_BATCH_PROMPT, self.BATCH_PROMPT_VERSION,
+                                      RELEVANCE_BATCH_PROMPT_TOKENS, RELEVANCE_BATCH_MAX_TOKENS,
+                                      fit_field="documents")
+
+    def _run_model(self, llm: ChatOpenAI, inputs: dict, raw_document_id: int = None) -> dict:
+        """
+        Calls one model (or its cached answer) and returns the parsed JSON result.
+        """
+        return self.client.complete_json(llm, inputs, raw_document_id)
+
+    def needs_escalation(self, result: dict) -> bool:
+        """
+        True when the small model's answer is too close to the decision boundary to trust.
+        """
+        score = float(result.get('relevance_score', 0.0) or 0.0)
+        confidence = float(result.get('confidence', 0.0) or 0.0)
+        return (abs(score - RELEVANCE_THRESHOLD) <= RELEVANCE_UNCERTAINTY_BAND
+                or confidence < RELEVANCE_MIN_CONFIDENCE)
+
+    def is_confident(self, result: dict) -> bool:
+        """
+        A relevant answer clear enough to stop looking at the document's other chunks.
+        """
+        return (bool(result.get('is_relevant'))
+                and float(result.get('relevance_score', 0.0) or 0.0) >= RELEVANCE_THRESHOLD
+                and float(result.get('confidence', 0.0) or 0.0) >= RELEVANCE_MIN_CONFIDENCE)
+
+    def _classify_text(self, doc: dict, document_text: str, kb_context: str) -> Tuple[dict, str, bool]:
+        """
+        Runs the cascade on one piece of text. Returns (result, tier, escalated); raises on failure.
+        """
+        inputs = {
+            "kb_chunks": kb_context,
+            "county": doc.get('county'),
+            "source_type": doc.get('source_type'),
+            "title": doc.get('title'),
+            "url": doc.get('url'),
+            "document_text": document_text
+        }
+
+        result = None
+        escalated = False
+        if self.cascade:
+            try:
+                result = self._run_model(self.llm_small, inputs, doc.get('id'))
+            except DeferredCall:
+                raise
+            except Exception as e:
+                print(f"Relevance agent small-model error, escalating: {e}")
+            if result is None or self.needs_escalation(result):
+                escalated = True
+                result = None
+            else:
+                return result, "small", escalated
+        return self._run_model(self.llm, inputs, doc.get('id')), "large", escalated
+
+    def _classify_chunks(self, doc: dict, chunks: List[dict]) -> Tuple[int, dict, str, dict]:
+        """
+        Classifies the most promising chunks (by lexical score) in parallel and stops
+        at the first confidently relevant one; chunks not yet started are skipped.
+        Returns (best chunk index, its result, its tier, {index: result} of finished chunks).
+        """
+        candidates = sorted(chunks, key=lambda c: c.get('prefilter_score', 0.0), reverse=True)[:RELEVANCE_MAX_CHUNKS]
+        # Retrieval for all candidates at once: one embedding call, one KB search
+        contexts = self.retriever.retrieve_batch(
+            [f"{doc.get('title', '')} {c['heading']} {c['text'][:500]}" for c in candidates]
+        )
+
+        finished, tiers = {}, {}
+        escalated = False
+        errors = []
+        # At most RELEVANCE_CHUNK_WORKERS chunks in flight; the next one starts only when
+        # one finishes without a confident answer
+        pending = list(zip(candidates, contexts))
+        with ThreadPoolExecutor(max_workers=max(1, RELEVANCE_CHUNK_WORKERS)) as executor:
+            running = {}
+
+            def submit_next():
+                if pending:
+                    chunk, context = pending.pop(0)
+                    # Run in a copy of the caller's context so the calls count towards its stage span
+                    running[executor.submit(contextvars.copy_context().run, self._classify_text,
+                                            doc, chunk['text'], context)] = chunk['index']
+
+            for _ in range(max(1, RELEVANCE_CHUNK_WORKERS)):
+                submit_next()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    try:
+                        result, tier, chunk_escalated = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    finished[index], tiers[index] = result, tier
+                    escalated = escalated or chunk_escalated
+                if any(self.is_confident(finished[i]) for i in finished):
+                    # Chunks already in flight finish, nothing new is started
+                    pending.clear()
+                for _ in done:
+                    submit_next()
+
+        confident = [i for i, r in finished.items() if self.is_confident(r)]
+        # Under --batch-api, wait for the deferred chunks unless the answer is already known
+        deferred = [e for e in errors if isinstance(e, DeferredCall)]
+        if deferred and not confident:
+            raise deferred[0]
+        if not finished:
+            raise errors[0] if errors else ValueError("no chunks to classify")
+        doc['relevance_escalated'] = escalated
+        best = confident[0] if confident else max(
+            finished, key=lambda i: float(finished[i].get('relevance_score', 0.0) or 0.0))
+        return best, finished[best], tiers[best], finished
+
+    def _apply(self, doc: dict, result: dict, tier: str, rationale: str, best: int, finished: Dict[int, dict]) -> dict:
+        # Enforce strict boolean based on threshold if LLM is fuzzy, but LLM usually handles 'is_relevant'.
+        # We can override if score is low but is_relevant is true, or vice versa if needed.
+        # config.RELEVANCE_THRESHOLD can be used to filter downstream.
+
+        doc['is_relevant'] = result.get('is_relevant', False)
+        doc['relevance_score'] = result.get('relevance_score', 0.0)
+        doc['topics'] = result.get('topics', [])
+        doc['relevance_rationale'] = rationale
+        doc['ai_confidence'] = result.get('confidence', 0.0)
+        doc['relevance_tier'] = tier
+        doc['primary_chunk'] = best
+        doc['chunks_classified'] = len(finished)
+        doc['relevant_chunks'] = sorted(
+            i for i, r in finished.items()
+            if r.get('is_relevant') and float(r.get('relevance_score', 0.0) or 0.0) >= RELEVANCE_THRESHOLD
+        )
+        return doc
+
+    def classify(self, doc: dict) -> dict:
+        """
+        Classifies a document for relevance using RAG.
+        With the cascade enabled the small model answers first and only uncertain
+        documents are re-classified by the large model; relevance_tier records which decided.
+        Documents split into several chunks are classified chunk by chunk (see _classify_chunks);
+        relevant_chunks lists the chunks found relevant and primary_chunk the deciding one.
+        Returns the updated doc dict with relevance fields.
+        """
+        chunks = doc.get('chunks') or []
         try:
-            response = chain.invoke({
-                "kb_chunks": kb_context,
-                "county": doc.get('county'),
-                "source_type": doc.get('source_type'),
-                "title": doc.get('title'),
-                "url": doc.get('url'),
-                "document_text": doc.get('content_text', '')[:3000] # Limit context window
-            })
-            
-            content = response.content.strip()
-            # Clean up potential markdown formatting in JSON
-            if content.startswith("```json"):
-                content = content[7:-3]
-            
-            result = json.loads(content)
-            
-            # Enforce strict boolean based on threshold if LLM is fuzzy, but LLM usually handles 'is_relevant'.
-            # We can override if score is low but is_relevant is true, or vice versa if needed.
-            # config.RELEVANCE_THRESHOLD can be used to filter downstream.
-            
-            doc['is_relevant'] = result.get('is_relevant', False)
-            doc['relevance_score'] = result.get('relevance_score', 0.0)
-            doc['topics'] = result.get('topics', [])
-            doc['relevance_rationale'] = result.get('rationale', '')
-            doc['ai_confidence'] = result.get('confidence', 0.0)
-            
-            return doc
-            
+            if len(chunks) > 1:
+                best, result, tier, finished = self._classify_chunks(doc, chunks)
+                heading = next(c['heading'] for c in chunks if c['index'] == best)
+                rationale = result.get('rationale', '')
+                if heading:
+                    rationale = f"[{heading}] {rationale}"
+            else:
+                # Construct query from title + start of content
+                query = f"{doc.get('title', '')} {doc.get('content_text', '')[:500]}"
+
+                # 1. Retrieve Context
+                kb_context = self.retriever.retrieve(query)
+
+                # 2. Prompt LLM(s)
+                # Cut to RELEVANCE_PROMPT_TOKENS by the client
+                text = chunks[0]['text'] if chunks else doc.get('content_text', '')
+                result, tier, escalated = self._classify_text(doc, text, kb_context)
+                if escalated:
+                    doc['relevance_escalated'] = True
+                best, finished = 0, {0: result}
+                rationale = result.get('rationale', '')
+
+            return self._apply(doc, result, tier, rationale, best, finished)
+
+        except DeferredCall:
+            raise
         except Exception as e:
-            print(f"Relevance agent error: {e}")
-            doc['is_relevant'] = False
-            doc['relevance_score'] = 0.0
-            doc['error'] = str(e)
-            return doc
+            return self._fail(doc, e)
+
+    def _fail(self, doc: dict, error: Exception) -> dict:
+        print(f"Relevance agent error: {error}")
+        doc['is_relevant'] = False
+        doc['relevance_score'] = 0.0
+        doc['error'] = str(error)
+        return doc
+
+    def batchable(self, doc: dict) -> bool:
+        """
+        Short, single-chunk documents (homepages, listings) can share one classification request.
+        """
+        if RELEVANCE_BATCH_SIZE <= 1 or len(doc.get('chunks') or []) > 1:
+            return False
+        return count_tokens(doc.get('content_text') or '', RELEVANCE_SMALL_MODEL) <= RELEVANCE_BATCH_DOC_TOKENS
+
+    def _run_batch(self, llm: ChatOpenAI, docs: Dict[str, dict], kb_context: str) -> Dict[str, dict]:
+        """
+        One request classifying all of `docs` ({id: doc}); halves the batch while the prompt is
+        over RELEVANCE_BATCH_PROMPT_TOKENS. Returns {id: result} for the ids answered, which is
+        none when the answer can't be parsed. Raises when the request itself fails.
+        """
+        inputs = {"kb_chunks": kb_context,
+                  "documents": "\n\n".join(_format_batch_document(i, d) for i, d in docs.items())}
+        if len(docs) > 1 and self.batch_client.prompt_tokens(llm.model_name, inputs) > RELEVANCE_BATCH_PROMPT_TOKENS:
+            ids = list(docs)
+            half = len(ids) // 2
+            results = self._run_batch(llm, {i: docs[i] for i in ids[:half]}, kb_context)
+            results.update(self._run_batch(llm, {i: docs[i] for i in ids[half:]}, kb_context))
+            return results
+        try:
+            response = self.batch_client.complete_json(llm, inputs)
+        except ValueError as e:
+            # JSON decode errors; anything else is a failed request
+            print(f"Relevance batch parse error ({len(docs)} docs, {llm.model_name}): {e}")
+            return {}
+        results = response.get('results') if isinstance(response, dict) else None
+        if not isinstance(results, list):
+            print(f"Relevance batch error ({len(docs)} docs, {llm.model_name}): no results list")
+            return {}
+        return {str(r.get('id')): r for r in results if isinstance(r, dict) and str(r.get('id')) in docs}
+
+    def classify_batch(self, docs: List[dict]) -> List[dict]:
+        """
+        Classifies several short documents with one request per model tier instead of one per
+        document: the system prompt and the (merged) KB context are sent once.
+        The cascade applies per document. Documents the answer doesn't cover (unparsable,
+        id missing) fall back to classify(); a failed request is handled as in classify().
+        Returns the updated docs.
+        """
+        if len(docs) <= 1:
+            return [self.classify(doc) for doc in docs]
+
+        contexts = self.retriever.retrieve_batch(
+            [f"{doc.get('title', '')} {doc.get('content_text', '')[:500]}" for doc in docs]
+        )
+        kb_context = merge_contexts(contexts)
+        pending = {f"d{n}": doc for n, doc in enumerate(docs, 1)}
+
+        results, tiers = {}, {}
+        error = None
+        if self.cascade:
+            try:
+                for doc_id, result in self._run_batch(self.llm_small, pending, kb_context).items():
+                    if not self.needs_escalation(result):
+                        results[doc_id], tiers[doc_id] = result, "small"
+            except DeferredCall:
+                raise
+            except Exception as e:
+                print(f"Relevance agent small-model batch error, escalating: {e}")
+        remaining = {doc_id: doc for doc_id, doc in pending.items() if doc_id not in results}
+        if remaining:
+            try:
+                for doc_id, result in self._run_batch(self.llm, remaining, kb_context).items():
+                    results[doc_id], tiers[doc_id] = result, "large"
+            except DeferredCall:
+                raise
+            except Exception as e:
+                error = e
+
+        for doc_id, doc in pending.items():
+            if doc_id not in results:
+                if error is not None:
+                    self._fail(doc, error)
+                else:
+                    self.classify(doc)
+                continue
+            if self.cascade and tiers[doc_id] == "large":
+                doc['relevance_escalated'] = True
+            doc['relevance_batched'] = True
+            self._apply(doc, results[doc_id], tiers[doc_id], results[doc_id].get('rationale', ''), 0,
+                        {0: results[doc_id]})
+        return docs
+
+class RelevanceBatcher:
+    """
+    Gathers batchable documents from concurrent graph workers for RelevanceAgent.classify_batch.
+    A batch is sent once RELEVANCE_BATCH_SIZE documents wait or the first waiter has waited
+    RELEVANCE_BATCH_WAIT_MS; the worker that triggers it makes the call and the others
+    block until their document is classified.
+    """
+    def __init__(self, agent: RelevanceAgent, max_size: int = RELEVANCE_BATCH_SIZE,
+                 max_wait_ms: int = RELEVANCE_BATCH_WAIT_MS):
+        self.agent = agent
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.lock = threading.Lock()
+        self.pending: List[Tuple[dict, Future]] = []
+
+    def _take(self, future: Optional[Future] = None) -> List[Tuple[dict, Future]]:
+        # Caller holds self.lock. With a future, only take the batch if it's still waiting in it
+        if future is not None and not any(f is future for _, f in self.pending):
+            return []
+        batch, self.pending = self.pending, []
+        return batch
+
+    def _run(self, batch: List[Tuple[dict, Future]]):
+        try:
+            self.agent.classify_batch([doc for doc, _ in batch])
+            for doc, future in batch:
+                future.set_result(doc)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def classify(self, doc: dict) -> dict:
+        future: Future = Future()
+        with self.lock:
+            self.pending.append((doc, future))
+            batch = self._take() if len(self.pending) >= self.max_size else []
+        if not batch:
+            try:
+                return future.result(timeout=self.max_wait)
+            except TimeoutError:
+                # Nobody filled the batch in time: send whatever is waiting (unless already sent)
+                with self.lock:
+                    batch = self._take(future)
+        if batch:
+            self._run(batch)
+        return future.result()
 
 if __name__ == "__main__":
     # Test
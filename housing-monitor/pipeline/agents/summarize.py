@@ -1,18 +1,11 @@
-import json
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from pipeline.llm.client import LLMClient, DeferredCall
+from pipeline.config import SUMMARIZE_PROMPT_TOKENS, SUMMARIZE_MAX_TOKENS
+from pipeline.agents.chunker import chunk_texts
 
-class SummarizeAgent:
-    def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        
-    def summarize(self, doc: dict) -> dict:
-        """
-        Generates a structured summary for the document.
-        Adds summary fields to the doc dict.
-        """
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You write concise, plain-English structured summaries of county housing legislation or policy actions. Do not invent facts. If dates are missing, say "unknown" and lower confidence.
+SUMMARIZE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You write concise, plain-English structured summaries of county housing legislation or policy actions. Do not invent facts. If dates are missing, say "unknown" and lower confidence.
 
 Return STRICT JSON ONLY with this schema:
 {{
@@ -29,7 +22,7 @@ Return STRICT JSON ONLY with this schema:
 Rules:
 - Use only information supported by the text.
 - If the doc is an agenda/minutes, summarize the specific housing-related agenda items."""),
-            ("user", """DOCUMENT METADATA:
+    ("user", """DOCUMENT METADATA:
 county: {county}
 title: {title}
 url: {url}
@@ -37,28 +30,44 @@ extracted_date: {extracted_date}
 
 DOCUMENT TEXT:
 {document_text}""")
-        ])
-        
-        chain = prompt | self.llm
+])
+
+class SummarizeAgent:
+    # Bump whenever SUMMARIZE_PROMPT changes so cached responses are not reused
+    PROMPT_VERSION = "summarize-v1"
+
+    def __init__(self):
+        # Retries are done (and counted) by LLMClient
+        self.llm = ChatOpenAI(model="gpt-4o", temperature=0, max_retries=0)
+        self.client = LLMClient("summarize", SUMMARIZE_PROMPT, self.PROMPT_VERSION, SUMMARIZE_PROMPT_TOKENS,
+                                SUMMARIZE_MAX_TOKENS)
         
+    def summarize(self, doc: dict) -> dict:
+        """
+        Generates a structured summary for the document.
+        Adds summary fields to the doc dict.
+        """
+        # Long documents: only the sections the classifier found relevant
+        if len(doc.get('chunks') or []) > 1 and doc.get('relevant_chunks'):
+            document_text = chunk_texts(doc, doc['relevant_chunks'])
+        else:
+            document_text = doc.get('content_text', '')
+
+        inputs = {
+            "county": doc.get('county'),
+            "title": doc.get('title'),
+            "url": doc.get('url'),
+            "extracted_date": doc.get('extracted_date'),
+            "document_text": document_text # Cut to SUMMARIZE_PROMPT_TOKENS by the client
+        }
+
         try:
-            response = chain.invoke({
-                "county": doc.get('county'),
-                "title": doc.get('title'),
-                "url": doc.get('url'),
-                "extracted_date": doc.get('extracted_date'),
-                "document_text": doc.get('content_text', '')[:5000] # Limit context
-            })
-            
-            content = response.content.strip()
-            if content.startswith("```json"):
-                content = content[7:-3]
-                
-            result = json.loads(content)
-            
+            result = self.client.complete_json(self.llm, inputs, doc.get('id'))
             doc.update(result)
             return doc
-            
+
+        except DeferredCall:
+            raise
         except Exception as e:
             print(f"Summarize agent error: {e}")
             doc['error_summary'] = str(e)
@@ -1,83 +1,197 @@
 import time
-from typing import List, Dict, Any
-from pipeline.config import SOURCES
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable
+from urllib.parse import urlparse
+from pipeline.config import SOURCES, COLLECT_MAX_WORKERS, COLLECT_HOST_DELAY
 from pipeline.collector.firecrawl_client import FirecrawlClient
 from pipeline.collector.normalize import normalize_url, compute_content_hash
 import pipeline.db.crud as crud
+from pipeline.tracing import span, external, waiting
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+def _host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+class HostThrottle:
+    """
+    Per-host politeness: requests to the same host start at least `delay` seconds apart,
+    and the next one starts no sooner than `delay` after the last finished.
+    Different hosts never wait on each other.
+    """
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._guard = threading.Lock()
+        self._next_allowed: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, url: str):
+        host = _host(url)
+        # Reserve a start time under the lock, then sleep without holding it
+        with self._guard:
+            start_at = max(time.monotonic(), self._next_allowed.get(host, 0.0))
+            self._next_allowed[host] = start_at + self.delay
+        # Time until the slot comes up counts as queue wait of the traced scrape
+        with waiting():
+            wait = start_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        try:
+            yield
+        finally:
+            with self._guard:
+                self._next_allowed[host] = max(self._next_allowed[host], time.monotonic() + self.delay)
+
 class Collector:
-    def __init__(self, mock: bool = False):
+    def __init__(self, mock: bool = False, max_workers: int = COLLECT_MAX_WORKERS,
+                 host_delay: float = COLLECT_HOST_DELAY):
         self.firecrawl = FirecrawlClient(mock=mock)
         self.sources = SOURCES
+        self.max_workers = max(1, max_workers)
+        self.throttle = HostThrottle(host_delay)
+        # url -> seconds spent scraping (including politeness wait)
+        self.latencies: Dict[str, float] = {}
+        # upsert status ('new', 'changed', 'unchanged', ...) -> number of sources
+        self.change_counts: Counter = Counter()
+        self._counts_lock = threading.Lock()
+        # Ids already passed to on_document (two sources can resolve to the same page)
+        self._emitted: set = set()
+
+    def _build_record(self, source: Dict[str, Any], result) -> Dict[str, Any]:
+        url = source['url']
+
+        # result might be a dict (mock) or a Pydantic model (Firecrawl)
+        if isinstance(result, dict):
+            content = result.get('markdown') or result.get('content', '')
+            metadata = result.get('metadata', {})
+        else:
+            content = getattr(result, 'markdown', None) or getattr(result, 'content', '')
+            metadata = getattr(result, 'metadata', {})
+
+        if hasattr(metadata, 'dict'):
+            metadata = metadata.dict()
+        elif hasattr(metadata, 'model_dump'):
+            metadata = metadata.model_dump()
 
-    def run(self) -> List[int]:
+        # Fallbacks
+        if not isinstance(metadata, dict):
+            metadata = {}
+
+        title = metadata.get('title', 'Unknown Title')
+        source_url = metadata.get('sourceURL', url)
+
+        return {
+            'url': source_url,
+            'url_normalized': normalize_url(source_url),
+            'title': title,
+            'content_text': content,
+            'content_hash': compute_content_hash(content),
+            'extracted_date': datetime.now().isoformat(),
+            'source_type': source['source_type'],
+            'county': source['county']
+        }
+
+    def scrape_source(self, source: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
-        Runs the collection process for all sources.
-        Returns a list of raw_document_ids that were newly added.
+        Scrapes a single source and returns its raw_documents record, or None on failure.
         """
-        new_doc_ids = []
-        for source in self.sources:
-            url = source['url']
-            county = source['county']
-            source_type = source['source_type']
-            
-            logger.info(f"Collecting from {county} ({source_type}): {url}")
-            
-            # Simple scrape of the seed URL
-            # In a real app, this might crawl subpages or RSS feeds
+        url = source['url']
+        logger.info(f"Collecting from {source['county']} ({source['source_type']}): {url}")
+
+        # Simple scrape of the seed URL
+        # In a real app, this might crawl subpages or RSS feeds
+        start = time.monotonic()
+        with span("scrape", source=url), self.throttle.slot(url), external():
             result = self.firecrawl.scrape_url(url)
-            
-            if result:
-                 # result might be a dict (mock) or a Pydantic model (Firecrawl)
-                 if isinstance(result, dict):
-                     content = result.get('markdown') or result.get('content', '')
-                     metadata = result.get('metadata', {})
-                 else:
-                     # Basic normalize (Handle Pydantic object)
-                     content = getattr(result, 'markdown', None) or getattr(result, 'content', '')
-                     # Metadata might be an object or dict? Pydantic usually main fields.
-                     # Document has metadata field?
-                     metadata = getattr(result, 'metadata', {})
-                 
-                 if hasattr(metadata, 'dict'):
-                     metadata = metadata.dict()
-                 elif hasattr(metadata, 'model_dump'):
-                     metadata = metadata.model_dump()
-                 
-                 # Fallbacks
-                 if not isinstance(metadata, dict):
-                     metadata = {}
-
-                 title = metadata.get('title', 'Unknown Title')
-                 source_url = metadata.get('sourceURL', url)
-                 
-                 normalized_url = normalize_url(source_url)
-                 content_hash = compute_content_hash(content)
-                 
-                 doc_record = {
-                     'url': source_url,
-                     'url_normalized': normalized_url,
-                     'title': title,
-                     'content_text': content,
-                     'content_hash': content_hash,
-                     'extracted_date': datetime.now().isoformat(),
-                     'source_type': source_type,
-                     'county': county
-                 }
-                 
-                 # Insert into DB
-                 doc_id = crud.insert_raw_document(doc_record)
-                 if doc_id != -1:
-                     new_doc_ids.append(doc_id)
-            
-            # Be polite
-            time.sleep(1)
-            
-        return new_doc_ids
+        elapsed = time.monotonic() - start
+        self.latencies[url] = elapsed
+        logger.info(f"Scraped {url} in {elapsed:.2f}s")
+
+        if not result:
+            return None
+        return self._build_record(source, result)
+
+    def _keep(self, status: str) -> bool:
+        with self._counts_lock:
+            self.change_counts[status] += 1
+        return status not in ('unchanged', 'error')
+
+    def collect_source(self, source: Dict[str, Any],
+                       on_document: Optional[Callable[[int], None]] = None) -> Optional[int]:
+        """
+        Scrapes a single source and stores it right away.
+        Returns the raw_document_id if the page is new or its content changed, or None if
+        it is unchanged since it was last processed (or the scrape/insert failed).
+        If on_document is given it is called with the id as soon as the row is stored.
+        """
+        record = self.scrape_source(source)
+        if not record:
+            return None
+
+        doc_id, status = crud.upsert_raw_document(record)
+        if not self._keep(status):
+            return None
+        if on_document:
+            with self._counts_lock:
+                first = doc_id not in self._emitted
+                self._emitted.add(doc_id)
+            if first:
+                on_document(doc_id)
+        return doc_id
+
+    def _collect_host(self, sources: List[Dict[str, Any]],
+                      on_document: Optional[Callable[[int], None]] = None) -> List[Any]:
+        # One host's sources one after another, so a worker only ever waits on its own host's delay
+        outcomes = []
+        for source in sources:
+            try:
+                outcomes.append(self.collect_source(source, on_document) if on_document
+                                else self.scrape_source(source))
+            except Exception as e:
+                logger.error(f"Error collecting {source['url']}: {e}")
+                outcomes.append(None)
+        return outcomes
+
+    def run(self, on_document: Optional[Callable[[int], None]] = None) -> List[int]:
+        """
+        Runs the collection process for all hosts concurrently, the sources of each host in turn.
+        Returns a list of raw_document_ids that are new or changed, in source order.
+        on_document lets a caller stream ids downstream while collection is still running;
+        a blocking callback (e.g. a bounded Queue.put) throttles the scrapers. Without it,
+        all pages are written in a single bulk transaction once scraping is done.
+        """
+        start = time.monotonic()
+        by_host: Dict[str, List[int]] = {}
+        for index, source in enumerate(self.sources):
+            by_host.setdefault(_host(source['url']), []).append(index)
+        outcomes: List[Any] = [None] * len(self.sources)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._collect_host, [self.sources[i] for i in indices], on_document): indices
+                       for indices in by_host.values()}
+        for future, indices in futures.items():
+            for index, outcome in zip(indices, future.result()):
+                outcomes[index] = outcome
+
+        if on_document:
+            doc_ids = [doc_id for doc_id in outcomes if doc_id is not None]
+        else:
+            records = [record for record in outcomes if record]
+            doc_ids = [doc_id for doc_id, status in crud.upsert_raw_documents(records) if self._keep(status)]
+
+        if self.latencies:
+            slowest = max(self.latencies, key=self.latencies.get)
+            logger.info(
+                f"Collected {len(self.sources)} sources in {time.monotonic() - start:.2f}s "
+                f"(workers={self.max_workers}, slowest: {slowest} {self.latencies[slowest]:.2f}s)"
+            )
+        logger.info(f"Change detection: {dict(self.change_counts)}")
+        # Two sources resolving to the same page only need processing once
+        return list(dict.fromkeys(doc_ids))
 
 if __name__ == "__main__":
     c = Collector()
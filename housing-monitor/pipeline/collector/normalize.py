@@ -1,4 +1,8 @@
+import re
 import hashlib
+import numpy as np
+from collections import Counter
+from typing import List
 from urllib.parse import urlparse, urlunparse
 
 def normalize_url(url: str) -> str:
@@ -23,3 +27,47 @@ def compute_content_hash(content: str) -> str:
     if not content:
         return ""
     return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+# SimHash near-duplicate signatures
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"\w+")
+
+def _shingles(content: str) -> Counter:
+    words = _WORD.findall(content.lower())
+    if len(words) < SHINGLE_SIZE:
+        return Counter([" ".join(words)]) if words else Counter()
+    return Counter(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+def compute_simhash(content: str) -> int:
+    """
+    64-bit SimHash over word 3-gram shingles. Documents that differ only in a few
+    places get signatures a small Hamming distance apart. Returns 0 for empty content.
+    """
+    shingles = _shingles(content or "")
+    if not shingles:
+        return 0
+    # Every shingle of the document counts, so the per-bit sums run over arrays rather than in Python
+    hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+                       for shingle in shingles], dtype=np.uint64)
+    weights = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    simhash = 0
+    for bit in range(SIMHASH_BITS):
+        set_bits = ((hashes >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+        if 2 * int(weights[set_bits].sum()) > int(weights.sum()):
+            simhash |= 1 << bit
+    return simhash
+
+def simhash_bands(simhash: int) -> List[int]:
+    """
+    Splits the signature into SIMHASH_BANDS equal bands. Two signatures within
+    SIMHASH_BANDS - 1 bits of each other share at least one band exactly.
+    """
+    width = SIMHASH_BITS // SIMHASH_BANDS
+    mask = (1 << width) - 1
+    return [(simhash >> (band * width)) & mask for band in range(SIMHASH_BANDS)]
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
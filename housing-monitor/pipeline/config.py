@@ -19,13 +19,135 @@ if _sqlite_env:
         SQLITE_PATH = os.path.abspath(os.path.join(PROJECT_ROOT, _sqlite_env))
 else:
     SQLITE_PATH = os.path.abspath(os.path.join(PROJECT_ROOT, 'data/app.db'))
+# SQLite page cache per connection (KiB) and how long a writer waits on a locked database
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# Storage profile of each Qdrant collection (see pipeline/vector/collections.py):
+# default | scalar | binary | compact. Changing it needs scripts/migrate_collection.py
+KB_COLLECTION_PROFILE = os.getenv("KB_COLLECTION_PROFILE", "default")
+LEGISLATION_COLLECTION_PROFILE = os.getenv("LEGISLATION_COLLECTION_PROFILE", "default")
+
+def _data_path(env_name: str, default: str) -> str:
+    # Same resolution rules as SQLITE_PATH: absolute, or relative to project root
+    value = os.getenv(env_name, default)
+    if os.path.isabs(value):
+        return value
+    return os.path.abspath(os.path.join(PROJECT_ROOT, value))
+
+# Embeddings
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Dimension of the vectors stored and searched. text-embedding-3 vectors can be truncated
+# (Matryoshka) and re-normalized; the cache keeps full vectors. Changing it needs
+# scripts/reembed_collections.py
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "1536"))
+EMBEDDING_CACHE_PATH = _data_path("EMBEDDING_CACHE_PATH", "data/embedding_cache.db")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2048"))
+
+# LLM response cache (relevance / summarize)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = _data_path("LLM_CACHE_PATH", "data/llm_cache.db")
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
 
 # Pipeline Settings
 RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.70"))
+# Relevance model cascade: the small model decides unless its score lands within
+# RELEVANCE_UNCERTAINTY_BAND of RELEVANCE_THRESHOLD or its confidence is below RELEVANCE_MIN_CONFIDENCE
+RELEVANCE_CASCADE_ENABLED = os.getenv("RELEVANCE_CASCADE_ENABLED", "true").lower() == "true"
+RELEVANCE_SMALL_MODEL = os.getenv("RELEVANCE_SMALL_MODEL", "gpt-4o-mini")
+RELEVANCE_LARGE_MODEL = os.getenv("RELEVANCE_LARGE_MODEL", "gpt-4o")
+RELEVANCE_UNCERTAINTY_BAND = float(os.getenv("RELEVANCE_UNCERTAINTY_BAND", "0.15"))
+RELEVANCE_MIN_CONFIDENCE = float(os.getenv("RELEVANCE_MIN_CONFIDENCE", "0.6"))
 DEDUPE_SIM_THRESHOLD = float(os.getenv("DEDUPE_SIM_THRESHOLD", "0.90"))
+# Semantic dedupe only matches items from the same county (filtered, indexed Qdrant query)
+DEDUPE_SAME_COUNTY_ONLY = os.getenv("DEDUPE_SAME_COUNTY_ONLY", "true").lower() == "true"
+# Local SimHash near-duplicate tier, checked before the embedding/Qdrant semantic check.
+# The 4-band index only guarantees candidates up to a distance of 3 bits.
+NEAR_DUPE_ENABLED = os.getenv("NEAR_DUPE_ENABLED", "true").lower() == "true"
+NEAR_DUPE_MAX_DISTANCE = int(os.getenv("NEAR_DUPE_MAX_DISTANCE", "3"))
 SCRAPE_MAX_PAGES_PER_SOURCE = int(os.getenv("SCRAPE_MAX_PAGES_PER_SOURCE", "30"))
 
+# Lexical prefilter ahead of the LLM relevance classifier
+# PREFILTER_MODE: 'enforce' skips the LLM below the threshold, 'measure' only records what it would skip, 'off'.
+# Defaults to 'measure' until PREFILTER_MIN_SCORE has been calibrated with scripts/eval_prefilter.py
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "measure").lower()
+PREFILTER_MIN_SCORE = float(os.getenv("PREFILTER_MIN_SCORE", "1.5"))
+KB_DIR = os.path.abspath(os.path.join(PROJECT_ROOT, 'kb'))
+# KB retrieval backend: 'memory' loads kb_chunks once and searches with NumPy, 'qdrant' queries per document
+KB_RETRIEVER_BACKEND = os.getenv("KB_RETRIEVER_BACKEND", "memory").lower()
+# Retrieved KB context is cached per query (LRU, 0 disables). A query whose vector is within this
+# cosine distance of a cached one reuses its context (0 = exact query text only)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TOLERANCE = float(os.getenv("RETRIEVAL_CACHE_TOLERANCE", "0.02"))
+
+# Long documents are split into section-aware chunks (markdown headings) of at most this many chars.
+# Relevance runs on up to RELEVANCE_MAX_CHUNKS chunks per document (best lexical score first,
+# RELEVANCE_CHUNK_WORKERS at a time) and stops at the first confidently relevant one
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "3000"))
+RELEVANCE_MAX_CHUNKS = int(os.getenv("RELEVANCE_MAX_CHUNKS", "8"))
+RELEVANCE_CHUNK_WORKERS = int(os.getenv("RELEVANCE_CHUNK_WORKERS", "4"))
+# Batched relevance (graph batch runs only): short single-chunk documents (at most
+# RELEVANCE_BATCH_DOC_TOKENS) waiting at the classify step are sent in one request of up to
+# RELEVANCE_BATCH_SIZE documents, or whatever has arrived after RELEVANCE_BATCH_WAIT_MS.
+# Batches can't exceed the number of graph workers; 1 disables batching
+RELEVANCE_BATCH_SIZE = int(os.getenv("RELEVANCE_BATCH_SIZE", "8"))
+RELEVANCE_BATCH_WAIT_MS = int(os.getenv("RELEVANCE_BATCH_WAIT_MS", "250"))
+RELEVANCE_BATCH_DOC_TOKENS = int(os.getenv("RELEVANCE_BATCH_DOC_TOKENS", "600"))
+RELEVANCE_BATCH_PROMPT_TOKENS = int(os.getenv("RELEVANCE_BATCH_PROMPT_TOKENS", "8000"))
+
+# Token budget of one rendered prompt (tiktoken count); the document text is cut to what the
+# rest of the prompt leaves. LLM_MAX_RETRIES retries per call, with backoff, after a failure
+RELEVANCE_PROMPT_TOKENS = int(os.getenv("RELEVANCE_PROMPT_TOKENS", "2500"))
+SUMMARIZE_PROMPT_TOKENS = int(os.getenv("SUMMARIZE_PROMPT_TOKENS", "3000"))
+# Cap on the completion of one call (max_tokens); OpenAI counts it against OPENAI_TPM up front,
+# so the rate limiter reserves prompt + max_tokens per call
+RELEVANCE_MAX_TOKENS = int(os.getenv("RELEVANCE_MAX_TOKENS", "300"))
+RELEVANCE_BATCH_MAX_TOKENS = int(os.getenv("RELEVANCE_BATCH_MAX_TOKENS", "1500"))
+SUMMARIZE_MAX_TOKENS = int(os.getenv("SUMMARIZE_MAX_TOKENS", "800"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# --batch-api: LLM requests that miss the response cache are collected into JSONL jobs run by
+# BATCH_API_BACKEND ('openai' Batch API, or 'local' which answers the file directly), and the
+# graph is re-run from the cached answers. Up to BATCH_API_MAX_ROUNDS jobs per run
+# (relevance, escalation, summaries); documents still waiting after that are called directly
+BATCH_API_BACKEND = os.getenv("BATCH_API_BACKEND", "openai").lower()
+BATCH_API_DIR = _data_path("BATCH_API_DIR", "data/batch_jobs")
+BATCH_API_POLL_SECONDS = float(os.getenv("BATCH_API_POLL_SECONDS", "60"))
+BATCH_API_MAX_WAIT_HOURS = float(os.getenv("BATCH_API_MAX_WAIT_HOURS", "24"))
+BATCH_API_MAX_ROUNDS = int(os.getenv("BATCH_API_MAX_ROUNDS", "4"))
+
+# Collector concurrency
+# Global cap on in-flight scrapes, and minimum spacing between requests to the same host
+COLLECT_MAX_WORKERS = int(os.getenv("COLLECT_MAX_WORKERS", "8"))
+COLLECT_HOST_DELAY = float(os.getenv("COLLECT_HOST_DELAY", "1.0"))
+
+# Graph execution
+# Number of concurrent graph workers, and how many collected ids may wait for them in streaming mode
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "16"))
+# Processed items are buffered and written (SQLite + Qdrant) in batches of this size
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "20"))
+# Vectors of the relevant, new items of each persist batch are embedded and upserted to Qdrant
+# with it, at most this many per request
+# With QDRANT_UPSERT_WAIT=false upserts return before Qdrant applies them (errors surface in Qdrant logs only)
+VECTOR_BATCH_SIZE = int(os.getenv("VECTOR_BATCH_SIZE", "64"))
+QDRANT_UPSERT_WAIT = os.getenv("QDRANT_UPSERT_WAIT", "true").lower() == "true"
+
+# Stage metrics
+# Wall, external-call and queue-wait time of every graph node and scrape go to stage_metrics.
+# With METRICS_EXPORT_PATH set, each run also writes its per-stage p50/p95/max there, as
+# METRICS_EXPORT_FORMAT 'prometheus' (text exposition, e.g. for a node_exporter textfile) or 'json'
+STAGE_METRICS_ENABLED = os.getenv("STAGE_METRICS_ENABLED", "true").lower() == "true"
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH", "")
+METRICS_EXPORT_FORMAT = os.getenv("METRICS_EXPORT_FORMAT", "prometheus").lower()
+
+# OpenAI rate budgets shared by all graph workers (0 disables a limit)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+OPENAI_EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+OPENAI_EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+
 # Sources (ONLY for now, would be in a YAML or DB)
 SOURCES = [
     {
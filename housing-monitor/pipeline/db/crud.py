@@ -1,121 +1,718 @@
 import sqlite3
 import json
 import logging
-from typing import Dict, Any, List, Optional
-from pipeline.config import SQLITE_PATH
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from pipeline.config import SQLITE_PATH, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+from pipeline.collector.normalize import simhash_bands
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    conn = sqlite3.connect(SQLITE_PATH)
+# One long-lived connection per thread (graph workers, collector threads, the main thread)
+_local = threading.local()
+
+# SQLite caps the number of bound parameters per statement
+_IN_BATCH = 500
+
+_RAW_DOCUMENT_COLUMNS = ('url', 'url_normalized', 'title', 'content_text', 'content_hash',
+                         'extracted_date', 'source_type', 'county')
+
+# Checkpoint stages of a document in pipeline_state, in pipeline order, with the
+# runs column counting the documents that completed each one
+QUEUED_STAGE = 'queued'
+PERSIST_STAGE = 'persist'
+RUN_PROGRESS_COLUMNS = {
+    QUEUED_STAGE: 'docs_total',
+    'prefilter': 'docs_prefiltered',
+    'chunk': 'docs_chunked',
+    'classify': 'docs_classified',
+    'dedupe': 'docs_deduped',
+    'summarize': 'docs_summarized',
+    PERSIST_STAGE: 'docs_persisted',
+}
+PIPELINE_STAGES = list(RUN_PROGRESS_COLUMNS)
+
+_ITEM_COLUMNS = ('raw_document_id', 'title', 'summary', 'heading', 'key_points', 'impacted_parties',
+                 'important_dates', 'source_link', 'date_posted', 'ai_confidence', 'is_relevant',
+                 'relevance_score', 'relevance_rationale', 'topics', 'is_new', 'dedup_reason',
+                 'matched_item_id', 'error')
+
+# All statements live in *_SQL constants so scripts/check_query_plans.py can EXPLAIN each of them.
+# '{placeholders}' is filled with one '?' per value of an IN list.
+INSERT_RAW_DOCUMENT_SQL = f'''
+    INSERT OR IGNORE INTO raw_documents
+    ({", ".join(_RAW_DOCUMENT_COLUMNS)})
+    VALUES ({", ".join("?" * len(_RAW_DOCUMENT_COLUMNS))})
+'''
+
+INSERT_NEW_RAW_DOCUMENT_SQL = f'''
+    INSERT INTO raw_documents
+    ({", ".join(_RAW_DOCUMENT_COLUMNS)}, last_changed_at)
+    VALUES ({", ".join("?" * len(_RAW_DOCUMENT_COLUMNS))}, CURRENT_TIMESTAMP)
+    ON CONFLICT(url_normalized) DO NOTHING
+'''
+
+SELECT_RAW_DOCUMENT_ID_BY_URL_SQL = 'SELECT id FROM raw_documents WHERE url_normalized = ?'
+
+SELECT_RAW_DOCUMENTS_BY_URLS_SQL = '''
+    SELECT id, url_normalized, content_hash FROM raw_documents
+    WHERE url_normalized IN ({placeholders})
+'''
+
+UPDATE_CHANGED_RAW_DOCUMENT_SQL = '''
+    UPDATE raw_documents
+    SET url = ?, title = ?, content_text = ?, content_hash = ?, extracted_date = ?,
+        source_type = ?, county = ?, scraped_at = CURRENT_TIMESTAMP, last_changed_at = CURRENT_TIMESTAMP
+    WHERE url_normalized = ?
+'''
+
+TOUCH_RAW_DOCUMENT_SQL = 'UPDATE raw_documents SET scraped_at = CURRENT_TIMESTAMP WHERE id = ?'
+
+# Unchanged content only counts as done if an item was produced since the last change
+# without a failed LLM call
+SELECT_PROCESSED_SINCE_CHANGE_SQL = '''
+    SELECT DISTINCT r.id FROM items i
+    JOIN raw_documents r ON i.raw_document_id = r.id
+    WHERE r.id IN ({placeholders})
+      AND (r.last_changed_at IS NULL OR i.processed_at >= r.last_changed_at)
+      AND i.error IS NULL
+'''
+
+SELECT_RAW_DOCUMENT_SQL = 'SELECT * FROM raw_documents WHERE id = ?'
+
+# Source text of indexed items, for re-embedding the legislation collection
+SELECT_ITEM_CONTENTS_SQL = '''
+    SELECT i.id, r.content_text FROM items i
+    JOIN raw_documents r ON i.raw_document_id = r.id
+    WHERE i.id IN ({placeholders})
+'''
+
+INSERT_ITEM_SQL = f'''
+    INSERT INTO items
+    ({", ".join(_ITEM_COLUMNS)})
+    VALUES ({", ".join("?" * len(_ITEM_COLUMNS))})
+'''
+
+INSERT_SIMHASH_SQL = '''
+    INSERT OR REPLACE INTO simhash_index (item_id, raw_document_id, simhash, band0, band1, band2, band3)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Relevant items without a SimHash signature (persisted before the near-duplicate tier existed)
+SELECT_ITEMS_MISSING_SIMHASH_SQL = '''
+    SELECT i.id, i.raw_document_id, r.content_text
+    FROM items i
+    JOIN raw_documents r ON i.raw_document_id = r.id
+    LEFT JOIN simhash_index s ON s.item_id = i.id
+    WHERE i.is_relevant = 1 AND i.error IS NULL AND s.item_id IS NULL AND r.content_text IS NOT NULL
+'''
+
+INSERT_RUN_SQL = '''
+    INSERT INTO runs (status, items_processed, items_relevant, items_new, error_log)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+START_RUN_SQL = "INSERT INTO runs (status) VALUES ('running')"
+
+FINISH_RUN_SQL = '''
+    UPDATE runs SET status = ?, items_processed = ?, items_relevant = ?, items_new = ?, error_log = ?,
+        llm_calls = ?, prompt_tokens = ?, completion_tokens = ?, llm_cost_usd = ?,
+        llm_latency_p50_ms = ?, llm_latency_p95_ms = ?, finished_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+REOPEN_RUN_SQL = "UPDATE runs SET status = 'running', finished_at = NULL WHERE id = ?"
+
+SELECT_RUN_SQL = 'SELECT * FROM runs WHERE id = ?'
+
+LATEST_RUN_ID_SQL = 'SELECT MAX(id) FROM runs'
+
+INSERT_LLM_CALL_SQL = '''
+    INSERT INTO llm_calls (run_id, raw_document_id, stage, model, prompt_tokens, completion_tokens,
+                           latency_ms, retries, cached, cost_usd, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Calls that reached the API (cache hits cost nothing and would skew latency)
+RUN_LLM_CALLS_SQL = '''
+    SELECT stage, prompt_tokens, completion_tokens, latency_ms, cost_usd
+    FROM llm_calls
+    WHERE run_id = ? AND cached = 0
+'''
+
+UPSERT_CHECKPOINT_SQL = '''
+    INSERT INTO pipeline_state (run_id, raw_document_id, stage, doc_state)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(run_id, raw_document_id, stage)
+    DO UPDATE SET doc_state = excluded.doc_state, updated_at = CURRENT_TIMESTAMP
+'''
+
+SELECT_RUN_CHECKPOINTS_SQL = '''
+    SELECT raw_document_id, stage, doc_state FROM pipeline_state
+    WHERE run_id = ?
+'''
+
+SELECT_DOCUMENT_CHECKPOINTS_SQL = '''
+    SELECT raw_document_id, stage, doc_state FROM pipeline_state
+    WHERE run_id = ? AND raw_document_id = ?
+'''
+
+# Item counters of a run from what it actually persisted: the first item written for each
+# document with a 'persist' row, since the runs row only gets them when the run finishes
+RUN_ITEM_COUNTS_SQL = '''
+    SELECT COUNT(*) AS items_processed,
+           COALESCE(SUM(i.is_relevant = 1), 0) AS items_relevant,
+           COALESCE(SUM(i.is_new = 1), 0) AS items_new
+    FROM items i
+    WHERE i.id IN (
+        SELECT MIN(i2.id)
+        FROM pipeline_state ps
+        JOIN runs r ON r.id = ps.run_id
+        JOIN items i2 ON i2.raw_document_id = ps.raw_document_id AND i2.processed_at >= r.run_at
+        WHERE ps.run_id = ? AND ps.stage = 'persist'
+        GROUP BY ps.raw_document_id
+    )
+'''
+
+RUN_PROGRESS_SQL = '''
+    SELECT stage, COUNT(*) AS docs FROM pipeline_state
+    WHERE run_id = ?
+    GROUP BY stage
+'''
+
+UPDATE_RUN_PROGRESS_SQL = '''
+    UPDATE runs SET docs_total = ?, docs_prefiltered = ?, docs_chunked = ?, docs_classified = ?,
+        docs_deduped = ?, docs_summarized = ?, docs_persisted = ?
+    WHERE id = ?
+'''
+
+# Snapshots are only needed to resume; a successful run keeps just its stage rows
+CLEAR_RUN_SNAPSHOTS_SQL = 'UPDATE pipeline_state SET doc_state = NULL WHERE run_id = ?'
+
+INSERT_STAGE_METRIC_SQL = '''
+    INSERT INTO stage_metrics (run_id, raw_document_id, stage, source, wall_ms, external_ms, queue_wait_ms, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+RUN_STAGE_METRICS_SQL = '''
+    SELECT stage, wall_ms, external_ms, queue_wait_ms, status
+    FROM stage_metrics
+    WHERE run_id = ?
+'''
+
+# Join with raw_documents to get source info like county
+LATEST_ITEMS_SQL = '''
+    SELECT i.*, r.county
+    FROM items i
+    LEFT JOIN raw_documents r ON i.raw_document_id = r.id
+    ORDER BY i.processed_at DESC LIMIT ?
+'''
+
+LATEST_RELEVANT_ITEMS_SQL = '''
+    SELECT i.*, r.county
+    FROM items i
+    LEFT JOIN raw_documents r ON i.raw_document_id = r.id
+    WHERE i.is_relevant = 1
+    ORDER BY i.processed_at DESC LIMIT ?
+'''
+
+# Trends page: every processed item with its county
+TRENDS_SQL = '''
+    SELECT r.county, i.processed_at, i.is_relevant
+    FROM items i
+    JOIN raw_documents r ON i.raw_document_id = r.id
+'''
+
+def _configure(conn: sqlite3.Connection) -> sqlite3.Connection:
     conn.row_factory = sqlite3.Row
+    # WAL lets the UI read while the pipeline writes; with synchronous=NORMAL a commit
+    # no longer fsyncs, only WAL checkpoints do
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    return conn
+
+def get_db_connection():
+    """
+    Opens a new, tuned connection owned (and closed) by the caller.
+    """
+    return _configure(sqlite3.connect(SQLITE_PATH))
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Returns this thread's shared connection, opening it on first use. Do not close it.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = get_db_connection()
+        _local.conn = conn
+        _local.depth = 0
     return conn
 
+@contextmanager
+def transaction():
+    """
+    Runs the block in a single transaction on the thread's connection.
+    Nested blocks join the outer transaction; only the outermost one commits.
+    """
+    conn = get_connection()
+    _local.depth += 1
+    try:
+        yield conn
+        if _local.depth == 1:
+            conn.commit()
+    except Exception:
+        if _local.depth == 1:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth -= 1
+
+def close_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _raw_document_params(doc: Dict[str, Any]) -> tuple:
+    return (
+        doc['url'],
+        doc['url_normalized'],
+        doc.get('title'),
+        doc.get('content_text'),
+        doc.get('content_hash'),
+        doc.get('extracted_date'),
+        doc.get('source_type'),
+        doc.get('county')
+    )
+
+def item_error(item: Dict[str, Any]) -> Optional[str]:
+    """
+    Error of the relevance (error) or summarize (error_summary) call the item went through, if any.
+    """
+    return item.get('error') or item.get('error_summary')
+
+def _item_params(item: Dict[str, Any]) -> tuple:
+    return (
+        item.get('raw_document_id'),
+        item.get('title'),
+        item.get('summary'),
+        item.get('heading'),
+        json.dumps(item.get('key_points', [])),
+        json.dumps(item.get('impacted_parties', [])),
+        json.dumps(item.get('important_dates', [])),
+        item.get('source_link'),
+        item.get('date_posted'),
+        item.get('ai_confidence'),
+        item.get('is_relevant'),
+        item.get('relevance_score'),
+        item.get('relevance_rationale'),
+        json.dumps(item.get('topics', [])),
+        item.get('is_new'),
+        item.get('dedup_reason'),
+        item.get('matched_item_id'),
+        item_error(item)
+    )
+
 def insert_raw_document(doc: Dict[str, Any]) -> int:
-    conn = get_db_connection()
-    c = conn.cursor()
     try:
-        c.execute('''
-            INSERT OR IGNORE INTO raw_documents 
-            (url, url_normalized, title, content_text, content_hash, extracted_date, source_type, county)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            doc['url'],
-            doc['url_normalized'],
-            doc.get('title'),
-            doc.get('content_text'),
-            doc.get('content_hash'),
-            doc.get('extracted_date'),
-            doc.get('source_type'),
-            doc.get('county')
-        ))
-        conn.commit()
-        # Get ID (if ignored, we might need to fetch it, but usually we just skip processing)
-        if c.rowcount == 0:
-            # It existed
-            c.execute('SELECT id FROM raw_documents WHERE url_normalized = ?', (doc['url_normalized'],))
-            row = c.fetchone()
-            return row['id']
-        return c.lastrowid
+        with transaction() as conn:
+            c = conn.execute(INSERT_RAW_DOCUMENT_SQL, _raw_document_params(doc))
+            # Get ID (if ignored, we might need to fetch it, but usually we just skip processing)
+            if c.rowcount == 0:
+                # It existed
+                row = conn.execute(SELECT_RAW_DOCUMENT_ID_BY_URL_SQL, (doc['url_normalized'],)).fetchone()
+                return row['id']
+            return c.lastrowid
     except Exception as e:
         logger.error(f"Error inserting raw document: {e}")
         return -1
-    finally:
-        conn.close()
+
+def upsert_raw_document(doc: Dict[str, Any]) -> Tuple[int, str]:
+    """
+    Stores a freshly scraped page, comparing its content_hash with the stored one.
+    Returns (raw_document_id, status) where status is:
+      'new'         - first time this URL was seen
+      'changed'     - content differs from the stored copy (row updated, last_changed_at bumped)
+      'unprocessed' - content unchanged but no item was produced for it yet (e.g. a crashed run),
+                      or only items whose relevance/summarize call failed
+      'unchanged'   - content unchanged and already processed; only scraped_at is bumped
+    Returns (-1, 'error') on failure.
+    """
+    results = upsert_raw_documents([doc])
+    return results[0]
+
+def upsert_raw_documents(docs: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+    """
+    Bulk version of upsert_raw_document: one transaction and one executemany per kind
+    of write. Returns (raw_document_id, status) per input doc, in order.
+    """
+    if not docs:
+        return []
+    try:
+        with transaction() as conn:
+            # Take the write lock before the lookup: concurrent --stream scrapers upsert one page
+            # each, and two of them resolving to the same URL must not both see it as new
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            urls = list(dict.fromkeys(doc['url_normalized'] for doc in docs))
+            existing = _fetch_by_url(conn, urls)
+
+            new_docs, changed, unchanged = {}, [], []
+            for doc in docs:
+                url = doc['url_normalized']
+                row = existing.get(url)
+                if row is None:
+                    # Later duplicates of the same URL in this batch are treated as that new row
+                    new_docs.setdefault(url, doc)
+                elif row['content_hash'] != doc.get('content_hash'):
+                    changed.append(doc)
+                else:
+                    unchanged.append(row['id'])
+
+            if new_docs:
+                conn.executemany(INSERT_NEW_RAW_DOCUMENT_SQL,
+                                 [_raw_document_params(doc) for doc in new_docs.values()])
+            if changed:
+                conn.executemany(UPDATE_CHANGED_RAW_DOCUMENT_SQL, [(doc['url'], doc.get('title'), doc.get('content_text'), doc.get('content_hash'),
+                       doc.get('extracted_date'), doc.get('source_type'), doc.get('county'),
+                       doc['url_normalized']) for doc in changed])
+            if unchanged:
+                conn.executemany(TOUCH_RAW_DOCUMENT_SQL, [(doc_id,) for doc_id in unchanged])
+
+            inserted = _fetch_by_url(conn, list(new_docs)) if new_docs else {}
+            processed = _processed_since_change(conn, unchanged)
+
+        results = []
+        changed_urls = {doc['url_normalized'] for doc in changed}
+        for doc in docs:
+            url = doc['url_normalized']
+            if url in new_docs:
+                results.append((inserted[url]['id'], 'new'))
+            elif url in changed_urls:
+                results.append((existing[url]['id'], 'changed'))
+            else:
+                doc_id = existing[url]['id']
+                results.append((doc_id, 'unchanged' if doc_id in processed else 'unprocessed'))
+        return results
+    except Exception as e:
+        logger.error(f"Error upserting raw documents: {e}")
+        return [(-1, 'error')] * len(docs)
+
+def _fetch_by_url(conn: sqlite3.Connection, urls: List[str]) -> Dict[str, sqlite3.Row]:
+    rows = {}
+    for start in range(0, len(urls), _IN_BATCH):
+        batch = urls[start:start + _IN_BATCH]
+        sql = SELECT_RAW_DOCUMENTS_BY_URLS_SQL.format(placeholders=",".join("?" * len(batch)))
+        for row in conn.execute(sql, batch):
+            rows[row['url_normalized']] = row
+    return rows
+
+def _processed_since_change(conn: sqlite3.Connection, doc_ids: List[int]) -> set:
+    done = set()
+    for start in range(0, len(doc_ids), _IN_BATCH):
+        batch = doc_ids[start:start + _IN_BATCH]
+        sql = SELECT_PROCESSED_SINCE_CHANGE_SQL.format(placeholders=",".join("?" * len(batch)))
+        for row in conn.execute(sql, batch):
+            done.add(row['id'])
+    return done
+
+def get_raw_document(doc_id: int) -> Optional[Dict[str, Any]]:
+    row = get_connection().execute(SELECT_RAW_DOCUMENT_SQL, (doc_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_item_contents(item_ids: List[int]) -> Dict[int, str]:
+    conn = get_connection()
+    contents = {}
+    for start in range(0, len(item_ids), _IN_BATCH):
+        batch = item_ids[start:start + _IN_BATCH]
+        sql = SELECT_ITEM_CONTENTS_SQL.format(placeholders=",".join("?" * len(batch)))
+        for row in conn.execute(sql, batch):
+            contents[row['id']] = row['content_text']
+    return contents
 
 def insert_processed_item(item: Dict[str, Any]) -> int:
-    conn = get_db_connection()
-    c = conn.cursor()
+    ids = insert_processed_items([item])
+    return ids[0] if ids else -1
+
+def to_signed64(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def from_signed64(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+def _simhash_params(item_id: int, item: Dict[str, Any]) -> tuple:
+    simhash = item['simhash']
+    return (item_id, item.get('raw_document_id'), to_signed64(simhash), *simhash_bands(simhash))
+
+def get_items_missing_simhash() -> List[Dict[str, Any]]:
+    """
+    Relevant items with no SimHash signature yet, with their raw document's content_text.
+    """
+    return [dict(row) for row in get_connection().execute(SELECT_ITEMS_MISSING_SIMHASH_SQL)]
+
+def insert_simhashes(items: List[Dict[str, Any]]) -> int:
+    """
+    Stores the SimHash signatures of existing items ({'id', 'raw_document_id', 'simhash'}).
+    Items whose signature is 0 (no text to hash) are skipped. Returns the number stored.
+    """
+    params = [_simhash_params(item['id'], item) for item in items if item.get('simhash')]
+    with transaction() as conn:
+        conn.executemany(INSERT_SIMHASH_SQL, params)
+    return len(params)
+
+def insert_processed_items(items: List[Dict[str, Any]]) -> List[int]:
+    """
+    Inserts many items with one executemany in one transaction, along with the
+    SimHash signatures of items that carry one (unless their LLM calls failed, so later
+    documents are never matched against them) and the 'persist' checkpoint of items
+    that carry a run_id (so a resumed run never persists a document twice).
+    Returns the new item ids in input order, or [] on failure.
+    """
+    if not items:
+        return []
     try:
-        c.execute('''
-            INSERT INTO items 
-            (raw_document_id, title, summary, heading, key_points, impacted_parties, important_dates, 
-             source_link, date_posted, ai_confidence, is_relevant, relevance_score, relevance_rationale, 
-             topics, is_new, dedup_reason, matched_item_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            item.get('raw_document_id'),
-            item.get('title'),
-            item.get('summary'),
-            item.get('heading'),
-            json.dumps(item.get('key_points', [])),
-            json.dumps(item.get('impacted_parties', [])),
-            json.dumps(item.get('important_dates', [])),
-            item.get('source_link'),
-            item.get('date_posted'),
-            item.get('ai_confidence'),
-            item.get('is_relevant'),
-            item.get('relevance_score'),
-            item.get('relevance_rationale'),
-            json.dumps(item.get('topics', [])),
-            item.get('is_new'),
-            item.get('dedup_reason'),
-            item.get('matched_item_id')
-        ))
-        conn.commit()
-        return c.lastrowid
+        with transaction() as conn:
+            # Take the write lock up front so the AUTOINCREMENT ids below are contiguous
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(INSERT_ITEM_SQL, [_item_params(item) for item in items])
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            ids = list(range(last_id - len(items) + 1, last_id + 1))
+            conn.executemany(INSERT_SIMHASH_SQL, [_simhash_params(item_id, item)
+                                                  for item_id, item in zip(ids, items)
+                                                  if item.get('simhash') and not item_error(item)])
+            conn.executemany(UPSERT_CHECKPOINT_SQL, [(item['run_id'], item['raw_document_id'], PERSIST_STAGE, None)
+                                                     for item in items if item.get('run_id') is not None])
+        return ids
     except Exception as e:
-        logger.error(f"Error inserting processed item: {e}")
-        return -1
-    finally:
-        conn.close()
+        logger.error(f"Error inserting processed items: {e}")
+        return []
 
 def log_run(status: str, stats: Dict[str, Any]):
-    conn = get_db_connection()
-    c = conn.cursor()
     try:
-        c.execute('''
-            INSERT INTO runs (status, items_processed, items_relevant, items_new, error_log)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            status,
-            stats.get('items_processed', 0),
-            stats.get('items_relevant', 0),
-            stats.get('items_new', 0),
-            stats.get('error_log', '')
-        ))
-        conn.commit()
+        with transaction() as conn:
+            conn.execute(INSERT_RUN_SQL, (
+                status,
+                stats.get('items_processed', 0),
+                stats.get('items_relevant', 0),
+                stats.get('items_new', 0),
+                stats.get('error_log', '')
+            ))
     except Exception as e:
         logger.error(f"Error logging run: {e}")
-    finally:
-        conn.close()
-        
+
+def start_run() -> Optional[int]:
+    """
+    Opens a 'running' row in runs; its id tags the run's LLM calls.
+    """
+    try:
+        with transaction() as conn:
+            return conn.execute(START_RUN_SQL).lastrowid
+    except Exception as e:
+        logger.error(f"Error starting run: {e}")
+        return None
+
+def finish_run(run_id: Optional[int], status: str, stats: Dict[str, Any]):
+    """
+    Closes a run opened by start_run with its counters and LLM totals (see get_run_llm_summary).
+    """
+    if run_id is None:
+        log_run(status, stats)
+        return
+    try:
+        with transaction() as conn:
+            conn.execute(FINISH_RUN_SQL, (
+                status,
+                stats.get('items_processed', 0),
+                stats.get('items_relevant', 0),
+                stats.get('items_new', 0),
+                stats.get('error_log', ''),
+                stats.get('llm_calls', 0),
+                stats.get('llm_prompt_tokens', 0),
+                stats.get('llm_completion_tokens', 0),
+                stats.get('llm_cost_usd', 0.0),
+                stats.get('llm_latency_p50_ms'),
+                stats.get('llm_latency_p95_ms'),
+                run_id
+            ))
+    except Exception as e:
+        logger.error(f"Error finishing run {run_id}: {e}")
+
+def reopen_run(run_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Marks an earlier run as running again for --resume. Returns its row, or None if it doesn't exist.
+    """
+    with transaction() as conn:
+        row = conn.execute(SELECT_RUN_SQL, (run_id,)).fetchone()
+        if row is None:
+            return None
+        conn.execute(REOPEN_RUN_SQL, (run_id,))
+    return dict(row)
+
+def _snapshot(doc: Dict[str, Any]) -> str:
+    # The source text stays in raw_documents, and chunk texts are re-split from it on resume
+    # (DocumentChunker.restore); everything else the later stages read is kept
+    state = {k: v for k, v in doc.items() if k != 'content_text'}
+    if state.get('chunks'):
+        state['chunks'] = [{k: v for k, v in chunk.items() if k != 'text'} for chunk in state['chunks']]
+    return json.dumps(state, default=str)
+
+def save_checkpoint(run_id: int, raw_document_id: int, stage: str, doc: Optional[Dict[str, Any]] = None):
+    """
+    Records that the document completed `stage` in the run, with its state after that stage.
+    A failed write only costs redoing the stage on resume, so it is logged, not raised.
+    """
+    try:
+        with transaction() as conn:
+            conn.execute(UPSERT_CHECKPOINT_SQL, (run_id, raw_document_id, stage,
+                                                 _snapshot(doc) if doc is not None else None))
+    except Exception as e:
+        logger.error(f"Error saving '{stage}' checkpoint of document {raw_document_id}: {e}")
+
+def _latest_checkpoints(rows) -> Dict[int, Tuple[str, Optional[Dict[str, Any]]]]:
+    order = {stage: i for i, stage in enumerate(PIPELINE_STAGES)}
+    latest: Dict[int, Tuple[str, Optional[str]]] = {}
+    for row in rows:
+        current = latest.get(row['raw_document_id'])
+        if current is None or order.get(row['stage'], -1) > order.get(current[0], -1):
+            latest[row['raw_document_id']] = (row['stage'], row['doc_state'])
+    return {doc_id: (stage, json.loads(state) if state else None) for doc_id, (stage, state) in latest.items()}
+
+def get_run_checkpoints(run_id: int) -> Dict[int, Tuple[str, Optional[Dict[str, Any]]]]:
+    """
+    {raw_document_id: (latest completed stage, document state after it)} for the run's documents.
+    """
+    return _latest_checkpoints(get_connection().execute(SELECT_RUN_CHECKPOINTS_SQL, (run_id,)))
+
+def get_document_checkpoint(run_id: int, raw_document_id: int) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+    rows = get_connection().execute(SELECT_DOCUMENT_CHECKPOINTS_SQL, (run_id, raw_document_id))
+    return _latest_checkpoints(rows).get(raw_document_id)
+
+def get_run_item_counts(run_id: int) -> Dict[str, int]:
+    """
+    items_processed / items_relevant / items_new of the items the run has persisted so far.
+    """
+    return dict(get_connection().execute(RUN_ITEM_COUNTS_SQL, (run_id,)).fetchone())
+
+def update_run_progress(run_id: Optional[int]) -> Dict[str, int]:
+    """
+    Copies the per-stage document counts of pipeline_state into the run's docs_* columns.
+    """
+    if run_id is None:
+        return {}
+    try:
+        with transaction() as conn:
+            counts = {row['stage']: row['docs'] for row in conn.execute(RUN_PROGRESS_SQL, (run_id,))}
+            conn.execute(UPDATE_RUN_PROGRESS_SQL, (*(counts.get(stage, 0) for stage in PIPELINE_STAGES), run_id))
+        return {column: counts.get(stage, 0) for stage, column in RUN_PROGRESS_COLUMNS.items()}
+    except Exception as e:
+        logger.error(f"Error updating progress of run {run_id}: {e}")
+        return {}
+
+def clear_run_snapshots(run_id: int):
+    try:
+        with transaction() as conn:
+            conn.execute(CLEAR_RUN_SNAPSHOTS_SQL, (run_id,))
+    except Exception as e:
+        logger.error(f"Error clearing checkpoints of run {run_id}: {e}")
+
+def insert_llm_call(call: Dict[str, Any]):
+    try:
+        with transaction() as conn:
+            conn.execute(INSERT_LLM_CALL_SQL, (
+                call.get('run_id'),
+                call.get('raw_document_id'),
+                call['stage'],
+                call['model'],
+                call.get('prompt_tokens'),
+                call.get('completion_tokens'),
+                call.get('latency_ms'),
+                call.get('retries', 0),
+                call.get('cached', False),
+                call.get('cost_usd'),
+                call.get('status')
+            ))
+    except Exception as e:
+        logger.error(f"Error recording LLM call: {e}")
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    # Nearest-rank percentile; None when there is nothing to rank
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))], 1)
+
+def get_run_llm_summary(run_id: int) -> Dict[str, Any]:
+    """
+    Totals of the API calls made in a run, overall and per stage:
+    calls, prompt/completion tokens, cost and p50/p95 latency (ms).
+    """
+    rows = get_connection().execute(RUN_LLM_CALLS_SQL, (run_id,)).fetchall()
+    groups: Dict[str, List[sqlite3.Row]] = {"all": list(rows)}
+    for row in rows:
+        groups.setdefault(row['stage'], []).append(row)
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = [row['latency_ms'] for row in group if row['latency_ms'] is not None]
+        summary[name] = {
+            "calls": len(group),
+            "prompt_tokens": sum(row['prompt_tokens'] or 0 for row in group),
+            "completion_tokens": sum(row['completion_tokens'] or 0 for row in group),
+            "cost_usd": round(sum(row['cost_usd'] or 0.0 for row in group), 6),
+            "latency_p50_ms": _percentile(latencies, 50),
+            "latency_p95_ms": _percentile(latencies, 95),
+        }
+    return summary
+
+def get_latest_run_id() -> Optional[int]:
+    return get_connection().execute(LATEST_RUN_ID_SQL).fetchone()[0]
+
+def insert_stage_metrics(rows: List[Dict[str, Any]]):
+    if not rows:
+        return
+    try:
+        with transaction() as conn:
+            conn.executemany(INSERT_STAGE_METRIC_SQL, [(
+                row['run_id'],
+                row.get('raw_document_id'),
+                row['stage'],
+                row.get('source'),
+                row['wall_ms'],
+                row.get('external_ms', 0.0),
+                row.get('queue_wait_ms', 0.0),
+                row.get('status')
+            ) for row in rows])
+    except Exception as e:
+        logger.error(f"Error recording {len(rows)} stage metrics: {e}")
+
+def get_run_stage_summary(run_id: int) -> Dict[str, Any]:
+    """
+    Per stage of a run: count, errors and the p50/p95/max/total (ms) of wall,
+    external-call and queue-wait time.
+    """
+    groups: Dict[str, List[sqlite3.Row]] = {}
+    for row in get_connection().execute(RUN_STAGE_METRICS_SQL, (run_id,)):
+        groups.setdefault(row['stage'], []).append(row)
+
+    summary = {}
+    for stage, group in groups.items():
+        summary[stage] = {"count": len(group), "errors": sum(1 for row in group if row['status'] == 'error')}
+        for column in ('wall_ms', 'external_ms', 'queue_wait_ms'):
+            values = [row[column] or 0.0 for row in group]
+            summary[stage][column] = {
+                "p50": _percentile(values, 50),
+                "p95": _percentile(values, 95),
+                "max": round(max(values), 1),
+                "total": round(sum(values), 1),
+            }
+    return summary
+
 def get_latest_items(limit: int = 20, relevant_only: bool = True):
-    conn = get_db_connection()
-    c = conn.cursor()
-    # Join with raw_documents to get source info like county
-    query = """
-        SELECT i.*, r.county 
-        FROM items i
-        LEFT JOIN raw_documents r ON i.raw_document_id = r.id
-    """
-    
-    if relevant_only:
-        query += " WHERE i.is_relevant = 1"
-    
-    query += " ORDER BY i.processed_at DESC LIMIT ?"
-    
-    c.execute(query, (limit,))
-    rows = c.fetchall()
-    conn.close()
+    query = LATEST_RELEVANT_ITEMS_SQL if relevant_only else LATEST_ITEMS_SQL
+    rows = get_connection().execute(query, (limit,)).fetchall()
     return [dict(row) for row in rows]
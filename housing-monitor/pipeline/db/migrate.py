@@ -0,0 +1,50 @@
+import os
+import glob
+import sqlite3
+import logging
+from pipeline.config import SQLITE_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+def list_migrations():
+    """
+    Returns [(version, path)] for migrations/NNN_name.sql, ordered by version.
+    """
+    migrations = []
+    for path in glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')):
+        version = int(os.path.basename(path).split('_', 1)[0])
+        migrations.append((version, path))
+    return sorted(migrations)
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Creates the base schema if needed and applies pending migrations in order.
+    The applied version is tracked in PRAGMA user_version. Returns the final version.
+    """
+    with open(SCHEMA_PATH, 'r') as f:
+        conn.executescript(f.read())
+
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, path in list_migrations():
+        if version <= current:
+            continue
+        logger.info(f"Applying migration {os.path.basename(path)}")
+        with open(path, 'r') as f:
+            script = f.read()
+        # executescript commits first, so wrap the migration and its version bump together
+        conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        current = version
+    return current
+
+def migrate_db(db_path: str = SQLITE_PATH) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return migrate(conn)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    print(f"Database at schema version {migrate_db()}")
@@ -0,0 +1,3 @@
+-- Track when a page's content last changed, separately from when it was last scraped
+ALTER TABLE raw_documents ADD COLUMN last_changed_at DATETIME;
+UPDATE raw_documents SET last_changed_at = scraped_at;
@@ -0,0 +1,11 @@
+-- Hash tier of DedupeAgent: raw_documents lookups by content_hash
+CREATE INDEX IF NOT EXISTS idx_raw_documents_content_hash ON raw_documents(content_hash);
+
+-- Every dedupe/change-detection join on items.raw_document_id; also covers the Trends page,
+-- which reads (raw_document_id, processed_at, is_relevant) for the whole table
+CREATE INDEX IF NOT EXISTS idx_items_raw_document_processed
+    ON items(raw_document_id, processed_at, is_relevant);
+
+-- Feed: newest items first, with and without the relevant-only filter
+CREATE INDEX IF NOT EXISTS idx_items_processed_at ON items(processed_at);
+CREATE INDEX IF NOT EXISTS idx_items_relevant_processed_at ON items(processed_at) WHERE is_relevant = 1;
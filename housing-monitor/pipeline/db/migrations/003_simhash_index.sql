@@ -0,0 +1,17 @@
+-- SimHash signatures of persisted items for the near-duplicate dedupe tier.
+-- simhash is stored as a signed 64-bit integer; each band is a 16-bit slice of it.
+CREATE TABLE IF NOT EXISTS simhash_index (
+    item_id INTEGER PRIMARY KEY,
+    raw_document_id INTEGER,
+    simhash INTEGER NOT NULL,
+    band0 INTEGER NOT NULL,
+    band1 INTEGER NOT NULL,
+    band2 INTEGER NOT NULL,
+    band3 INTEGER NOT NULL,
+    FOREIGN KEY(item_id) REFERENCES items(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_simhash_band0 ON simhash_index(band0);
+CREATE INDEX IF NOT EXISTS idx_simhash_band1 ON simhash_index(band1);
+CREATE INDEX IF NOT EXISTS idx_simhash_band2 ON simhash_index(band2);
+CREATE INDEX IF NOT EXISTS idx_simhash_band3 ON simhash_index(band3);
@@ -0,0 +1,29 @@
+-- One row per LLM call (cache hits included, with cached = 1) for token, latency and cost accounting.
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER,
+    raw_document_id INTEGER,
+    stage TEXT NOT NULL, -- 'relevance', 'summarize'
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency_ms REAL,
+    retries INTEGER DEFAULT 0,
+    cached BOOLEAN DEFAULT 0,
+    cost_usd REAL,
+    status TEXT, -- 'ok', 'error'
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(run_id) REFERENCES runs(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_calls_run ON llm_calls(run_id, stage);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_document ON llm_calls(raw_document_id);
+
+-- Runs are opened when the pipeline starts (status 'running') so calls can reference them,
+-- and get their LLM totals when they finish.
+ALTER TABLE runs ADD COLUMN llm_calls INTEGER;
+ALTER TABLE runs ADD COLUMN prompt_tokens INTEGER;
+ALTER TABLE runs ADD COLUMN completion_tokens INTEGER;
+ALTER TABLE runs ADD COLUMN llm_cost_usd REAL;
+ALTER TABLE runs ADD COLUMN llm_latency_p50_ms REAL;
+ALTER TABLE runs ADD COLUMN llm_latency_p95_ms REAL;
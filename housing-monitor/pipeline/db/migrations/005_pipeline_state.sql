@@ -0,0 +1,25 @@
+-- Per-document stage checkpoints of a run, so `run_daily --resume <run_id>` can skip finished stages.
+-- doc_state is the document after that stage (JSON, without content_text); it is cleared when
+-- the run finishes successfully. 'queued' rows list the run's documents, 'persist' rows are
+-- written in the same transaction as the item.
+CREATE TABLE IF NOT EXISTS pipeline_state (
+    run_id INTEGER NOT NULL,
+    raw_document_id INTEGER NOT NULL,
+    stage TEXT NOT NULL, -- 'queued', 'prefilter', 'chunk', 'classify', 'dedupe', 'summarize', 'persist'
+    doc_state TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, raw_document_id, stage),
+    FOREIGN KEY(run_id) REFERENCES runs(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pipeline_state_run_stage ON pipeline_state(run_id, stage);
+
+-- Progress of a run: documents that completed each stage (refreshed while the run goes on)
+ALTER TABLE runs ADD COLUMN finished_at DATETIME;
+ALTER TABLE runs ADD COLUMN docs_total INTEGER;
+ALTER TABLE runs ADD COLUMN docs_prefiltered INTEGER;
+ALTER TABLE runs ADD COLUMN docs_chunked INTEGER;
+ALTER TABLE runs ADD COLUMN docs_classified INTEGER;
+ALTER TABLE runs ADD COLUMN docs_deduped INTEGER;
+ALTER TABLE runs ADD COLUMN docs_summarized INTEGER;
+ALTER TABLE runs ADD COLUMN docs_persisted INTEGER;
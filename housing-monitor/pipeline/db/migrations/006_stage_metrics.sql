@@ -0,0 +1,18 @@
+-- Timing of every traced stage: one row per document per graph node, one per scraped source.
+-- wall_ms is the whole stage, external_ms the part spent in API/Qdrant/scrape calls and
+-- queue_wait_ms the time spent waiting for a worker or a rate/politeness limit.
+CREATE TABLE IF NOT EXISTS stage_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL,
+    raw_document_id INTEGER,
+    stage TEXT NOT NULL, -- 'scrape', 'prefilter', 'chunk', 'classify', 'dedupe', 'summarize', 'persist', 'persist_flush'
+    source TEXT, -- scraped URL for 'scrape' rows
+    wall_ms REAL NOT NULL,
+    external_ms REAL DEFAULT 0,
+    queue_wait_ms REAL DEFAULT 0,
+    status TEXT, -- 'ok', 'error', 'deferred'
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(run_id) REFERENCES runs(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stage_metrics_run ON stage_metrics(run_id, stage);
@@ -0,0 +1,3 @@
+-- Error of the relevance or summarize call an item was produced after (NULL when both succeeded).
+-- Such items don't count as processed: the page is classified again on the next run.
+ALTER TABLE items ADD COLUMN error TEXT;
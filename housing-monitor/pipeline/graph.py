@@ -1,16 +1,17 @@
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Any
+from langgraph.graph import StateGraph, START, END
+from langchain_core.runnables import RunnableConfig
+from typing import TypedDict, List, Any, Optional
 import logging
+import functools
 from pipeline.config import RELEVANCE_THRESHOLD
-from pipeline.agents.relevance import RelevanceAgent
+from pipeline.agents.prefilter import LexicalPrefilter
+from pipeline.agents.chunker import DocumentChunker
+from pipeline.agents.relevance import RelevanceAgent, RelevanceBatcher
 from pipeline.agents.dedupe import DedupeAgent
 from pipeline.agents.summarize import SummarizeAgent
+from pipeline.persist import PersistBuffer
+from pipeline.tracing import traced
 import pipeline.db.crud as crud
-from langchain_openai import OpenAIEmbeddings
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import PointStruct
-from pipeline.config import QDRANT_URL
-from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME
 
 logger = logging.getLogger(__name__)
 
@@ -19,13 +20,36 @@ class PipelineState(TypedDict):
     raw_document_id: int
     doc: dict
     status: str
+    # Run the document belongs to (pipeline_state checkpoints), None when not tracked
+    run_id: Optional[int]
+    # Last stage the document completed in an interrupted run; the graph continues after it
+    resume_stage: Optional[str]
+    # time.monotonic() when the previous node finished (queue wait of the next one, see traced)
+    stage_finished_at: Optional[float]
 
 # Initialize Agents
+prefilter_agent = LexicalPrefilter()
+chunker = DocumentChunker(prefilter_agent)
 relevance_agent = RelevanceAgent()
-dedupe_agent = DedupeAgent()
+relevance_batcher = RelevanceBatcher(relevance_agent)
 summarize_agent = SummarizeAgent()
-client = QdrantClient(url=QDRANT_URL)
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+persist_buffer = PersistBuffer()
+dedupe_agent = DedupeAgent(persist_buffer)
+
+def checkpointed(stage: str):
+    """
+    Saves the node's resulting document as the `stage` checkpoint of its run, so a resumed
+    run (run_daily --resume) starts after it. 'persist' is recorded with the item instead.
+    """
+    def decorator(node):
+        @functools.wraps(node)
+        def wrapper(state: PipelineState, *args, **kwargs):
+            update = node(state, *args, **kwargs)
+            if state.get('run_id') is not None:
+                crud.save_checkpoint(state['run_id'], state['raw_document_id'], stage, update['doc'])
+            return update
+        return wrapper
+    return decorator
 
 def load_doc(state: PipelineState):
     # In a real batch flow, we might load from DB here if we only passed ID.
@@ -33,57 +57,66 @@ def load_doc(state: PipelineState):
     # If not, fetch by raw_document_id.
     return state
 
-def classify_relevance(state: PipelineState):
+@traced("prefilter")
+@checkpointed("prefilter")
+def prefilter(state: PipelineState):
+    logger.info(f"Prefiltering doc {state['raw_document_id']}")
+    updated_doc = prefilter_agent.process(state['doc'])
+    return {"doc": updated_doc}
+
+@traced("chunk")
+@checkpointed("chunk")
+def chunk(state: PipelineState):
+    logger.info(f"Chunking doc {state['raw_document_id']}")
+    updated_doc = chunker.process(state['doc'])
+    return {"doc": updated_doc}
+
+@traced("classify")
+@checkpointed("classify")
+def classify_relevance(state: PipelineState, config: RunnableConfig):
     logger.info(f"Classifying doc {state['raw_document_id']}")
-    updated_doc = relevance_agent.classify(state['doc'])
+    # Batch runs set configurable.batch_relevance: short documents share classification requests
+    if config.get("configurable", {}).get("batch_relevance") and relevance_agent.batchable(state['doc']):
+        updated_doc = relevance_batcher.classify(state['doc'])
+    else:
+        updated_doc = relevance_agent.classify(state['doc'])
     return {"doc": updated_doc}
 
+@traced("dedupe")
+@checkpointed("dedupe")
 def check_dedupe(state: PipelineState):
     logger.info(f"Checking duplicates for doc {state['raw_document_id']}")
     updated_doc = dedupe_agent.process(state['doc'])
     return {"doc": updated_doc}
 
+@traced("summarize")
+@checkpointed("summarize")
 def summarize(state: PipelineState):
     logger.info(f"Summarizing doc {state['raw_document_id']}")
     updated_doc = summarize_agent.summarize(state['doc'])
     return {"doc": updated_doc}
 
+@traced("persist")
 def persist(state: PipelineState):
     logger.info(f"Persisting doc {state['raw_document_id']}")
     doc = state['doc']
     
     # Ensure raw_document_id is linked for the Join
     doc['raw_document_id'] = state['raw_document_id']
+    # Lets the item's insert record the 'persist' checkpoint in the same transaction
+    doc['run_id'] = state.get('run_id')
     
-    # 1. Save to SQLite
-    item_id = crud.insert_processed_item(doc)
-    
-    # 2. Save to Qdrant if relevant and new and has content
-    if doc.get('is_relevant') and doc.get('is_new') and doc.get('content_text'):
-        try:
-            vector = embeddings.embed_query(doc['content_text'][:8000])
-            payload = {
-                "item_id": item_id,
-                "title": doc.get('title'),
-                "county": doc.get('county'),
-                "url": doc.get('url')
-            }
-            client.upsert(
-                collection_name=LEGISLATION_COLLECTION_NAME,
-                points=[
-                    PointStruct(
-                        id=item_id, # Use item_id as integer ID
-                        vector=vector,
-                        payload=payload
-                    )
-                ]
-            )
-        except Exception as e:
-            logger.error(f"Failed to upsert to Qdrant: {e}")
+    # Buffered: SQLite and Qdrant writes happen per batch (the runner flushes the rest)
+    persist_buffer.add(doc)
             
     return {"status": "completed"}
 
 # Define conditions
+def prefilter_condition(state: PipelineState):
+    if prefilter_agent.should_skip(state['doc']):
+        return "skip"
+    return "classify"
+
 def relevance_condition(state: PipelineState):
     if state['doc'].get('is_relevant') and state['doc'].get('relevance_score', 0) >= RELEVANCE_THRESHOLD:
         return "relevant"
@@ -94,15 +127,52 @@ def dedupe_condition(state: PipelineState):
         return "new"
     return "duplicate"
 
+def resume_condition(state: PipelineState):
+    # Fresh documents start at the prefilter; resumed ones at the edge after their last completed stage
+    stage = state.get('resume_stage')
+    if stage is None or stage == crud.QUEUED_STAGE:
+        return "prefilter"
+    if stage == "prefilter":
+        return "chunk" if prefilter_condition(state) == "classify" else "persist"
+    if stage == "chunk":
+        return "classify"
+    if stage == "classify":
+        return "dedupe" if relevance_condition(state) == "relevant" else "persist"
+    if stage == "dedupe":
+        return "summarize" if dedupe_condition(state) == "new" else "persist"
+    return "persist"
+
 # Build Graph
 workflow = StateGraph(PipelineState)
 
+workflow.add_node("prefilter", prefilter)
+workflow.add_node("chunk", chunk)
 workflow.add_node("classify", classify_relevance)
 workflow.add_node("dedupe", check_dedupe)
 workflow.add_node("summarize", summarize)
 workflow.add_node("persist", persist)
 
-workflow.set_entry_point("classify")
+workflow.add_conditional_edges(
+    START,
+    resume_condition,
+    {
+        "prefilter": "prefilter",
+        "chunk": "chunk",
+        "classify": "classify",
+        "dedupe": "dedupe",
+        "summarize": "summarize",
+        "persist": "persist"
+    }
+)
+
+workflow.add_conditional_edges(
+    "prefilter",
+    prefilter_condition,
+    {
+        "classify": "chunk",
+        "skip": "persist" # Clearly irrelevant: recorded as not relevant without an LLM call
+    }
+)
 
 workflow.add_conditional_edges(
     "classify",
@@ -122,6 +192,7 @@ workflow.add_conditional_edges(
     }
 )
 
+workflow.add_edge("chunk", "classify")
 workflow.add_edge("summarize", "persist")
 workflow.add_edge("persist", END)
 
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from pipeline.config import BATCH_API_DIR, BATCH_API_POLL_SECONDS, BATCH_API_MAX_WAIT_HOURS
+from pipeline.llm.cache import get_response_cache
+from pipeline.llm.client import call_cost, current_run_id, strip_json_fence
+import pipeline.db.crud as crud
+
+logger = logging.getLogger(__name__)
+
+# Batch API pricing relative to synchronous calls
+BATCH_DISCOUNT = 0.5
+
+# Batch statuses after which nothing changes any more (OpenAI Batch API names)
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def parse_output(lines) -> Dict[str, Dict[str, Any]]:
+    """
+    {custom_id: chat completion body} of the successful lines of a batch output file.
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get('response') or {}
+        if response.get('status_code') == 200:
+            results[record['custom_id']] = response.get('body') or {}
+        else:
+            logger.warning(f"Batch request {record.get('custom_id')} failed: {record.get('error') or response}")
+    return results
+
+class BatchBackend:
+    """
+    Runs a JSONL file of chat completion requests (OpenAI Batch API format) asynchronously.
+    """
+    def submit(self, path: str) -> str:
+        """Starts the job and returns its id."""
+        raise NotImplementedError
+
+    def status(self, batch_id: str) -> str:
+        raise NotImplementedError
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """{custom_id: response body} of the requests that succeeded."""
+        raise NotImplementedError
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self):
+        from openai import OpenAI
+        self.client = OpenAI()
+
+    def submit(self, path: str) -> str:
+        with open(path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions",
+                                           completion_window="24h")
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        batch = self.client.batches.retrieve(batch_id)
+        # Expired batches still return the requests that finished in time
+        if not batch.output_file_id:
+            return {}
+        return parse_output(self.client.files.content(batch.output_file_id).text.splitlines())
+
+def _openai_responder(body: Dict[str, Any]) -> Dict[str, Any]:
+    from openai import OpenAI
+    return OpenAI().chat.completions.create(**body).model_dump()
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in: answers every request of the job at submit time with `responder`
+    (a direct chat completion by default, a stub in tests) and writes an OpenAI-format
+    output file next to the input.
+    """
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.responder = responder or _openai_responder
+
+    @staticmethod
+    def _output_path(batch_id: str) -> str:
+        return f"{batch_id}.output.jsonl"
+
+    def submit(self, path: str) -> str:
+        with open(path) as f, open(self._output_path(path), 'w') as out:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    response = {"status_code": 200, "body": self.responder(request['body'])}
+                    error = None
+                except Exception as e:
+                    response, error = None, {"message": str(e)}
+                out.write(json.dumps({"custom_id": request['custom_id'], "response": response,
+                                      "error": error}) + "\n")
+        return path
+
+    def status(self, batch_id: str) -> str:
+        return "completed" if os.path.exists(self._output_path(batch_id)) else "failed"
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        with open(self._output_path(batch_id)) as f:
+            return parse_output(f)
+
+BATCH_BACKENDS = {
+    "openai": OpenAIBatchBackend,
+    "local": LocalBatchBackend,
+}
+
+def get_batch_backend(name: str) -> BatchBackend:
+    if name not in BATCH_BACKENDS:
+        raise ValueError(f"Unknown batch backend '{name}'. Available: {', '.join(BATCH_BACKENDS)}")
+    return BATCH_BACKENDS[name]()
+
+class BatchJob:
+    """
+    Requests deferred by LLMClient during one round (keyed by response cache key), written
+    as a JSONL job, run through a BatchBackend and stored in the response cache so the next
+    pass over the graph finds every answer there.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.meta: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def add(self, custom_id: str, body: Dict[str, Any], meta: Dict[str, Any]):
+        with self.lock:
+            self.requests.setdefault(custom_id, body)
+            self.meta.setdefault(custom_id, meta)
+
+    def write(self, directory: str = BATCH_API_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"job-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.jsonl")
+        with open(path, 'w') as f:
+            for custom_id, body in self.requests.items():
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST",
+                                    "url": "/v1/chat/completions", "body": body}) + "\n")
+        return path
+
+    def wait(self, backend: BatchBackend, batch_id: str, poll_seconds: float = BATCH_API_POLL_SECONDS,
+             max_wait_hours: float = BATCH_API_MAX_WAIT_HOURS) -> str:
+        deadline = time.monotonic() + max_wait_hours * 3600
+        while True:
+            status = backend.status(batch_id)
+            if status in TERMINAL_STATUSES:
+                return status
+            if time.monotonic() >= deadline:
+                logger.warning(f"Batch {batch_id} still '{status}' after {max_wait_hours}h; using partial results")
+                return status
+            time.sleep(poll_seconds)
+
+    def run(self, backend: BatchBackend, directory: str = BATCH_API_DIR) -> int:
+        """
+        Submits the job, waits for it and caches the answers. Returns how many were stored;
+        requests without a usable answer are simply asked again next round.
+        """
+        path = self.write(directory)
+        batch_id = backend.submit(path)
+        logger.info(f"Submitted batch {batch_id} with {len(self)} requests ({path})")
+        status = self.wait(backend, batch_id)
+        results = backend.results(batch_id)
+        logger.info(f"Batch {batch_id} {status}: {len(results)} of {len(self)} answered")
+
+        cache = get_response_cache()
+        stored = 0
+        for custom_id, body in results.items():
+            meta = self.meta.get(custom_id)
+            if meta is None:
+                continue
+            model = meta['model']
+            usage = body.get('usage') or {}
+            prompt_tokens = usage.get('prompt_tokens') or meta.get('prompt_tokens') or 0
+            completion_tokens = usage.get('completion_tokens') or 0
+            status = "error"
+            try:
+                content = strip_json_fence(body['choices'][0]['message']['content'] or '')
+                json.loads(content)
+                cache.put(custom_id, model, content)
+                stored += 1
+                status = "ok"
+            except (KeyError, IndexError, ValueError) as e:
+                logger.warning(f"Unusable batch answer for {custom_id}: {e}")
+            cost = call_cost(model, prompt_tokens, completion_tokens)
+            crud.insert_llm_call({**meta, "run_id": current_run_id(), "cached": False, "status": status,
+                                  "retries": 0, "latency_ms": None, "prompt_tokens": prompt_tokens,
+                                  "completion_tokens": completion_tokens,
+                                  "cost_usd": cost * BATCH_DISCOUNT if cost is not None else None})
+        return stored
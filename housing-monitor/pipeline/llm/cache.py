@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Any, Optional
+from pipeline.config import LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL_DAYS, LLM_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+# Run eviction once every this many writes rather than on every put
+_EVICT_EVERY = 100
+
+def make_cache_key(model: str, prompt_version: str, inputs: Dict[str, Any]) -> str:
+    """
+    Deterministic key over everything that determines a temperature-0 response.
+    """
+    payload = json.dumps(
+        {"model": model, "prompt_version": prompt_version, "inputs": inputs},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    SQLite-backed store of raw LLM response text with TTL and size-based (LRU) eviction.
+    """
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_days: float = LLM_CACHE_TTL_DAYS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, enabled: bool = LLM_CACHE_ENABLED):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+        self._writes = 0
+        self.conn = None
+        if not enabled:
+            return
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)')
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT response, created_at FROM llm_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self.conn.execute('UPDATE llm_cache SET last_used_at = ? WHERE cache_key = ?', (now, key))
+                self.conn.commit()
+                self.counters["hits"] += 1
+                return row[0]
+            if row:
+                self.conn.execute('DELETE FROM llm_cache WHERE cache_key = ?', (key,))
+                self.conn.commit()
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: str, model: str, response: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, model, response, now, now)
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now: float):
+        # Caller holds self.lock
+        self.conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+        self.conn.execute('''
+            DELETE FROM llm_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
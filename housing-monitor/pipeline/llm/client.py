@@ -0,0 +1,211 @@
+import json
+import time
+import random
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from pipeline.config import LLM_MAX_RETRIES
+from pipeline.llm.rate_limit import chat_limiter, estimate_tokens
+from pipeline.llm.cache import get_response_cache, make_cache_key
+from pipeline.tracing import external
+import pipeline.db.crud as crud
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M (prompt, completion) tokens; calls to other models are recorded without a cost
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+# Run that LLM calls are attributed to (set by run_daily; None outside a pipeline run)
+_run_id: Optional[int] = None
+
+def set_run_id(run_id: Optional[int]):
+    global _run_id
+    _run_id = run_id
+
+def current_run_id() -> Optional[int]:
+    return _run_id
+
+class DeferredCall(Exception):
+    """
+    Raised instead of calling the API while a batch job collects requests (--batch-api):
+    the request was queued and its answer will be in the response cache next round.
+    Agents must let it propagate.
+    """
+    # Stage metrics status of the node it interrupted
+    trace_status = "deferred"
+
+# Batch job collecting cache misses (pipeline.llm.batch.BatchJob), None for direct calls
+_batch_job = None
+
+def set_batch_job(job):
+    global _batch_job
+    _batch_job = job
+
+def _to_openai_messages(messages) -> list:
+    roles = {"system": "system", "human": "user", "ai": "assistant"}
+    return [{"role": roles[m.type], "content": m.content} for m in messages]
+
+_warned = threading.Event()
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    """
+    tiktoken encoding for the model, or None when it can't be loaded
+    (tiktoken downloads encodings on first use).
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        if not _warned.is_set():
+            _warned.set()
+            logger.warning(f"tiktoken unavailable ({e}); estimating ~4 characters per token")
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    """
+    Longest prefix of text that is at most max_tokens tokens.
+    """
+    max_tokens = max(0, max_tokens)
+    encoding = _encoding(model)
+    if encoding is None:
+        return (text or "")[:max_tokens * 4]
+    tokens = encoding.encode(text or "", disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+def strip_json_fence(content: str) -> str:
+    content = content.strip()
+    # Clean up potential markdown formatting in JSON
+    if content.startswith("```json"):
+        content = content[7:-3]
+    return content
+
+class LLMClient:
+    """
+    Shared path for the agents' JSON prompts: fits `fit_field` so the rendered prompt stays
+    within `token_budget` tokens, serves repeats from the response cache, applies the
+    chat rate limit (prompt plus `max_tokens` of completion), retries failed calls and
+    records every call in llm_calls.
+    With json_mode the model is asked for a JSON object (OpenAI response_format), so
+    answers parse without relying on the prompt alone.
+    """
+    def __init__(self, stage: str, prompt: ChatPromptTemplate, prompt_version: str,
+                 token_budget: int, max_tokens: int, fit_field: str = "document_text", json_mode: bool = True):
+        self.stage = stage
+        self.prompt = prompt
+        self.prompt_version = prompt_version
+        self.token_budget = token_budget
+        self.max_tokens = max_tokens
+        self.fit_field = fit_field
+        self.json_mode = json_mode
+        self.cache = get_response_cache()
+
+    def prompt_tokens(self, model: str, inputs: Dict[str, Any]) -> int:
+        return count_tokens(self.prompt.format(**inputs), model)
+
+    def fit(self, model: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Copy of inputs whose fit_field is cut to the tokens left after the rest of the prompt.
+        """
+        text = inputs.get(self.fit_field) or ""
+        overhead = self.prompt_tokens(model, {**inputs, self.fit_field: ""})
+        available = self.token_budget - overhead
+        if available <= 0:
+            logger.warning(f"{self.stage} prompt is {overhead} tokens without the document "
+                           f"(budget {self.token_budget})")
+        return {**inputs, self.fit_field: truncate_to_tokens(text, available, model)}
+
+    def complete_json(self, llm: ChatOpenAI, inputs: Dict[str, Any],
+                      raw_document_id: Optional[int] = None) -> dict:
+        """
+        Returns the parsed JSON answer of `llm` for inputs; raises once retries are exhausted.
+        """
+        model = llm.model_name
+        inputs = self.fit(model, inputs)
+        cache_key = make_cache_key(model, self.prompt_version, inputs)
+        call = {"run_id": _run_id, "raw_document_id": raw_document_id, "stage": self.stage, "model": model}
+
+        started = time.perf_counter()
+        content = self.cache.get(cache_key)
+        if content is not None:
+            crud.insert_llm_call({**call, "cached": True, "status": "ok", "retries": 0,
+                                  "latency_ms": (time.perf_counter() - started) * 1000,
+                                  "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+            return json.loads(content)
+
+        if _batch_job is not None:
+            body = {"model": model, "temperature": llm.temperature, "max_tokens": self.max_tokens,
+                    "messages": _to_openai_messages(self.prompt.format_messages(**inputs))}
+            if self.json_mode:
+                body["response_format"] = {"type": "json_object"}
+            _batch_job.add(cache_key, body, {**call, "prompt_tokens": self.prompt_tokens(model, inputs)})
+            raise DeferredCall(cache_key)
+
+        prompt_tokens = self.prompt_tokens(model, inputs)
+        completion_tokens = 0
+        retries = 0
+        response = None
+        status = "error"
+        options = {"max_tokens": self.max_tokens}
+        if self.json_mode:
+            options["response_format"] = {"type": "json_object"}
+        chain = self.prompt | llm.bind(**options)
+        started = time.perf_counter()
+        try:
+            while True:
+                # The TPM budget is charged for the completion the call may produce as well
+                chat_limiter.acquire(prompt_tokens + self.max_tokens)
+                try:
+                    with external():
+                        response = chain.invoke(inputs)
+                    break
+                except Exception as e:
+                    if retries >= LLM_MAX_RETRIES:
+                        raise
+                    retries += 1
+                    delay = min(30.0, 0.5 * 2 ** retries) * (0.5 + random.random())
+                    logger.info(f"{self.stage} call to {model} failed ({e}); retry {retries} in {delay:.1f}s")
+                    # Backoff is time lost to the API, so it counts as external time too
+                    with external():
+                        time.sleep(delay)
+
+            # Prefer the API's own count; fall back to counting locally
+            usage = getattr(response, 'usage_metadata', None) or {}
+            prompt_tokens = usage.get('input_tokens') or prompt_tokens
+            completion_tokens = usage.get('output_tokens') or count_tokens(response.content, model)
+
+            content = strip_json_fence(response.content)
+            result = json.loads(content)
+            self.cache.put(cache_key, model, content)
+            status = "ok"
+            return result
+        finally:
+            # A response that failed to parse was still billed; a call that never got one was not
+            crud.insert_llm_call({**call, "cached": False, "status": status, "retries": retries,
+                                  "latency_ms": (time.perf_counter() - started) * 1000,
+                                  "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                  "cost_usd": call_cost(model, prompt_tokens, completion_tokens)
+                                  if response is not None else None})
@@ -0,0 +1,62 @@
+import threading
+import time
+from pipeline.config import OPENAI_RPM, OPENAI_TPM, OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM
+from pipeline.tracing import waiting
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (~4 characters per token) used for budgeting.
+    """
+    return len(text or "") // 4 + 1
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests-per-minute and tokens-per-minute.
+    One instance is shared by every worker thread that talks to the same API.
+    A limit of 0 disables that bucket.
+    """
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until one request carrying `tokens` tokens fits in both budgets.
+        """
+        if self.tpm:
+            # A single call larger than the whole budget would otherwise wait forever
+            tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+            # Counts as queue wait of the stage being traced
+            with waiting():
+                time.sleep(wait)
+
+# Shared budgets for chat completions and embeddings
+chat_limiter = RateLimiter(OPENAI_RPM, OPENAI_TPM)
+embedding_limiter = RateLimiter(OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM)
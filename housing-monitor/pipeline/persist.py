@@ -0,0 +1,168 @@
+import uuid
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import List, Tuple
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+from pipeline.config import QDRANT_URL, PERSIST_BATCH_SIZE, VECTOR_BATCH_SIZE, QDRANT_UPSERT_WAIT
+from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME
+from pipeline.vector.embeddings import get_embedding_service
+from pipeline.agents.chunker import indexed_chunks
+from pipeline.tracing import external
+import pipeline.db.crud as crud
+
+logger = logging.getLogger(__name__)
+
+# Characters of content embedded per point
+EMBED_MAX_CHARS = 8000
+
+# Namespace for deterministic chunk point ids
+CHUNK_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "housing-monitor/legislation_chunks")
+
+def chunk_point_id(item_id: int, chunk_index: int) -> str:
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{item_id}:{chunk_index}"))
+
+# (point id, item id, text to embed, payload)
+VectorEntry = Tuple[str, int, str, dict]
+
+class PersistBuffer:
+    """
+    Collects documents finished by the graph and writes them in batches:
+    one SQLite transaction for the items, then, for the relevant, new ones, their vectors
+    right away (one embed_documents call and one multi-point Qdrant upsert per
+    vector_batch_size points), so dedupe sees a batch in SQLite and Qdrant at the same time.
+    Each relevant chunk of an item becomes its own point (payload item_id, chunk_index).
+    A batch SQLite failure falls back to one insert per item, so a bad row only loses itself
+    (see item_failures). Batches are written one at a time; buffered_docs() lists the items not
+    committed yet, so dedupe can flush() early when one of them might match a later document.
+    The runner must call flush() once the run is done to write the remainder.
+    """
+    def __init__(self, batch_size: int = PERSIST_BATCH_SIZE, vector_batch_size: int = VECTOR_BATCH_SIZE,
+                 wait: bool = QDRANT_UPSERT_WAIT):
+        self.batch_size = max(1, batch_size)
+        self.vector_batch_size = max(1, vector_batch_size)
+        self.wait = wait
+        self.client = QdrantClient(url=QDRANT_URL)
+        self.embeddings = get_embedding_service()
+        self.pending: List[dict] = []
+        # Batch being written: not committed yet, but no longer in pending
+        self.writing: List[dict] = []
+        self.vector_failures: List[int] = []
+        # Documents whose item could not be written (their raw_document_id is retried next run)
+        self.item_failures: List[dict] = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def add(self, doc: dict):
+        with self.lock:
+            self.pending.append(doc)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def buffered_docs(self) -> List[dict]:
+        """
+        Documents handed to add() whose items are not committed yet (dedupe can't see them).
+        """
+        with self.lock:
+            return self.writing + self.pending
+
+    def flush(self):
+        """
+        Writes everything buffered now. Returns once every document buffered before the call is
+        committed, including a batch another thread was already writing.
+        """
+        with self.write_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                self.writing = batch
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                with self.lock:
+                    self.writing = []
+
+    def _write(self, docs: List[dict]):
+        # 1. Save to SQLite
+        item_ids = crud.insert_processed_items(docs)
+        if not item_ids:
+            logger.warning(f"Batch insert of {len(docs)} items failed; retrying items one by one")
+            docs, item_ids = self._write_each(docs)
+            if not docs:
+                return
+        # The batch recorded its 'persist' checkpoints; refresh the run's progress counters
+        for run_id in {doc.get('run_id') for doc in docs} - {None}:
+            crud.update_run_progress(run_id)
+
+        # 2. Index in Qdrant if relevant and new and has content
+        entries = []
+        for doc, item_id in zip(docs, item_ids):
+            doc['item_id'] = item_id
+            # Items whose LLM calls failed are retried next run; nothing should match them meanwhile
+            if doc.get('is_relevant') and doc.get('is_new') and doc.get('content_text') and not crud.item_error(doc):
+                entries.extend(self._entries(item_id, doc))
+        if entries:
+            self._index(entries)
+
+    def _write_each(self, docs: List[dict]) -> Tuple[List[dict], List[int]]:
+        # Returns the docs that were written and their item ids
+        written, item_ids = [], []
+        for doc in docs:
+            ids = crud.insert_processed_items([doc])
+            if ids:
+                written.append(doc)
+                item_ids.extend(ids)
+                continue
+            logger.error(f"Failed to persist raw doc {doc.get('raw_document_id')}")
+            with self.lock:
+                self.item_failures.append(doc)
+        return written, item_ids
+
+    def _entries(self, item_id: int, doc: dict) -> List[VectorEntry]:
+        indexed_at = datetime.now(timezone.utc).isoformat()
+        entries = []
+        for chunk in indexed_chunks(doc, EMBED_MAX_CHARS):
+            payload = {
+                "item_id": item_id,
+                "chunk_index": chunk['index'],
+                "heading": chunk['heading'],
+                "text": chunk['text'],
+                "title": doc.get('title'),
+                "county": doc.get('county'),
+                "source_type": doc.get('source_type'),
+                "date_posted": doc.get('date_posted'),
+                "indexed_at": indexed_at,
+                "url": doc.get('url')
+            }
+            entries.append((chunk_point_id(item_id, chunk['index']), item_id, chunk['text'], payload))
+        return entries
+
+    def _index(self, entries: List[VectorEntry]):
+        for start in range(0, len(entries), self.vector_batch_size):
+            batch = entries[start:start + self.vector_batch_size]
+            try:
+                vectors = self.embeddings.embed_documents([text for _, _, text, _ in batch])
+                points = [PointStruct(id=point_id, vector=vector, payload=payload)
+                          for (point_id, _, _, payload), vector in zip(batch, vectors)]
+                with external():
+                    self.client.upsert(collection_name=LEGISLATION_COLLECTION_NAME, points=points, wait=self.wait)
+            except Exception as e:
+                logger.warning(f"Batch upsert of {len(batch)} vectors failed ({e}); retrying items one by one")
+                self._index_each(batch)
+
+    def _index_each(self, entries: List[VectorEntry]):
+        # Embeddings that did succeed are served from the embedding cache, so only
+        # the items that actually failed cost another API call
+        for point_id, item_id, text, payload in entries:
+            try:
+                vector = self.embeddings.embed_query(text)
+                with external():
+                    self.client.upsert(collection_name=LEGISLATION_COLLECTION_NAME,
+                                       points=[PointStruct(id=point_id, vector=vector, payload=payload)],
+                                       wait=self.wait)
+            except Exception as e:
+                logger.error(f"Failed to upsert item {item_id} to Qdrant: {e}")
+                with self.lock:
+                    self.vector_failures.append(item_id)
@@ -1,53 +1,271 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Qdrant
+import re
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from qdrant_client import QdrantClient
-from pipeline.config import QDRANT_URL
-from pipeline.vector.collections import KB_COLLECTION_NAME
+from qdrant_client.http.models import QueryRequest
+from pipeline.config import (QDRANT_URL, KB_RETRIEVER_BACKEND, RETRIEVAL_CACHE_SIZE,
+                             RETRIEVAL_CACHE_TOLERANCE)
+from pipeline.vector.collections import KB_COLLECTION_NAME, KB_PROFILE
+from pipeline.vector.embeddings import get_embedding_service
+from pipeline.tracing import external
+
+logger = logging.getLogger(__name__)
+
+# Points fetched per scroll request when loading the KB into memory
+_SCROLL_PAGE = 256
+
+def format_context(payloads: List[dict]) -> str:
+    context_parts = []
+    for i, payload in enumerate(payloads):
+        payload = payload or {}
+        content = payload.get('page_content', '')
+        source = payload.get('metadata', {}).get('source', 'unknown')
+        context_parts.append(f"--- CHUNK {i+1} (Source: {source}) ---\n{content}")
+    return "\n\n".join(context_parts)
+
+_CHUNK_HEADER = re.compile(r"^--- CHUNK \d+ \(Source: (.*?)\) ---\n", re.M)
+
+def merge_contexts(contexts: List[str]) -> str:
+    """
+    One context holding the distinct KB chunks of several format_context strings,
+    in first-seen order (for prompts that classify several documents at once).
+    """
+    seen, payloads = set(), []
+    for context in contexts:
+        parts = _CHUNK_HEADER.split(context or "")
+        # split() yields [before, source, content, source, content, ...]
+        for source, content in zip(parts[1::2], parts[2::2]):
+            content = content.strip()
+            if content not in seen:
+                seen.add(content)
+                payloads.append({"page_content": content, "metadata": {"source": source}})
+    return format_context(payloads)
+
+class InMemoryKBIndex:
+    """
+    All kb_chunks vectors in one contiguous, L2-normalized float32 matrix.
+    Cosine top-k is a single matrix product, for one query or many.
+    """
+    def __init__(self, client: QdrantClient, collection_name: str = KB_COLLECTION_NAME):
+        self.client = client
+        self.collection_name = collection_name
+        self.matrix: Optional[np.ndarray] = None
+        self.payloads: List[dict] = []
+        self.lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.matrix is not None
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            vectors, payloads = [], []
+            offset = None
+            while True:
+                with external():
+                    points, offset = self.client.scroll(
+                        collection_name=self.collection_name,
+                        limit=_SCROLL_PAGE,
+                        offset=offset,
+                        with_payload=True,
+                        with_vectors=True
+                    )
+                for point in points:
+                    vectors.append(point.vector)
+                    payloads.append(point.payload or {})
+                if offset is None:
+                    break
+
+            if not vectors:
+                logger.warning(f"KB collection '{self.collection_name}' is empty; run scripts/ingest_kb.py")
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1 if vectors else 0)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.matrix = np.ascontiguousarray(matrix / np.maximum(norms, 1e-12))
+            self.payloads = payloads
+            logger.info(f"Loaded {len(payloads)} KB chunks from '{self.collection_name}' into memory")
+
+    def search_batch(self, query_vectors: List[List[float]], top_k: int) -> List[List[dict]]:
+        """
+        Returns, for each query, the payloads of its top_k chunks by cosine similarity.
+        """
+        if not self.payloads or not query_vectors:
+            return [[] for _ in query_vectors]
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        if queries.shape[1] != self.matrix.shape[1]:
+            raise ValueError(f"Query dimension {queries.shape[1]} != KB dimension {self.matrix.shape[1]}; "
+                             f"run scripts/reembed_collections.py for EMBEDDING_DIM")
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self.matrix.T
+
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([self.payloads[i] for i in ordered])
+        return results
+
+class RetrievalCache:
+    """
+    LRU cache of formatted KB context per query. A query is a hit when its text was
+    seen before (no embedding, no search) or when its vector lies within `tolerance`
+    cosine distance of a cached query vector (no search).
+    Cached vectors live in a preallocated matrix so the near lookup is one product.
+    """
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, tolerance: float = RETRIEVAL_CACHE_TOLERANCE):
+        self.max_entries = max(0, max_entries)
+        self.tolerance = tolerance
+        # (text hash, top_k) -> (slot, context)
+        self.entries: "OrderedDict[Tuple[str, int], Tuple[int, str]]" = OrderedDict()
+        self.vectors: Optional[np.ndarray] = None
+        self.slot_top_k = np.zeros(self.max_entries, dtype=np.int32)
+        self.slot_keys: List[Optional[Tuple[str, int]]] = [None] * self.max_entries
+        self.free_slots = list(range(self.max_entries - 1, -1, -1))
+        self.lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "near_hits": 0, "misses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(query: str, top_k: int) -> Tuple[str, int]:
+        return hashlib.sha256(query.encode('utf-8')).hexdigest(), top_k
+
+    def get(self, query: str, top_k: int) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = self.key(query, top_k)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry[1]
+
+    def get_near(self, vector: List[float], top_k: int) -> Optional[str]:
+        """
+        Context of the closest cached query vector, if within tolerance. Counts a miss otherwise.
+        """
+        with self.lock:
+            if self.enabled and self.tolerance > 0 and self.entries:
+                query = np.asarray(vector, dtype=np.float32)
+                query /= max(float(np.linalg.norm(query)), 1e-12)
+                scores = self.vectors @ query
+                # Empty slots and slots cached for another top_k never match
+                scores[self.slot_top_k != top_k] = -np.inf
+                slot = int(np.argmax(scores))
+                if scores[slot] >= 1.0 - self.tolerance:
+                    key = self.slot_keys[slot]
+                    self.entries.move_to_end(key)
+                    self.counters["near_hits"] += 1
+                    return self.entries[key][1]
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, query: str, top_k: int, vector: List[float], context: str):
+        if not self.enabled:
+            return
+        key = self.key(query, top_k)
+        query_vector = np.asarray(vector, dtype=np.float32)
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, query_vector.shape[0]), dtype=np.float32)
+            if not self.free_slots:
+                _, (slot, _) = self.entries.popitem(last=False)
+                self.slot_top_k[slot] = 0
+                self.slot_keys[slot] = None
+                self.free_slots.append(slot)
+            slot = self.free_slots.pop()
+            self.vectors[slot] = query_vector
+            self.slot_top_k[slot] = top_k
+            self.slot_keys[slot] = key
+            self.entries[key] = (slot, context)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["exact_hits"] + stats["near_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
 
 class RAGRetriever:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+    """
+    KB retrieval for the relevance classifier. The 'memory' backend (default) loads
+    kb_chunks once and searches in-process; 'qdrant' queries the collection per call.
+    """
+    def __init__(self, backend: str = KB_RETRIEVER_BACKEND, cache: Optional[RetrievalCache] = None):
+        self.backend = backend
+        self.cache = cache if cache is not None else RetrievalCache()
+        self.embeddings = get_embedding_service()
         self.client = QdrantClient(url=QDRANT_URL)
-        self.vector_store = Qdrant(
-            client=self.client,
-            collection_name=KB_COLLECTION_NAME,
-            embeddings=self.embeddings
-        )
+        self.index = InMemoryKBIndex(self.client) if backend == "memory" else None
+
+    def _search_qdrant(self, query_vectors: List[List[float]], top_k: int) -> List[List[dict]]:
+        # qdrant-client v1.10+ uses query_points / query_batch_points (search is missing here)
+        with external():
+            responses = self.client.query_batch_points(
+                collection_name=KB_COLLECTION_NAME,
+                requests=[QueryRequest(query=vector, limit=top_k, with_payload=True,
+                                       params=KB_PROFILE.search_params()) for vector in query_vectors]
+            )
+        return [[point.payload for point in response.points] for response in responses]
 
+    def _search(self, query_vectors: List[List[float]], top_k: int) -> List[List[dict]]:
+        if self.index is not None:
+            if not self.index.loaded:
+                self.index.load()
+            return self.index.search_batch(query_vectors, top_k)
+        return self._search_qdrant(query_vectors, top_k)
 
-    def retrieve(self, query: str, top_k: int = 3) -> str:
+    def retrieve_batch(self, queries: List[str], top_k: int = 3) -> List[str]:
         """
-        Retrieve relevant chunks from the Knowledge Base.
-        Returns a formatted string of context.
+        Retrieve KB context for many queries: one embedding call and one search
+        for the queries the retrieval cache cannot answer.
+        Returns a formatted context string per query ("" on error).
         """
+        if not queries:
+            return []
+        contexts: List[Optional[str]] = [self.cache.get(query, top_k) for query in queries]
+        pending = [i for i, context in enumerate(contexts) if context is None]
+        if not pending:
+            return contexts
         try:
-            # Embed the query
-            query_vector = self.embeddings.embed_query(query)
-            
-            # Search Qdrant
-            # qdrant-client v1.10+ uses query_points or search (but search is missing here)
-            # Using query_points which is robust
-            search_result = self.client.query_points(
-                collection_name=KB_COLLECTION_NAME,
-                query=query_vector,
-                limit=top_k,
-                with_payload=True
-            )
-            
-            docs = search_result.points
-            
-            context_parts = []
-            for i, point in enumerate(docs):
-                payload = point.payload or {}
-                content = payload.get('page_content', '')
-                source = payload.get('metadata', {}).get('source', 'unknown')
-                context_parts.append(f"--- CHUNK {i+1} (Source: {source}) ---\n{content}")
-            
-            return "\n\n".join(context_parts)
+            query_vectors = self.embeddings.embed_documents([queries[i] for i in pending])
+            to_search = []
+            for i, vector in zip(pending, query_vectors):
+                contexts[i] = self.cache.get_near(vector, top_k)
+                if contexts[i] is None:
+                    to_search.append((i, vector))
+
+            if to_search:
+                results = self._search([vector for _, vector in to_search], top_k)
+                for (i, vector), payloads in zip(to_search, results):
+                    contexts[i] = format_context(payloads)
+                    self.cache.put(queries[i], top_k, vector, contexts[i])
+            return contexts
         except Exception as e:
             print(f"RAG retrieval error: {e}")
-            return ""
-            
+            return [context or "" for context in contexts]
+
+    def retrieve(self, query: str, top_k: int = 3) -> str:
+        """
+        Retrieve relevant chunks from the Knowledge Base.
+        Returns a formatted string of context.
+        """
+        return self.retrieve_batch([query], top_k)[0]
+
 if __name__ == "__main__":
     r = RAGRetriever()
     print(r.retrieve("rent control caps"))
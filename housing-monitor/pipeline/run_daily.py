@@ -2,85 +2,395 @@ import logging
 import sys
 import os
 import argparse
+import asyncio
+import queue
+import threading
+import time
+from typing import Dict, Any, List, Optional
 
 # Ensure we're running from proper directory context if needed, though imports handle it
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from pipeline.collector.collect import Collector
-from pipeline.graph import app_graph
+from pipeline.graph import app_graph, persist_buffer, relevance_agent, chunker
+from pipeline.config import (PIPELINE_WORKERS, STREAM_QUEUE_SIZE, LLM_CACHE_ENABLED, BATCH_API_BACKEND,
+                             BATCH_API_MAX_ROUNDS, METRICS_EXPORT_PATH, METRICS_EXPORT_FORMAT)
 import pipeline.db.crud as crud
+from pipeline.db.migrate import migrate_db
+from pipeline.vector.embeddings import get_embedding_service
+from pipeline.llm.cache import get_response_cache
+from pipeline.llm.client import set_run_id, current_run_id, set_batch_job, DeferredCall
+from pipeline.llm.batch import BatchJob, get_batch_backend
+from pipeline.tracing import recorder, span, export_run_metrics
 from pipeline.logger_config import setup_logging
 
 logger = logging.getLogger(__name__)
 
-def run_pipeline(mock: bool = False):
-    logger.info(f"Starting Daily Run (Mock={mock})")
-    
-    # 1. Collect
-    collector = Collector(mock=mock)
-    new_doc_ids = collector.run()
-    logger.info(f"Collector finished. {len(new_doc_ids)} new raw documents.")
-    
-    if not new_doc_ids:
-        logger.info("No new documents to process.")
-        return
+# Sentinel telling a streaming graph worker to exit
+_DONE = object()
 
-    # 2. Process each new document through the graph
-    conn = crud.get_db_connection()
-    c = conn.cursor()
-    
-    stats = {
+def new_stats() -> Dict[str, Any]:
+    return {
         "items_processed": 0,
         "items_relevant": 0,
         "items_new": 0,
+        # Documents below the prefilter threshold (LLM calls avoided in enforce mode)
+        "prefilter_rejected": 0,
+        # Rejected documents the LLM still judged relevant (only observable in measure mode)
+        "prefilter_false_negatives": 0,
+        # Documents classified by the relevance LLM, and how many the small model escalated
+        "relevance_classified": 0,
+        "relevance_escalated": 0,
+        # Documents classified as part of a multi-document relevance request
+        "relevance_batched": 0,
         "error_log": ""
     }
 
+def build_initial_state(doc_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Graph input for a raw document. Within a run, a document that already has checkpoints
+    (--resume, later --batch-api rounds) continues from its last completed stage and one
+    already persisted returns None; otherwise it is queued in pipeline_state.
+    """
+    doc_dict = crud.get_raw_document(doc_id)
+    if not doc_dict:
+        return None
+    run_id = current_run_id()
+    resume_stage = None
+    if run_id is not None:
+        checkpoint = crud.get_document_checkpoint(run_id, doc_id)
+        if checkpoint is None:
+            crud.save_checkpoint(run_id, doc_id, crud.QUEUED_STAGE)
+        elif checkpoint[0] == crud.PERSIST_STAGE:
+            return None
+        elif checkpoint[1] is not None:
+            resume_stage, snapshot = checkpoint
+            doc_dict = chunker.restore({**snapshot, "content_text": doc_dict.get("content_text")})
+    return {
+        "raw_document_id": doc_id,
+        "doc": doc_dict,
+        "status": "pending",
+        "run_id": run_id,
+        "resume_stage": resume_stage,
+        "stage_finished_at": time.monotonic()
+    }
+
+def record_outcome(stats: Dict[str, Any], doc_id: int, outcome, lock: threading.Lock,
+                   deferred: Optional[List[int]] = None):
+    """
+    Folds one graph result (final state or the exception it raised) into stats.
+    Documents waiting on a batch job (DeferredCall) go to `deferred` instead.
+    """
+    with lock:
+        if deferred is not None and isinstance(outcome, DeferredCall):
+            deferred.append(doc_id)
+            return
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing doc {doc_id}: {outcome}")
+            stats["error_log"] += f"Doc {doc_id}: {str(outcome)}\n"
+            return
+
+        final_doc = outcome['doc']
+        stats["items_processed"] += 1
+        if final_doc.get('is_relevant'):
+            stats["items_relevant"] += 1
+        if final_doc.get('is_new'):
+            stats["items_new"] += 1
+        if final_doc.get('prefilter_passed') is False:
+            stats["prefilter_rejected"] += 1
+            if final_doc.get('is_relevant'):
+                stats["prefilter_false_negatives"] += 1
+        if final_doc.get('relevance_tier'):
+            stats["relevance_classified"] += 1
+            if final_doc.get('relevance_escalated'):
+                stats["relevance_escalated"] += 1
+            if final_doc.get('relevance_batched'):
+                stats["relevance_batched"] += 1
+
+def record_persist_failures(stats: Dict[str, Any], failed_docs: List[dict]):
+    """
+    Takes documents whose item could not be written back out of the item counters
+    (record_outcome counted them when their graph run finished) and logs them.
+    """
+    stats["persist_failures"] = len(failed_docs)
+    for doc in failed_docs:
+        stats["items_processed"] -= 1
+        if doc.get('is_relevant'):
+            stats["items_relevant"] -= 1
+        if doc.get('is_new'):
+            stats["items_new"] -= 1
+        stats["error_log"] += f"Doc {doc.get('raw_document_id')}: item not persisted\n"
+
+def process_document(doc_id: int, stats: Dict[str, Any], lock: threading.Lock):
+    """
+    Runs one raw document through the graph and folds the outcome into stats.
+    Safe to call from several worker threads sharing the same stats/lock.
+    """
     try:
-        for doc_id in new_doc_ids:
-            # Fetch full doc
-            c.execute('SELECT * FROM raw_documents WHERE id = ?', (doc_id,))
-            row = c.fetchone()
-            if not row:
-                continue
-                
-            doc_dict = dict(row)
-            
-            # Run Graph
-            initial_state = {
-                "raw_document_id": doc_id,
-                "doc": doc_dict,
-                "status": "pending"
-            }
-            
-            try:
-                final_state = app_graph.invoke(initial_state)
-                final_doc = final_state['doc']
-                
-                stats["items_processed"] += 1
-                if final_doc.get('is_relevant'):
-                    stats["items_relevant"] += 1
-                if final_doc.get('is_new'):
-                    stats["items_new"] += 1
-                    
-            except Exception as e:
-                logger.error(f"Error processing doc {doc_id}: {e}")
-                stats["error_log"] += f"Doc {doc_id}: {str(e)}\n"
-                
+        initial_state = build_initial_state(doc_id)
+        if not initial_state:
+            return
+        outcome = app_graph.invoke(initial_state)
     except Exception as e:
-        logger.error(f"Pipeline flow error: {e}")
-        stats["error_log"] += f"Global: {str(e)}\n"
+        outcome = e
+    record_outcome(stats, doc_id, outcome, lock)
+
+def run_batch(doc_ids: List[int], stats: Dict[str, Any], workers: int, use_async: bool = False,
+              batch_relevance: bool = True, deferred: Optional[List[int]] = None):
+    """
+    Pushes many documents through the graph at once with at most `workers` in flight.
+    LLM and embedding calls inside the graph share the OpenAI rate budgets.
+    With `deferred`, documents whose LLM calls were queued for a batch job are collected there.
+    """
+    lock = threading.Lock()
+    states = []
+    for doc_id in doc_ids:
+        try:
+            state = build_initial_state(doc_id)
+        except Exception as e:
+            state = None
+            record_outcome(stats, doc_id, e, lock)
+        if state:
+            states.append(state)
+
+    if not states:
+        return
+
+    # Documents of one batch may share relevance requests (see RelevanceBatcher)
+    config = {"max_concurrency": max(1, workers), "configurable": {"batch_relevance": batch_relevance}}
+    if use_async:
+        outcomes = asyncio.run(app_graph.abatch(states, config=config, return_exceptions=True))
+    else:
+        outcomes = app_graph.batch(states, config=config, return_exceptions=True)
+
+    for state, outcome in zip(states, outcomes):
+        record_outcome(stats, state["raw_document_id"], outcome, lock, deferred)
+
+def run_batch_api(doc_ids: List[int], stats: Dict[str, Any], workers: int, backend_name: str = BATCH_API_BACKEND,
+                  max_rounds: int = BATCH_API_MAX_ROUNDS):
+    """
+    Nightly/backfill mode: each round runs the graph with LLM calls deferred, so every document
+    that needs an uncached answer stops at that call and its request joins one batch job.
+    The job's answers go into the response cache and those documents are run again, resuming
+    from the cached answers (relevance, then escalations, then summaries).
+    Documents still waiting after max_rounds are finished with direct calls.
+    """
+    if not LLM_CACHE_ENABLED:
+        raise RuntimeError("--batch-api needs LLM_CACHE_ENABLED=true (batch answers are replayed from the cache)")
+    backend = get_batch_backend(backend_name)
+    pending = list(doc_ids)
+    for round_number in range(1, max_rounds + 1):
+        job = BatchJob()
+        deferred: List[int] = []
+        set_batch_job(job)
+        try:
+            # Batched relevance groups documents by timing, which a replay wouldn't reproduce
+            run_batch(pending, stats, workers, batch_relevance=False, deferred=deferred)
+        finally:
+            set_batch_job(None)
+        if not deferred:
+            return
+        logger.info(f"Batch round {round_number}: {len(job)} requests for {len(deferred)} documents")
+        stats["batch_api_rounds"] = round_number
+        stats["batch_api_requests"] = stats.get("batch_api_requests", 0) + len(job)
+        job.run(backend)
+        pending = deferred
+
+    logger.info(f"{len(pending)} documents still waiting after {max_rounds} batch rounds; calling directly")
+    run_batch(pending, stats, workers)
+
+def run_streaming(collector: Collector, stats: Dict[str, Any], workers: int) -> List[int]:
+    """
+    Overlaps scraping and graph processing: the collector pushes each stored id onto a
+    bounded queue while `workers` graph threads drain it. A full queue blocks the
+    scrapers, so collection never runs far ahead of the LLM stage.
+    """
+    doc_queue: queue.Queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    lock = threading.Lock()
+
+    def consume():
+        while True:
+            doc_id = doc_queue.get()
+            if doc_id is _DONE:
+                return
+            process_document(doc_id, stats, lock)
+
+    consumers = [
+        threading.Thread(target=consume, name=f"graph-worker-{i}", daemon=True)
+        for i in range(max(1, workers))
+    ]
+    for t in consumers:
+        t.start()
+
+    try:
+        return collector.run(on_document=doc_queue.put)
     finally:
-        conn.close()
-        
+        for _ in consumers:
+            doc_queue.put(_DONE)
+        for t in consumers:
+            t.join()
+
+def finish_stage_metrics(run_id: Optional[int]):
+    """
+    Writes the remaining stage timings, logs p50/p95/max wall time per stage and, with
+    METRICS_EXPORT_PATH set, exports the run's stage summary.
+    """
+    recorder.flush()
+    if run_id is None:
+        return
+    try:
+        if METRICS_EXPORT_PATH:
+            summary = export_run_metrics(run_id, METRICS_EXPORT_PATH, METRICS_EXPORT_FORMAT)
+            logger.info(f"Stage metrics exported to {METRICS_EXPORT_PATH} ({METRICS_EXPORT_FORMAT})")
+        else:
+            summary = crud.get_run_stage_summary(run_id)
+    except Exception as e:
+        logger.error(f"Stage metrics export error: {e}")
+        return
+    for stage, stage_stats in summary.items():
+        wall, ext, wait = stage_stats["wall_ms"], stage_stats["external_ms"], stage_stats["queue_wait_ms"]
+        logger.info(f"Stage {stage}: {stage_stats['count']} runs, wall p50/p95/max "
+                    f"{wall['p50']}/{wall['p95']}/{wall['max']} ms, external p95 {ext['p95']} ms, "
+                    f"queue wait p95 {wait['p95']} ms, total {wall['total'] / 1000:.1f}s")
+
+def resume_run(run_id: int, stats: Dict[str, Any]) -> Optional[List[int]]:
+    """
+    Reopens an interrupted run and returns the documents it had not persisted yet
+    (None if the run doesn't exist). The items it already persisted count towards stats;
+    they are recounted from the items table, as a crashed run never wrote its counters.
+    """
+    if crud.reopen_run(run_id) is None:
+        return None
+    stats.update(crud.get_run_item_counts(run_id))
+    checkpoints = crud.get_run_checkpoints(run_id)
+    return [doc_id for doc_id, (stage, _) in checkpoints.items() if stage != crud.PERSIST_STAGE]
+
+def run_pipeline(mock: bool = False, stream: bool = False, workers: int = PIPELINE_WORKERS,
+                 use_async: bool = False, batch_api: bool = False, resume: Optional[int] = None):
+    logger.info(f"Starting Daily Run (Mock={mock}, Stream={stream}, Workers={workers}, Async={use_async}, "
+                f"BatchAPI={batch_api}, Resume={resume})")
+
+    # Bring older databases up to the current schema (e.g. change-tracking columns)
+    migrate_db()
+
+    collector = Collector(mock=mock)
+    stats = new_stats()
+    if resume is not None:
+        # Continue an interrupted run: no collection, only its unfinished documents
+        new_doc_ids = resume_run(resume, stats)
+        if new_doc_ids is None:
+            logger.error(f"Run {resume} not found; nothing to resume.")
+            return
+        run_id = resume
+        logger.info(f"Resuming run {run_id}: {len(new_doc_ids)} documents not persisted yet.")
+    else:
+        run_id = crud.start_run()
+        logger.info(f"Run {run_id} started (continue it with --resume {run_id} if interrupted).")
+    # LLM calls, stage checkpoints and stage timings from here on are recorded against this run
+    set_run_id(run_id)
+    recorder.start(run_id)
+
+    if stream:
+        # 1+2. Collect and process concurrently
+        try:
+            new_doc_ids = run_streaming(collector, stats, workers)
+            logger.info(f"Collector finished. {len(new_doc_ids)} new or changed raw documents.")
+        except Exception as e:
+            logger.error(f"Pipeline flow error: {e}")
+            stats["error_log"] += f"Global: {str(e)}\n"
+    else:
+        # 1. Collect
+        if resume is None:
+            new_doc_ids = collector.run()
+            logger.info(f"Collector finished. {len(new_doc_ids)} new or changed raw documents.")
+
+        if not new_doc_ids:
+            logger.info("No new or changed documents to process.")
+            crud.update_run_progress(run_id)
+            finish_stage_metrics(run_id)
+            crud.finish_run(run_id, "success", stats)
+            return
+
+        # 2. Process the new documents through the graph
+        try:
+            if batch_api:
+                run_batch_api(new_doc_ids, stats, workers)
+            else:
+                run_batch(new_doc_ids, stats, workers, use_async=use_async)
+        except Exception as e:
+            logger.error(f"Pipeline flow error: {e}")
+            stats["error_log"] += f"Global: {str(e)}\n"
+
+    # Write whatever the persist node still has buffered
+    try:
+        with span("persist_flush"):
+            persist_buffer.flush()
+    except Exception as e:
+        logger.error(f"Persist flush error: {e}")
+        stats["error_log"] += f"Persist: {str(e)}\n"
+    record_persist_failures(stats, persist_buffer.item_failures)
+
     # 3. Log Run
-    crud.log_run("success", stats)
+    embedding_stats = get_embedding_service().stats()
+    stats["embedding_cache_hits"] = embedding_stats["memory_hits"] + embedding_stats["disk_hits"]
+    stats["embedding_cache_misses"] = embedding_stats["misses"]
+    stats["vector_index_failures"] = len(persist_buffer.vector_failures)
+    retrieval_stats = relevance_agent.retriever.cache.stats()
+    stats["retrieval_cache_hits"] = retrieval_stats["exact_hits"] + retrieval_stats["near_hits"]
+    stats["retrieval_cache_misses"] = retrieval_stats["misses"]
+    stats["retrieval_cache_hit_rate"] = retrieval_stats["hit_rate"]
+    llm_cache_stats = get_response_cache().stats()
+    stats["llm_cache_hits"] = llm_cache_stats["hits"]
+    stats["llm_cache_misses"] = llm_cache_stats["misses"]
+    if stats["relevance_classified"]:
+        stats["relevance_escalation_rate"] = round(
+            stats["relevance_escalated"] / stats["relevance_classified"], 3
+        )
+    if stats["items_relevant"]:
+        stats["prefilter_false_negative_rate"] = round(
+            stats["prefilter_false_negatives"] / stats["items_relevant"], 3
+        )
+    if run_id is not None:
+        llm_summary = crud.get_run_llm_summary(run_id)
+        totals = llm_summary["all"]
+        stats["llm_calls"] = totals["calls"]
+        stats["llm_prompt_tokens"] = totals["prompt_tokens"]
+        stats["llm_completion_tokens"] = totals["completion_tokens"]
+        stats["llm_cost_usd"] = totals["cost_usd"]
+        stats["llm_latency_p50_ms"] = totals["latency_p50_ms"]
+        stats["llm_latency_p95_ms"] = totals["latency_p95_ms"]
+        for stage, stage_totals in llm_summary.items():
+            if stage != "all":
+                logger.info(f"LLM stage {stage}: {stage_totals}")
+        progress = crud.update_run_progress(run_id)
+        logger.info(f"Stage progress: {progress}")
+        # Snapshots only matter for resuming; keep them while documents are still unpersisted
+        if progress and progress["docs_persisted"] >= progress["docs_total"]:
+            crud.clear_run_snapshots(run_id)
+    finish_stage_metrics(run_id)
+    crud.finish_run(run_id, "success", stats)
     logger.info(f"Run completed. Stats: {stats}")
 
 if __name__ == "__main__":
     setup_logging()
     parser = argparse.ArgumentParser()
     parser.add_argument("--mock", action="store_true", help="Run with mock data if needed")
+    parser.add_argument("--stream", action="store_true",
+                        help="Process documents through the graph while collection is still running")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS,
+                        help="Number of documents processed through the graph concurrently")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run the graph batch on an asyncio event loop (abatch)")
+    parser.add_argument("--batch-api", dest="batch_api", action="store_true",
+                        help="Send LLM requests as batch jobs (BATCH_API_BACKEND) and resume from their results")
+    parser.add_argument("--resume", type=int, metavar="RUN_ID",
+                        help="Finish an interrupted run: skip collection and continue its unpersisted documents "
+                             "from their last completed stage")
     args = parser.parse_args()
-    
-    run_pipeline(mock=args.mock)
+    if args.batch_api and args.stream:
+        parser.error("--batch-api collects all documents first and can't be combined with --stream")
+    if args.resume is not None and args.stream:
+        parser.error("--resume continues the documents of an earlier run and can't be combined with --stream")
+
+    run_pipeline(mock=args.mock, stream=args.stream, workers=args.workers, use_async=args.use_async,
+                 batch_api=args.batch_api, resume=args.resume)
@@ -0,0 +1,180 @@
+import json
+import os
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from pipeline.config import STAGE_METRICS_ENABLED
+import pipeline.db.crud as crud
+
+logger = logging.getLogger(__name__)
+
+# Metric rows buffered before one executemany
+FLUSH_ROWS = 200
+
+class Span:
+    """
+    Timing of one stage of one document (or one scrape). external() and waiting() blocks
+    run while it is active add to it, also from worker threads started with its context.
+    """
+    def __init__(self, stage: str, raw_document_id: Optional[int] = None, source: Optional[str] = None,
+                 queue_wait: float = 0.0):
+        self.stage = stage
+        self.raw_document_id = raw_document_id
+        self.source = source
+        self.external = 0.0
+        self.wait = max(0.0, queue_wait)
+        self.lock = threading.Lock()
+
+    def add(self, external: float = 0.0, wait: float = 0.0):
+        with self.lock:
+            self.external += external
+            self.wait += wait
+
+_current: ContextVar[Optional[Span]] = ContextVar("stage_span", default=None)
+
+@contextmanager
+def external():
+    """
+    Marks an API, Qdrant or scrape call; its duration counts as external time of the active span.
+    """
+    span = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if span is not None:
+            span.add(external=time.perf_counter() - start)
+
+@contextmanager
+def waiting():
+    """
+    Marks a wait for a rate limit or politeness slot; counts as queue wait of the active span.
+    """
+    span = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if span is not None:
+            span.add(wait=time.perf_counter() - start)
+
+class MetricsRecorder:
+    """
+    Buffers finished spans of the current run and writes them to stage_metrics in batches.
+    Nothing is recorded outside a run (run_id None) or with STAGE_METRICS_ENABLED=false.
+    """
+    def __init__(self, enabled: bool = STAGE_METRICS_ENABLED):
+        self.enabled = enabled
+        self.run_id: Optional[int] = None
+        self.pending: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def start(self, run_id: Optional[int]):
+        self.flush()
+        self.run_id = run_id
+
+    def add(self, span: Span, wall: float, status: str):
+        if not self.enabled or self.run_id is None:
+            return
+        row = {"run_id": self.run_id, "raw_document_id": span.raw_document_id, "stage": span.stage,
+               "source": span.source, "wall_ms": wall * 1000, "external_ms": span.external * 1000,
+               "queue_wait_ms": span.wait * 1000, "status": status}
+        with self.lock:
+            self.pending.append(row)
+            if len(self.pending) < FLUSH_ROWS:
+                return
+            rows, self.pending = self.pending, []
+        crud.insert_stage_metrics(rows)
+
+    def flush(self):
+        with self.lock:
+            rows, self.pending = self.pending, []
+        crud.insert_stage_metrics(rows)
+
+recorder = MetricsRecorder()
+
+@contextmanager
+def span(stage: str, raw_document_id: Optional[int] = None, source: Optional[str] = None,
+         queue_wait: float = 0.0):
+    """
+    Times the block as `stage` and records it. Exceptions are recorded with status 'error',
+    or their `trace_status` attribute (e.g. 'deferred' for batch-API deferrals), and re-raised.
+    """
+    current = Span(stage, raw_document_id, source, queue_wait)
+    token = _current.set(current)
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        status = getattr(e, 'trace_status', 'error')
+        raise
+    finally:
+        _current.reset(token)
+        recorder.add(current, time.perf_counter() - start, status)
+
+def traced(stage: str):
+    """
+    Graph node decorator: records the node as `stage` of the state's document. Queue wait is the
+    time since the previous node (or build_initial_state) finished, plus rate-limit waits.
+    """
+    def decorator(node):
+        @functools.wraps(node)
+        def wrapper(state: Dict[str, Any], *args, **kwargs):
+            ready = state.get('stage_finished_at')
+            queue_wait = time.monotonic() - ready if ready is not None else 0.0
+            with span(stage, state.get('raw_document_id'), queue_wait=queue_wait):
+                update = node(state, *args, **kwargs)
+            return {**update, "stage_finished_at": time.monotonic()}
+        return wrapper
+    return decorator
+
+def format_prometheus(run_id: int, summary: Dict[str, Any]) -> str:
+    """
+    Prometheus text exposition of a run's stage summary: one summary metric per time kind,
+    with p50/p95 as quantiles 0.5/0.95 and the max as quantile 1.
+    """
+    lines = []
+    for column, kind in (('wall_ms', 'wall'), ('external_ms', 'external'), ('queue_wait_ms', 'queue_wait')):
+        name = f"housing_monitor_stage_{kind}_seconds"
+        lines.append(f"# HELP {name} Per-document {kind.replace('_', ' ')} time of a pipeline stage")
+        lines.append(f"# TYPE {name} summary")
+        for stage, stats in sorted(summary.items()):
+            labels = f'run_id="{run_id}",stage="{stage}"'
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max")):
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} {stats[column][key] / 1000:.6f}')
+            lines.append(f"{name}_sum{{{labels}}} {stats[column]['total'] / 1000:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {stats['count']}")
+    lines.append("# HELP housing_monitor_stage_errors Stage executions that raised")
+    lines.append("# TYPE housing_monitor_stage_errors gauge")
+    for stage, stats in sorted(summary.items()):
+        lines.append(f'housing_monitor_stage_errors{{run_id="{run_id}",stage="{stage}"}} {stats["errors"]}')
+    return "\n".join(lines) + "\n"
+
+def format_json(run_id: int, summary: Dict[str, Any]) -> str:
+    return json.dumps({"run_id": run_id, "stages": summary}, indent=2)
+
+EXPORT_FORMATS = {
+    "prometheus": format_prometheus,
+    "json": format_json,
+}
+
+def export_run_metrics(run_id: int, path: str, fmt: str = "prometheus") -> Dict[str, Any]:
+    """
+    Writes the stage summary of a run to path (atomically, so a scraper never reads half a file).
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown metrics format '{fmt}'. Available: {', '.join(EXPORT_FORMATS)}")
+    summary = crud.get_run_stage_summary(run_id)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(EXPORT_FORMATS[fmt](run_id, summary))
+    os.replace(tmp_path, path)
+    return summary
@@ -1,6 +1,97 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from qdrant_client.http.models import (
+    Filter, FieldCondition, MatchValue, PayloadSchemaType, VectorParams, HnswConfigDiff,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization,
+    BinaryQuantizationConfig, SearchParams, QuantizationSearchParams
+)
+from pipeline.config import KB_COLLECTION_PROFILE, LEGISLATION_COLLECTION_PROFILE, EMBEDDING_DIM
+
 KB_COLLECTION_NAME = "kb_chunks"
 LEGISLATION_COLLECTION_NAME = "legislation_chunks"
 
-# Using standard OpenAI embedding size
-VECTOR_SIZE = 1536 
+# Embedding size after truncation (1536 is the full text-embedding-3-small output)
+VECTOR_SIZE = EMBEDDING_DIM
 DISTANCE_METRIC = "Cosine"
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """
+    Storage/index settings a collection is created with, and the matching search params.
+    quantization: None, 'scalar' (int8, 4x smaller) or 'binary' (1 bit/dim, 32x smaller).
+    Quantized vectors stay in RAM; with on_disk the float32 originals are memory-mapped
+    and only read to rescore the top `oversampling * limit` candidates.
+    """
+    name: str
+    quantization: Optional[str] = None
+    on_disk: bool = False
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    oversampling: float = 1.0
+    rescore: bool = True
+
+    def create_kwargs(self, vector_size: int = None) -> Dict[str, Any]:
+        """
+        Keyword arguments for QdrantClient.create_collection.
+        """
+        quantization_config = None
+        if self.quantization == "scalar":
+            quantization_config = ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        elif self.quantization == "binary":
+            quantization_config = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return {
+            "vectors_config": VectorParams(size=vector_size or VECTOR_SIZE, distance=DISTANCE_METRIC,
+                                           on_disk=self.on_disk),
+            "hnsw_config": HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct),
+            "quantization_config": quantization_config,
+        }
+
+    def search_params(self) -> Optional[SearchParams]:
+        if self.quantization is None:
+            return None
+        return SearchParams(quantization=QuantizationSearchParams(rescore=self.rescore,
+                                                                  oversampling=self.oversampling))
+
+COLLECTION_PROFILES = {
+    # Plain float32 vectors in RAM (Qdrant defaults)
+    "default": CollectionProfile("default"),
+    # int8 in RAM, originals on disk; recall close to float32
+    "scalar": CollectionProfile("scalar", quantization="scalar", on_disk=True, oversampling=2.0),
+    # 1-bit in RAM, originals on disk; needs more oversampling to keep recall
+    "binary": CollectionProfile("binary", quantization="binary", on_disk=True, oversampling=3.0),
+    # Smallest footprint: scalar quantization and a sparser HNSW graph
+    "compact": CollectionProfile("compact", quantization="scalar", on_disk=True, hnsw_m=8,
+                                 hnsw_ef_construct=64, oversampling=2.0),
+}
+
+def get_profile(name: str) -> CollectionProfile:
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Unknown collection profile '{name}' (choose from {', '.join(COLLECTION_PROFILES)})")
+    return COLLECTION_PROFILES[name]
+
+# Profiles the collections are created with (scripts/init_qdrant.py) and searched with
+KB_PROFILE = get_profile(KB_COLLECTION_PROFILE)
+LEGISLATION_PROFILE = get_profile(LEGISLATION_COLLECTION_PROFILE)
+
+# Payload fields of LEGISLATION_COLLECTION_NAME that get a Qdrant payload index (created by
+# scripts/init_qdrant.py) so filtered queries don't scan every point
+LEGISLATION_PAYLOAD_INDEXES = {
+    # Points are chunks; search groups them back into items
+    "item_id": PayloadSchemaType.INTEGER,
+    "county": PayloadSchemaType.KEYWORD,
+    "source_type": PayloadSchemaType.KEYWORD,
+    "indexed_at": PayloadSchemaType.DATETIME,
+}
+
+def payload_filter(county: Optional[str] = None, source_type: Optional[str] = None) -> Optional[Filter]:
+    """
+    Exact-match filter on the indexed keyword fields; None when nothing to filter on.
+    """
+    conditions = [
+        FieldCondition(key=key, match=MatchValue(value=value))
+        for key, value in (("county", county), ("source_type", source_type))
+        if value
+    ]
+    return Filter(must=conditions) if conditions else None
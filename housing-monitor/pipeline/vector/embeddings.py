@@ -0,0 +1,147 @@
+import hashlib
+import math
+import sqlite3
+import threading
+import logging
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from pipeline.config import EMBEDDING_MODEL, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_SIZE, EMBEDDING_DIM
+from pipeline.llm.rate_limit import embedding_limiter, estimate_tokens
+from pipeline.tracing import external
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def truncate_embedding(vector: List[float], dimensions: Optional[int]) -> List[float]:
+    """
+    Matryoshka shortening: keep the first `dimensions` components and re-normalize to unit length
+    (what the API's `dimensions` parameter does for text-embedding-3 models).
+    """
+    if not dimensions or dimensions >= len(vector):
+        return vector
+    head = vector[:dimensions]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+class EmbeddingService(Embeddings):
+    """
+    OpenAI embeddings behind a two-level cache: an in-memory LRU in front of a
+    SQLite table keyed on (sha256(text), model). Only texts missing from both
+    levels are sent to the API, in a single batched request.
+    Full-size vectors are cached; results are truncated to `dimensions` on the way out,
+    so one cache serves every dimension.
+    Drop-in replacement for OpenAIEmbeddings (embed_query / embed_documents).
+    """
+    def __init__(self, model: str = EMBEDDING_MODEL, cache_path: str = EMBEDDING_CACHE_PATH,
+                 memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE, dimensions: Optional[int] = EMBEDDING_DIM):
+        self.model = model
+        self.dimensions = dimensions
+        self.client = OpenAIEmbeddings(model=model)
+        self.memory_size = memory_size
+        self.memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                text_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (text_hash, model)
+            )
+        ''')
+        self.conn.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        # Caller holds self.lock
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _lookup_disk(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[start:start + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embedding_cache WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model, *batch]
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array('f', blob).tolist()
+        return found
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_hash(t) for t in texts]
+        vectors: Dict[str, List[float]] = {}
+
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    vectors[key] = self.memory[key]
+                    self.counters["memory_hits"] += 1
+
+            pending = list(dict.fromkeys(k for k in keys if k not in vectors))
+            if pending:
+                disk = self._lookup_disk(pending)
+                for key, vector in disk.items():
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                self.counters["disk_hits"] += len(disk)
+
+        # Embed whatever is left, once per distinct text, outside the lock
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        if missing:
+            missing_texts = list(missing.values())
+            embedding_limiter.acquire(sum(estimate_tokens(t) for t in missing_texts))
+            with external():
+                fresh = self.client.embed_documents(missing_texts)
+            with self.lock:
+                self.counters["misses"] += len(missing)
+                rows = []
+                for key, vector in zip(missing.keys(), fresh):
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                    rows.append((key, self.model, array('f', vector).tobytes()))
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (text_hash, model, vector) VALUES (?, ?, ?)",
+                    rows
+                )
+                self.conn.commit()
+
+        return [truncate_embedding(vectors[key], self.dimensions) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    Process-wide EmbeddingService shared by the RAG retriever, dedupe, persistence and the UI.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
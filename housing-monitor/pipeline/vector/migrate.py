@@ -0,0 +1,87 @@
+import logging
+from typing import Callable, Dict, List, Optional
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct, Record, PayloadSchemaType
+from pipeline.vector.collections import CollectionProfile
+
+logger = logging.getLogger(__name__)
+
+# Points read and written per request while copying
+COPY_BATCH = 256
+
+# Turns a page of source points into the points to write (e.g. re-embedded vectors)
+PointTransform = Callable[[List[Record]], List[PointStruct]]
+
+def _as_points(records: List[Record]) -> List[PointStruct]:
+    return [PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records]
+
+def copy_points(client: QdrantClient, source: str, target: str,
+                transform: Optional[PointTransform] = None) -> int:
+    """
+    Copies every point (vector and payload) of `source` into `target`. Returns the count.
+    """
+    copied = 0
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=source,
+            limit=COPY_BATCH,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        if records:
+            points = transform(records) if transform else _as_points(records)
+            client.upsert(collection_name=target, points=points, wait=True)
+            copied += len(points)
+            logger.info(f"Copied {copied} points {source} -> {target}")
+        if offset is None:
+            return copied
+
+def _create(client: QdrantClient, name: str, profile: CollectionProfile, vector_size: Optional[int],
+            payload_indexes: Dict[str, PayloadSchemaType]):
+    client.create_collection(collection_name=name, **profile.create_kwargs(vector_size))
+    for field_name, field_schema in payload_indexes.items():
+        client.create_payload_index(collection_name=name, field_name=field_name, field_schema=field_schema)
+
+def rebuild_collection(client: QdrantClient, name: str, profile: CollectionProfile,
+                       vector_size: Optional[int] = None, transform: Optional[PointTransform] = None,
+                       payload_indexes: Optional[Dict[str, PayloadSchemaType]] = None) -> int:
+    """
+    Recreates `name` under `profile` (and optionally a new vector size, which needs a
+    re-embedding `transform`), keeping its points.
+    Points are staged in '<name>__rebuild' first, so the collection is only dropped once a
+    full copy exists. If a run dies after the drop, rerunning resumes from the staged copy.
+    Returns the number of points in the rebuilt collection.
+    """
+    staging = f"{name}__rebuild"
+    payload_indexes = payload_indexes or {}
+
+    # Both exist after a crash while copying back: the staged copy is the complete one
+    if client.collection_exists(name) and client.collection_exists(staging):
+        if client.count(collection_name=staging, exact=True).count > client.count(collection_name=name, exact=True).count:
+            client.delete_collection(name)
+
+    if client.collection_exists(name):
+        if vector_size is None:
+            vector_size = client.get_collection(name).config.params.vectors.size
+        if client.collection_exists(staging):
+            client.delete_collection(staging)
+        _create(client, staging, profile, vector_size, payload_indexes)
+        staged = copy_points(client, name, staging, transform)
+        original = client.count(collection_name=name, exact=True).count
+        if staged != original:
+            raise RuntimeError(f"Staged {staged} of {original} points; '{name}' left untouched")
+        client.delete_collection(name)
+    elif not client.collection_exists(staging):
+        raise ValueError(f"Collection '{name}' does not exist")
+    else:
+        logger.warning(f"Resuming rebuild of '{name}' from '{staging}'")
+        if vector_size is None:
+            vector_size = client.get_collection(staging).config.params.vectors.size
+
+    _create(client, name, profile, vector_size, payload_indexes)
+    # Vectors were already transformed on the way into staging
+    copied = copy_points(client, staging, name)
+    client.delete_collection(staging)
+    return copied
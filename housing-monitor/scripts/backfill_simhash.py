@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.collector.normalize import compute_simhash
+from pipeline.db.migrate import migrate_db
+import pipeline.db.crud as crud
+
+def backfill():
+    """
+    Computes SimHash signatures for relevant items persisted before the
+    near-duplicate tier existed, from their raw document's content.
+    """
+    migrate_db()
+    items = crud.get_items_missing_simhash()
+    for item in items:
+        item['simhash'] = compute_simhash(item.pop('content_text'))
+    inserted = crud.insert_simhashes(items)
+    print(f"Indexed {inserted} of {len(items)} items without a signature.")
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, VectorParams, PointStruct
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import QDRANT_URL, SOURCES
+from pipeline.vector.collections import LEGISLATION_PAYLOAD_INDEXES, payload_filter
+
+BENCH_COLLECTION = "bench_payload_filter"
+UPLOAD_BATCH = 512
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+def time_queries(client, queries, county_of_query, filtered: bool):
+    samples = []
+    for vector, county in zip(queries, county_of_query):
+        start = time.perf_counter()
+        client.query_points(
+            collection_name=BENCH_COLLECTION,
+            query=vector.tolist(),
+            query_filter=payload_filter(county=county) if filtered else None,
+            limit=1
+        )
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def run(client: QdrantClient, sizes, dim: int, num_queries: int, seed: int):
+    rng = np.random.default_rng(seed)
+    counties = sorted({s["county"] for s in SOURCES})
+    print(f"{len(counties)} counties, dim {dim}, {num_queries} queries per case (latency in ms)")
+    print(f"{'points':>8} | {'unfiltered p50/p95':>20} | {'filter, no index':>20} | {'filter + index':>20}")
+
+    for size in sizes:
+        if client.collection_exists(BENCH_COLLECTION):
+            client.delete_collection(BENCH_COLLECTION)
+        client.create_collection(
+            collection_name=BENCH_COLLECTION,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+        )
+        try:
+            for start in range(0, size, UPLOAD_BATCH):
+                count = min(UPLOAD_BATCH, size - start)
+                vectors = rng.normal(size=(count, dim)).astype(np.float32)
+                client.upsert(
+                    collection_name=BENCH_COLLECTION,
+                    points=[
+                        PointStruct(id=start + i, vector=vectors[i].tolist(),
+                                    payload={"county": counties[rng.integers(len(counties))]})
+                        for i in range(count)
+                    ]
+                )
+
+            queries = rng.normal(size=(num_queries, dim)).astype(np.float32)
+            county_of_query = [counties[rng.integers(len(counties))] for _ in range(num_queries)]
+
+            unfiltered = time_queries(client, queries, county_of_query, filtered=False)
+            no_index = time_queries(client, queries, county_of_query, filtered=True)
+            client.create_payload_index(
+                collection_name=BENCH_COLLECTION,
+                field_name="county",
+                field_schema=LEGISLATION_PAYLOAD_INDEXES["county"],
+                wait=True
+            )
+            indexed = time_queries(client, queries, county_of_query, filtered=True)
+
+            cells = [f"{percentile_ms(s, 50):>9.2f}/{percentile_ms(s, 95):<10.2f}" for s in (unfiltered, no_index, indexed)]
+            print(f"{size:>8} | {cells[0]:>20} | {cells[1]:>20} | {cells[2]:>20}")
+        finally:
+            client.delete_collection(BENCH_COLLECTION)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qdrant query latency vs. collection size, with and without a county filter")
+    parser.add_argument("--url", default=QDRANT_URL, help="Qdrant URL, or ':memory:' for the local client (no real indexes)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client = QdrantClient(location=":memory:") if args.url == ":memory:" else QdrantClient(url=args.url)
+    run(client, args.sizes, args.dim, args.queries, args.seed)
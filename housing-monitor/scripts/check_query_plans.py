@@ -0,0 +1,66 @@
+import os
+import re
+import sys
+import sqlite3
+import argparse
+import tempfile
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.db.migrate import migrate
+import pipeline.db.crud as crud
+import pipeline.agents.dedupe as dedupe
+
+# Every *_SQL constant in these modules is checked
+QUERY_MODULES = [crud, dedupe]
+
+# Number of values used to fill '{placeholders}' in IN-list queries
+IN_LIST_SIZE = 3
+
+# A SCAN is only acceptable when it walks an index (e.g. ORDER BY processed_at ... LIMIT)
+_FULL_SCAN = re.compile(r"\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)")
+_TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+def collect_queries():
+    queries = {}
+    for module in QUERY_MODULES:
+        for name, value in vars(module).items():
+            if name.endswith('_SQL') and isinstance(value, str):
+                sql = value.replace('{placeholders}', ','.join('?' * IN_LIST_SIZE))
+                queries[f"{module.__name__}.{name}"] = sql
+    return queries
+
+def explain(conn: sqlite3.Connection, sql: str):
+    params = [None] * sql.count('?')
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def check(verbose: bool = False) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'plans.db'))
+        try:
+            version = migrate(conn)
+            queries = collect_queries()
+            print(f"Checking {len(queries)} queries against schema version {version}")
+
+            failures = 0
+            for name, sql in sorted(queries.items()):
+                plan = explain(conn, sql)
+                problems = [step for step in plan if _FULL_SCAN.search(step) or _TEMP_SORT in step]
+                status = "FAIL" if problems else "ok"
+                print(f"  [{status:>4}] {name}")
+                if problems or verbose:
+                    for step in plan:
+                        print(f"           {step}")
+                failures += bool(problems)
+        finally:
+            conn.close()
+
+    if failures:
+        print(f"{failures} queries need a full table scan or a temp sort; add an index in a migration.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if a pipeline query plan uses a full table scan or a temp sort")
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every query")
+    args = parser.parse_args()
+    sys.exit(check(args.verbose))
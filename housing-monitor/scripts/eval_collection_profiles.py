@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import QDRANT_URL
+from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME, COLLECTION_PROFILES, CollectionProfile
+
+EVAL_PREFIX = "profile_eval_"
+UPLOAD_BATCH = 256
+
+def load_vectors(client: QdrantClient, collection: str, limit: int) -> np.ndarray:
+    vectors = []
+    offset = None
+    while len(vectors) < limit:
+        records, offset = client.scroll(collection_name=collection, limit=min(256, limit - len(vectors)),
+                                        offset=offset, with_payload=False, with_vectors=True)
+        vectors.extend(r.vector for r in records)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def ram_estimate_mb(profile: CollectionProfile, count: int, dim: int) -> float:
+    """
+    Rough resident size: vectors kept in RAM plus HNSW links (m * 2 neighbours on layer 0, 4 bytes each).
+    """
+    original = 0 if profile.on_disk else count * dim * 4
+    quantized = {"scalar": count * dim, "binary": count * dim / 8}.get(profile.quantization, 0)
+    links = count * profile.hnsw_m * 2 * 4
+    return (original + quantized + links) / 2**20
+
+def evaluate_profile(client: QdrantClient, profile: CollectionProfile, corpus: np.ndarray,
+                     queries: np.ndarray, truth: np.ndarray, k: int):
+    name = EVAL_PREFIX + profile.name
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(collection_name=name, **profile.create_kwargs(corpus.shape[1]))
+    try:
+        for start in range(0, len(corpus), UPLOAD_BATCH):
+            client.upsert(collection_name=name, wait=True, points=[
+                PointStruct(id=start + i, vector=vector.tolist())
+                for i, vector in enumerate(corpus[start:start + UPLOAD_BATCH])
+            ])
+
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            hits = client.query_points(collection_name=name, query=query.tolist(), limit=k,
+                                       search_params=profile.search_params()).points
+            latencies.append(time.perf_counter() - started)
+            recalls.append(len({hit.id for hit in hits} & set(expected.tolist())) / k)
+        return float(np.mean(recalls)), latencies
+    finally:
+        client.delete_collection(name)
+
+def run(client: QdrantClient, source: str, limit: int, num_queries: int, k: int, synthetic: int, seed: int):
+    rng = np.random.default_rng(seed)
+    if synthetic:
+        vectors = rng.normal(size=(synthetic, 1536)).astype(np.float32)
+        print(f"Using {synthetic} synthetic vectors")
+    else:
+        vectors = load_vectors(client, source, limit)
+        print(f"Loaded {len(vectors)} vectors from '{source}'")
+    if len(vectors) <= num_queries + k:
+        print("Not enough vectors to evaluate; index more items or pass --synthetic N.")
+        return
+
+    # Held-out queries: stored items searched against the rest, like a new document would be
+    order = rng.permutation(len(vectors))
+    queries, corpus = vectors[order[:num_queries]], vectors[order[num_queries:]]
+    truth = exact_top_k(corpus, queries, k)
+
+    print(f"{len(corpus)} points, dim {corpus.shape[1]}, {num_queries} queries, recall@{k} vs exact search")
+    print(f"{'profile':>10} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8} {'RAM MB (est)':>13}")
+    for profile in COLLECTION_PROFILES.values():
+        recall, latencies = evaluate_profile(client, profile, corpus, queries, truth, k)
+        print(f"{profile.name:>10} {recall:>8.3f} {np.percentile(latencies, 50) * 1000:>8.2f} "
+              f"{np.percentile(latencies, 95) * 1000:>8.2f} {ram_estimate_mb(profile, len(corpus), corpus.shape[1]):>13.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall, latency and memory of the Qdrant collection profiles")
+    parser.add_argument("--url", default=QDRANT_URL, help="Qdrant URL, or ':memory:' for the local client")
+    parser.add_argument("--collection", default=LEGISLATION_COLLECTION_NAME, help="Collection whose vectors are used")
+    parser.add_argument("--limit", type=int, default=20000, help="Maximum vectors loaded from the collection")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random vectors instead of the collection")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client = QdrantClient(location=":memory:") if args.url == ":memory:" else QdrantClient(url=args.url)
+    run(client, args.collection, args.limit, args.queries, args.k, args.synthetic, args.seed)
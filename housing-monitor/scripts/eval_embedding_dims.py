@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from qdrant_client import QdrantClient
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import QDRANT_URL, DEDUPE_SIM_THRESHOLD
+from pipeline.vector.collections import LEGISLATION_COLLECTION_NAME
+from pipeline.vector.embeddings import EmbeddingService
+from pipeline.persist import EMBED_MAX_CHARS
+import pipeline.db.crud as crud
+
+FULL_DIM = 1536
+
+def load_full_vectors(client: QdrantClient, limit: int) -> np.ndarray:
+    """
+    Full-size legislation vectors: straight from Qdrant if the collection is still at
+    FULL_DIM, otherwise re-embedded from the items' text (served from the embedding cache).
+    """
+    full_size = client.get_collection(LEGISLATION_COLLECTION_NAME).config.params.vectors.size == FULL_DIM
+    vectors, texts, item_ids = [], [], []
+    offset = None
+    while len(vectors) + len(texts) + len(item_ids) < limit:
+        records, offset = client.scroll(collection_name=LEGISLATION_COLLECTION_NAME, limit=256, offset=offset,
+                                        with_payload=True, with_vectors=full_size)
+        for r in records:
+            if full_size:
+                vectors.append(r.vector)
+            elif r.payload.get('text'):
+                texts.append(r.payload['text'])
+            else:
+                item_ids.append(r.payload['item_id'])
+        if offset is None:
+            break
+    if not full_size:
+        contents = crud.get_item_contents(item_ids)
+        texts += [contents[i][:EMBED_MAX_CHARS] for i in item_ids if contents.get(i)]
+        vectors = EmbeddingService(dimensions=None).embed_documents(texts)
+    return np.asarray(vectors[:limit], dtype=np.float32)
+
+def truncate(matrix: np.ndarray, dim: int) -> np.ndarray:
+    head = matrix[:, :dim]
+    return head / np.maximum(np.linalg.norm(head, axis=1, keepdims=True), 1e-12)
+
+def evaluate(vectors: np.ndarray, dims, num_queries: int, k: int, threshold: float, seed: int):
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    # Held-out items play the role of new documents checked against the collection
+    queries, corpus = vectors[order[:num_queries]], vectors[order[num_queries:]]
+
+    base_scores = truncate(queries, FULL_DIM) @ truncate(corpus, FULL_DIM).T
+    base_top = np.argsort(-base_scores, axis=1)[:, :k]
+    base_best = base_scores.max(axis=1)
+    base_dup = base_best >= threshold
+
+    print(f"{len(corpus)} items, {num_queries} held-out queries, dedupe threshold {threshold:.2f}")
+    print(f"Baseline ({FULL_DIM} dims): {int(base_dup.sum())} of {num_queries} queries are duplicates")
+    print(f"{'dims':>6} {'recall@' + str(k):>10} {'dedupe agree':>13} {'dup rate':>9} {'ms/query':>9} {'MB vectors':>11}")
+    for dim in dims:
+        q, c = truncate(queries, dim), truncate(corpus, dim)
+        started = time.perf_counter()
+        scores = q @ c.T
+        top = np.argsort(-scores, axis=1)[:, :k]
+        elapsed = (time.perf_counter() - started) / num_queries
+
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, base_top)])
+        dup = scores.max(axis=1) >= threshold
+        # Agreement: same duplicate decision, and the same matched item when both say duplicate
+        same_match = top[:, 0] == base_top[:, 0]
+        agree = np.mean((dup == base_dup) & (~base_dup | same_match))
+        megabytes = len(corpus) * dim * 4 / 2**20
+        print(f"{dim:>6} {recall:>10.3f} {agree:>13.3f} {dup.mean():>9.3f} {elapsed * 1000:>9.3f} {megabytes:>11.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search recall and dedupe agreement of truncated embeddings vs. 1536 dims")
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 512, 768, 1024, FULL_DIM])
+    parser.add_argument("--limit", type=int, default=5000, help="Maximum items loaded")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=DEDUPE_SIM_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = load_full_vectors(QdrantClient(url=QDRANT_URL), args.limit)
+    if len(vectors) <= args.queries + args.k:
+        print(f"Only {len(vectors)} indexed items; need more than {args.queries + args.k}. Lower --queries.")
+    else:
+        evaluate(vectors, sorted(set(args.dims)), args.queries, args.k, args.threshold, args.seed)
@@ -0,0 +1,53 @@
+import os
+import sys
+import argparse
+import sqlite3
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import SQLITE_PATH, PREFILTER_MIN_SCORE
+from pipeline.agents.prefilter import LexicalPrefilter, PREFILTER_RATIONALE
+
+def load_labeled_docs():
+    """
+    Documents whose relevance was decided by the LLM (not by the prefilter itself).
+    """
+    conn = sqlite3.connect(SQLITE_PATH)
+    try:
+        rows = conn.execute('''
+            SELECT r.title, r.content_text, i.is_relevant
+            FROM items i
+            JOIN raw_documents r ON i.raw_document_id = r.id
+            WHERE i.relevance_rationale IS NULL OR i.relevance_rationale NOT LIKE ?
+        ''', (f"{PREFILTER_RATIONALE}%",)).fetchall()
+    finally:
+        conn.close()
+    return rows
+
+def evaluate(thresholds):
+    rows = load_labeled_docs()
+    if not rows:
+        print("No LLM-labeled items found. Run the pipeline (PREFILTER_MODE=measure) first.")
+        return
+
+    prefilter = LexicalPrefilter(mode="measure")
+    scored = [(prefilter.score(f"{title or ''}\n{content or ''}")[0], bool(relevant))
+              for title, content, relevant in rows]
+    total = len(scored)
+    relevant_total = sum(1 for _, relevant in scored if relevant)
+
+    print(f"Evaluated {total} LLM-labeled documents ({relevant_total} relevant)")
+    print(f"{'threshold':>10} {'skipped':>8} {'avoided %':>10} {'false neg':>10} {'FN rate':>8}")
+    for threshold in thresholds:
+        skipped = [relevant for score, relevant in scored if score < threshold]
+        false_negatives = sum(1 for relevant in skipped if relevant)
+        fn_rate = false_negatives / relevant_total if relevant_total else 0.0
+        print(f"{threshold:>10.2f} {len(skipped):>8} {100 * len(skipped) / total:>9.1f}% "
+              f"{false_negatives:>10} {fn_rate:>8.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure LLM calls avoided vs. false negatives of the lexical prefilter")
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=[0.5, 1.0, PREFILTER_MIN_SCORE, 2.0, 3.0, 5.0])
+    args = parser.parse_args()
+    evaluate(sorted(set(args.thresholds)))
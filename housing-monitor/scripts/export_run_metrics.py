@@ -0,0 +1,37 @@
+import os
+import sys
+import argparse
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.db.migrate import migrate_db
+from pipeline.tracing import EXPORT_FORMATS, export_run_metrics
+import pipeline.db.crud as crud
+
+def export(run_id: int, fmt: str, output: str):
+    """
+    Prints (or writes) the per-stage p50/p95/max timings of a run from stage_metrics.
+    """
+    migrate_db()
+    if run_id is None:
+        run_id = crud.get_latest_run_id()
+        if run_id is None:
+            print("No runs recorded yet.")
+            return
+    if output:
+        summary = export_run_metrics(run_id, output, fmt)
+        print(f"Wrote {len(summary)} stages of run {run_id} to {output}.")
+        return
+    summary = crud.get_run_stage_summary(run_id)
+    if not summary:
+        print(f"No stage metrics for run {run_id}.")
+        return
+    print(EXPORT_FORMATS[fmt](run_id, summary), end="")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the stage timings of a pipeline run")
+    parser.add_argument("--run-id", type=int, help="Run to export (default: the latest)")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="json")
+    parser.add_argument("--output", help="File to write instead of printing")
+    args = parser.parse_args()
+    export(args.run_id, args.format, args.output)
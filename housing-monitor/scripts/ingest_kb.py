@@ -1,36 +1,38 @@
 import os
 import sys
 import glob
+import uuid
+import hashlib
+import argparse
+from collections import Counter
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Qdrant
 from qdrant_client import QdrantClient
-from dotenv import load_dotenv
-
-# Load env vars
-load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+from qdrant_client.http.models import PointStruct, PointIdsList
 
 # Add parent directory to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import QDRANT_URL, KB_DIR
 from pipeline.vector.collections import KB_COLLECTION_NAME
+from pipeline.vector.embeddings import get_embedding_service
 
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
-KB_DIR = os.path.join(os.path.dirname(__file__), '../kb')
+# Namespace for deterministic chunk point ids
+KB_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "housing-monitor/kb_chunks")
 
-def ingest_kb():
-    print(f"Loading KB from {KB_DIR}...")
-    
-    client = QdrantClient(url=QDRANT_URL)
-    
-    # Check for API key
-    if not os.getenv("OPENAI_API_KEY"):
-        print("Error: OPENAI_API_KEY not found in environment.")
-        return
+# Chunks embedded and upserted per request
+BATCH_SIZE = 64
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
+def load_chunks():
+    """
+    Splits every kb/*.md file and returns {point_id: chunk document}.
+    Point ids are derived from (source file, chunk hash, occurrence), so an unchanged
+    chunk keeps its id even when text is inserted before it.
+    """
     documents = []
-    for file_path in glob.glob(os.path.join(KB_DIR, "*.md")):
-        print(f"Loading {os.path.basename(file_path)}...")
+    for file_path in sorted(glob.glob(os.path.join(KB_DIR, "*.md"))):
         loader = TextLoader(file_path)
         docs = loader.load()
         # Add metadata source
@@ -38,33 +40,93 @@ def ingest_kb():
             doc.metadata["source"] = os.path.basename(file_path)
         documents.extend(docs)
 
-    if not documents:
-        print("No documents found.")
-        return
-
-    print(f"Splitting {len(documents)} documents...")
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         separators=["\n\n", "\n", " ", ""]
     )
-    chunks = text_splitter.split_documents(documents)
-    print(f"Generated {len(chunks)} chunks.")
+    chunks = {}
+    seen = Counter()
+    for chunk in text_splitter.split_documents(documents):
+        digest = chunk_hash(chunk.page_content)
+        source = chunk.metadata["source"]
+        occurrence = seen[(source, digest)]
+        seen[(source, digest)] += 1
+        chunk.metadata["chunk_hash"] = digest
+        chunks[str(uuid.uuid5(KB_NAMESPACE, f"{source}:{digest}:{occurrence}"))] = chunk
+    return chunks
+
+def load_existing_ids(client: QdrantClient):
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=KB_COLLECTION_NAME,
+            limit=256,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        ids.update(str(point.id) for point in points)
+        if offset is None:
+            return ids
+
+def ingest_kb(dry_run: bool = False):
+    print(f"Loading KB from {KB_DIR}...")
+    chunks = load_chunks()
+    if not chunks:
+        print("No documents found.")
+        return
+
+    client = QdrantClient(url=QDRANT_URL)
+    if not client.collection_exists(KB_COLLECTION_NAME):
+        print(f"Collection '{KB_COLLECTION_NAME}' does not exist. Run scripts/init_qdrant.py first.")
+        return
+    existing = load_existing_ids(client)
+
+    # Points from older full re-ingests have random ids and are removed as stale
+    to_add = [point_id for point_id in chunks if point_id not in existing]
+    stale = sorted(existing - set(chunks))
+    unchanged = len(chunks) - len(to_add)
+
+    print(f"{len(chunks)} chunks: {unchanged} unchanged, {len(to_add)} to embed, {len(stale)} stale to delete.")
+    by_source = Counter(chunks[point_id].metadata["source"] for point_id in to_add)
+    for source, count in sorted(by_source.items()):
+        print(f"  {source}: {count} new or changed chunks")
+    if dry_run:
+        print("Dry run: no changes made.")
+        return
+
+    if to_add:
+        embeddings = get_embedding_service()
+        for start in range(0, len(to_add), BATCH_SIZE):
+            batch = to_add[start:start + BATCH_SIZE]
+            vectors = embeddings.embed_documents([chunks[point_id].page_content for point_id in batch])
+            # Same payload layout as langchain's Qdrant store, which RAGRetriever reads
+            client.upsert(
+                collection_name=KB_COLLECTION_NAME,
+                points=[
+                    PointStruct(
+                        id=point_id,
+                        vector=vector,
+                        payload={
+                            "page_content": chunks[point_id].page_content,
+                            "metadata": chunks[point_id].metadata
+                        }
+                    )
+                    for point_id, vector in zip(batch, vectors)
+                ]
+            )
+            print(f"Upserted {start + len(batch)}/{len(to_add)} chunks")
+
+    if stale:
+        client.delete(collection_name=KB_COLLECTION_NAME, points_selector=PointIdsList(points=stale))
+        print(f"Deleted {len(stale)} stale chunks.")
 
-    print(f"Ingesting into Qdrant collection '{KB_COLLECTION_NAME}'...")
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    
-    # Initialize VectorStore with existing collection
-    qdrant_store = Qdrant(
-        client=client,
-        collection_name=KB_COLLECTION_NAME,
-        embeddings=embeddings
-    )
-    
-    # Add documents
-    qdrant_store.add_documents(chunks)
-    
     print("KB ingestion complete.")
 
 if __name__ == "__main__":
-    ingest_kb()
+    parser = argparse.ArgumentParser(description="Incrementally sync kb/*.md into the kb_chunks collection")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+    ingest_kb(dry_run=args.dry_run)
@@ -5,8 +5,9 @@ import sys
 # Add parent directory to path to import config if needed
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from pipeline.db.migrate import migrate
+
 DB_PATH = os.path.join(os.path.dirname(__file__), '../data/app.db')
-SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '../pipeline/db/schema.sql')
 
 def init_db():
     print(f"Initializing database at {DB_PATH}...")
@@ -15,15 +16,13 @@ def init_db():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     
-    with open(SCHEMA_PATH, 'r') as f:
-        schema = f.read()
-        cursor.executescript(schema)
+    # Base schema plus any pending migrations
+    version = migrate(conn)
         
     conn.commit()
     conn.close()
-    print("Database initialized successfully.")
+    print(f"Database initialized successfully (schema version {version}).")
 
 if __name__ == "__main__":
     init_db()
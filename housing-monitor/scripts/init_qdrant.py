@@ -1,12 +1,12 @@
 import os
 import sys
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
 
 # Add parent directory to path to import collections config
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from pipeline.vector.collections import KB_COLLECTION_NAME, LEGISLATION_COLLECTION_NAME, VECTOR_SIZE, DISTANCE_METRIC
+from pipeline.vector.collections import (KB_COLLECTION_NAME, LEGISLATION_COLLECTION_NAME, KB_PROFILE,
+                                         LEGISLATION_PROFILE, LEGISLATION_PAYLOAD_INDEXES)
 
 from pipeline.config import QDRANT_URL
 
@@ -16,24 +16,27 @@ def init_qdrant():
     
     # Create KB collection
     if not client.collection_exists(KB_COLLECTION_NAME):
-        print(f"Creating collection: {KB_COLLECTION_NAME}")
-        client.create_collection(
-            collection_name=KB_COLLECTION_NAME,
-            vectors_config=VectorParams(size=VECTOR_SIZE, distance=DISTANCE_METRIC),
-        )
+        print(f"Creating collection: {KB_COLLECTION_NAME} (profile {KB_PROFILE.name})")
+        client.create_collection(collection_name=KB_COLLECTION_NAME, **KB_PROFILE.create_kwargs())
     else:
         print(f"Collection {KB_COLLECTION_NAME} already exists.")
 
     # Create Legislation collection
     if not client.collection_exists(LEGISLATION_COLLECTION_NAME):
-        print(f"Creating collection: {LEGISLATION_COLLECTION_NAME}")
-        client.create_collection(
-            collection_name=LEGISLATION_COLLECTION_NAME,
-            vectors_config=VectorParams(size=VECTOR_SIZE, distance=DISTANCE_METRIC),
-        )
+        print(f"Creating collection: {LEGISLATION_COLLECTION_NAME} (profile {LEGISLATION_PROFILE.name})")
+        client.create_collection(collection_name=LEGISLATION_COLLECTION_NAME, **LEGISLATION_PROFILE.create_kwargs())
     else:
         print(f"Collection {LEGISLATION_COLLECTION_NAME} already exists.")
-        
+
+    # Payload indexes for filtered dedupe/search (creating an existing index is a no-op)
+    for field_name, field_schema in LEGISLATION_PAYLOAD_INDEXES.items():
+        print(f"Ensuring payload index on {LEGISLATION_COLLECTION_NAME}.{field_name} ({field_schema.value})")
+        client.create_payload_index(
+            collection_name=LEGISLATION_COLLECTION_NAME,
+            field_name=field_name,
+            field_schema=field_schema,
+        )
+
     print("Qdrant initialized successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,32 @@
+import os
+import sys
+import argparse
+from qdrant_client import QdrantClient
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import QDRANT_URL
+from pipeline.vector.collections import (KB_COLLECTION_NAME, LEGISLATION_COLLECTION_NAME, COLLECTION_PROFILES,
+                                         LEGISLATION_PAYLOAD_INDEXES, get_profile)
+from pipeline.vector.migrate import rebuild_collection
+
+PAYLOAD_INDEXES = {
+    KB_COLLECTION_NAME: {},
+    LEGISLATION_COLLECTION_NAME: LEGISLATION_PAYLOAD_INDEXES,
+}
+
+def migrate_collection(collection: str, profile_name: str):
+    profile = get_profile(profile_name)
+    client = QdrantClient(url=QDRANT_URL)
+    print(f"Rebuilding '{collection}' with profile '{profile.name}': {profile}")
+    count = rebuild_collection(client, collection, profile, payload_indexes=PAYLOAD_INDEXES[collection])
+    print(f"Rebuilt '{collection}' with {count} points.")
+    env_var = "KB_COLLECTION_PROFILE" if collection == KB_COLLECTION_NAME else "LEGISLATION_COLLECTION_PROFILE"
+    print(f"Set {env_var}={profile.name} in .env so queries use the matching search params.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild a Qdrant collection under another storage profile")
+    parser.add_argument("collection", choices=list(PAYLOAD_INDEXES))
+    parser.add_argument("profile", choices=list(COLLECTION_PROFILES))
+    args = parser.parse_args()
+    migrate_collection(args.collection, args.profile)
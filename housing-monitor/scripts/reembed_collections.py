@@ -0,0 +1,76 @@
+import os
+import sys
+import argparse
+from typing import List
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct, Record
+
+# Add parent directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from pipeline.config import QDRANT_URL, EMBEDDING_DIM
+from pipeline.vector.collections import (KB_COLLECTION_NAME, LEGISLATION_COLLECTION_NAME, KB_PROFILE,
+                                         LEGISLATION_PROFILE, LEGISLATION_PAYLOAD_INDEXES)
+from pipeline.vector.embeddings import EmbeddingService, truncate_embedding
+from pipeline.vector.migrate import rebuild_collection
+from pipeline.persist import EMBED_MAX_CHARS
+import pipeline.db.crud as crud
+
+COLLECTIONS = {
+    KB_COLLECTION_NAME: (KB_PROFILE, {}),
+    LEGISLATION_COLLECTION_NAME: (LEGISLATION_PROFILE, LEGISLATION_PAYLOAD_INDEXES),
+}
+
+def make_transform(collection: str, current_dim: int, target_dim: int):
+    """
+    Shrinking only truncates the stored vectors (no API calls). Growing needs the full
+    vectors back, so the source text is re-embedded (cached full vectors are reused).
+    """
+    if target_dim <= current_dim:
+        def truncate(records: List[Record]) -> List[PointStruct]:
+            return [PointStruct(id=r.id, vector=truncate_embedding(r.vector, target_dim), payload=r.payload)
+                    for r in records]
+        return truncate
+
+    embeddings = EmbeddingService(dimensions=target_dim)
+
+    def reembed(records: List[Record]) -> List[PointStruct]:
+        if collection == KB_COLLECTION_NAME:
+            texts = [(r.payload or {}).get('page_content', '') for r in records]
+        else:
+            # Chunk points carry their text; older whole-document points are looked up in SQLite
+            contents = crud.get_item_contents([r.payload['item_id'] for r in records if not r.payload.get('text')])
+            texts = [r.payload.get('text') or (contents.get(r.payload['item_id']) or '')[:EMBED_MAX_CHARS]
+                     for r in records]
+        missing = [r.id for r, text in zip(records, texts) if not text]
+        if missing:
+            raise RuntimeError(f"No source text for points {missing} in '{collection}'")
+        vectors = embeddings.embed_documents(texts)
+        return [PointStruct(id=r.id, vector=v, payload=r.payload) for r, v in zip(records, vectors)]
+    return reembed
+
+def reembed(collections: List[str], target_dim: int):
+    client = QdrantClient(url=QDRANT_URL)
+    for collection in collections:
+        if not client.collection_exists(collection):
+            print(f"Collection '{collection}' does not exist, skipping.")
+            continue
+        current_dim = client.get_collection(collection).config.params.vectors.size
+        if current_dim == target_dim:
+            print(f"'{collection}' already has dimension {target_dim}.")
+            continue
+        profile, payload_indexes = COLLECTIONS[collection]
+        mode = "truncating" if target_dim < current_dim else "re-embedding"
+        print(f"Rebuilding '{collection}': {current_dim} -> {target_dim} dims ({mode}, profile {profile.name})")
+        count = rebuild_collection(client, collection, profile, vector_size=target_dim,
+                                   transform=make_transform(collection, current_dim, target_dim),
+                                   payload_indexes=payload_indexes)
+        print(f"Rebuilt '{collection}' with {count} points.")
+    if target_dim != EMBEDDING_DIM:
+        print(f"Set EMBEDDING_DIM={target_dim} in .env so queries and new items use the same size.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild Qdrant collections at another embedding dimension")
+    parser.add_argument("--dim", type=int, default=EMBEDDING_DIM, help="Target dimension (default: EMBEDDING_DIM)")
+    parser.add_argument("--collections", nargs="+", choices=list(COLLECTIONS), default=list(COLLECTIONS))
+    args = parser.parse_args()
+    reembed(args.collections, args.dim)